@@ -0,0 +1,299 @@
+""" Benchmarks Eve requests served by the data layer against the ArangoDB
+stand-in, reporting throughput, latency percentiles, memory allocated and
+requests sent to the stand-in per request for each scenario::
+
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json
+
+With ``--compare``, the run fails if a scenario's throughput dropped, or
+its p99 latency, allocations or queries grew, by more than
+``--tolerance``. ``--metrics`` limits the comparison to some of them.
+Timings are only comparable on the machine that recorded them, and noisy
+even there, so CI benchmarks the parent commit and then the head in one
+job and only fails on allocations and queries.
+"""
+import argparse
+import gc
+import itertools
+import json
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from eve import Eve
+
+from eve_arango.arangodb import ArangoDB
+from benchmarks.stand_in import StandIn, serve
+
+
+RESOURCE = 'people'
+PAGE_SIZE = 25
+BULK_SIZE = 100
+# Metrics compared against baselines, and whether larger is better
+METRICS = OrderedDict([
+    ('throughput', True), ('p99_ms', False), ('alloc_kib', False),
+    ('queries', False),
+])
+
+
+def settings(url):
+    return {
+        'ARANGO_HOSTS': [url],
+        'ARANGO_DB': 'benchmarks',
+        'ARANGO_PROVISION': 'none',
+        'ID_FIELD': '_key',
+        'ITEM_LOOKUP_FIELD': '_key',
+        'ITEM_URL': 'regex("[\\w\\d\\-:.@()+,=;$!*\'%]+")',
+        'RESOURCE_METHODS': ['GET', 'POST'],
+        'ITEM_METHODS': ['GET', 'PATCH'],
+        'IF_MATCH': False,
+        'PAGINATION_LIMIT': PAGE_SIZE,
+        'DOMAIN': {RESOURCE: {'schema': {
+            'name': {'type': 'string'},
+            'age': {'type': 'integer'},
+            'born': {'type': 'datetime'},
+            'tags': {'type': 'list', 'schema': {'type': 'string'}},
+            'career': {'type': 'dict', 'schema': {
+                'start': {'type': 'datetime'},
+                'labels': {'type': 'list', 'schema': {'type': 'string'}},
+            }},
+        }}},
+    }
+
+
+def person(i):
+    born = datetime(1920, 1, 1) + timedelta(days=i % 20000)
+    return {
+        'name': 'Person %i' % i,
+        'age': i % 90,
+        'born': born.strftime('%a, %d %b %Y %H:%M:%S GMT'),
+        'tags': ['bebop', 'cool', 'modal'][:i % 3 + 1],
+        'career': {
+            'start': born.replace(year=born.year + 20).strftime(
+                '%a, %d %b %Y %H:%M:%S GMT'
+            ),
+            'labels': ['Blue Note', 'Columbia'],
+        },
+    }
+
+
+class Bench:
+    """ An Eve app on the data layer, connected to a stand-in holding
+    ``documents`` people.
+    """
+
+    def __init__(self, documents=10000, latency=0.0, document_latency=0.0,
+                 batch_size=None):
+        self.stand_in = StandIn(latency, document_latency, batch_size)
+        self.keys = [
+            meta['_key'] for meta in self.stand_in.load(
+                RESOURCE, (person(i) for i in range(documents))
+            )
+        ]
+        self.server = serve(self.stand_in)
+        self.app = Eve(settings=settings(self.server.url), data=ArangoDB)
+        self.client = self.app.test_client()
+        self._keys = itertools.cycle(self.keys)
+        self._bulk = itertools.count(documents)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def request(self, method, url, body=None):
+        response = self.client.open(
+            url, method=method, data=json.dumps(body) if body else None,
+            content_type='application/json'
+        )
+        if response.status_code >= 300:
+            raise RuntimeError('%s %s: %s %s' % (
+                method, url, response.status_code, response.get_data(True)
+            ))
+        return response
+
+    def list_page(self):
+        self.request('GET', '/%s?max_results=%i' % (RESOURCE, PAGE_SIZE))
+
+    def deep_pagination(self):
+        last = max(1, len(self.keys) // PAGE_SIZE)
+        self.request('GET', '/%s?max_results=%i&page=%i' % (
+            RESOURCE, PAGE_SIZE, last
+        ))
+
+    def item_get(self):
+        self.request('GET', '/%s/%s' % (RESOURCE, next(self._keys)))
+
+    def bulk_post(self):
+        self.request('POST', '/' + RESOURCE, [
+            person(next(self._bulk)) for _ in range(BULK_SIZE)
+        ])
+
+    def patch(self):
+        self.request('PATCH', '/%s/%s' % (RESOURCE, next(self._keys)), {
+            'age': next(self._bulk) % 90
+        })
+
+
+SCENARIOS = ['list_page', 'deep_pagination', 'item_get', 'bulk_post', 'patch']
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_scenario(bench, scenario, requests, warmup=10, allocations=50):
+    """ Runs ``requests`` requests of a scenario after ``warmup`` ones,
+    then measures the memory allocated by ``allocations`` more. Returns
+    the scenario's metrics.
+    """
+    step = getattr(bench, scenario)
+    for _ in range(warmup):
+        step()
+    latencies = []
+    queries = bench.stand_in.requests
+    start = time.perf_counter()
+    for _ in range(requests):
+        begin = time.perf_counter()
+        step()
+        latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+    queries = bench.stand_in.requests - queries
+
+    # The peak of traced memory during a request, from a separate pass as
+    # tracing slows everything down
+    peaks = []
+    if allocations:
+        tracemalloc.start()
+        try:
+            for _ in range(allocations):
+                tracemalloc.clear_traces()
+                step()
+                peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return OrderedDict([
+        ('requests', requests),
+        ('throughput', round(requests / elapsed, 1)),
+        ('p50_ms', round(percentile(latencies, 0.5) * 1000, 3)),
+        ('p99_ms', round(percentile(latencies, 0.99) * 1000, 3)),
+        ('alloc_kib', round(percentile(peaks, 0.5) / 1024, 1)
+         if peaks else None),
+        ('queries', round(queries / requests, 2)),
+    ])
+
+
+def compare(results, baseline, tolerance, metrics=None):
+    """ Returns the regressions of ``results`` against ``baseline``, as
+    messages. Only ``metrics`` are compared, by default all of ``METRICS``.
+    """
+    regressions = []
+    for scenario, values in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        for metric, larger_is_better in METRICS.items():
+            if metrics is not None and metric not in metrics:
+                continue
+            value, expected = values.get(metric), base.get(metric)
+            if value is None or not expected:
+                continue
+            change = (value - expected) / expected
+            if larger_is_better:
+                change = -change
+            if change > tolerance:
+                regressions.append('%s %s: %s, baseline %s (%+.0f%%)' % (
+                    scenario, metric, value, expected,
+                    (value - expected) / expected * 100
+                ))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.run',
+        description='Benchmark the data layer against the ArangoDB stand-in.'
+    )
+    parser.add_argument(
+        'scenarios', nargs='*', metavar='scenario',
+        help='%s (default: all)' % ', '.join(SCENARIOS)
+    )
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--documents', type=int, default=10000)
+    parser.add_argument(
+        '--latency', type=float, default=0.0,
+        help='seconds the stand-in adds to every request'
+    )
+    parser.add_argument(
+        '--document-latency', type=float, default=0.0,
+        help='seconds the stand-in adds per document read'
+    )
+    parser.add_argument(
+        '--batch-size', type=int,
+        help='largest cursor batch the stand-in returns'
+    )
+    parser.add_argument(
+        '--allocations', type=int, default=50,
+        help='requests traced to measure allocations, 0 to skip'
+    )
+    parser.add_argument('--save', metavar='FILE', help='write a baseline')
+    parser.add_argument(
+        '--compare', metavar='FILE', help='fail on regressions from FILE'
+    )
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument(
+        '--metrics', type=lambda value: value.split(','),
+        help='comma separated metrics to compare, %s (default: all)' %
+        ', '.join(METRICS)
+    )
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios).difference(SCENARIOS)
+    if unknown:
+        parser.error('unknown scenario: %s' % ', '.join(sorted(unknown)))
+    unknown = set(args.metrics or ()).difference(METRICS)
+    if unknown:
+        parser.error('unknown metric: %s' % ', '.join(sorted(unknown)))
+
+    results = OrderedDict()
+    for scenario in args.scenarios or SCENARIOS:
+        # A fresh stand-in for each scenario, so the documents written by
+        # one don't slow down the next
+        bench = Bench(
+            args.documents, args.latency, args.document_latency,
+            args.batch_size
+        )
+        try:
+            gc.collect()
+            results[scenario] = metrics = run_scenario(
+                bench, scenario, args.requests, allocations=args.allocations
+            )
+        finally:
+            bench.close()
+        print('%-16s %9.1f req/s  p50 %8.3f ms  p99 %8.3f ms  %5.2f q %s' % (
+            scenario, metrics['throughput'], metrics['p50_ms'],
+            metrics['p99_ms'], metrics['queries'],
+            '%8.1f KiB' % metrics['alloc_kib']
+            if metrics['alloc_kib'] is not None else ''
+        ))
+
+    if args.save:
+        with open(args.save, 'w') as fp:
+            json.dump(results, fp, indent=2)
+            fp.write('\n')
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        regressions = compare(
+            results, baseline, args.tolerance, args.metrics
+        )
+        for regression in regressions:
+            print('REGRESSION ' + regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
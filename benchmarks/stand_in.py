@@ -0,0 +1,416 @@
+""" An in-process HTTP server answering the ArangoDB endpoints used by the
+data layer from memory, so benchmarks run without a database.
+
+It is not an AQL engine. Queries over ``@@collection`` return the
+collection's documents filtered by the equality lookups (``@lookup_key_<n>``
+and ``@lookup_val_<n>``) and ``@keys``, sliced by ``@skip`` and ``@limit``
+and projected by ``@fields``. ``where`` filters, sorts and keyset
+conditions are ignored, so results have the shape of real ones without
+their contents. Counting and ``REMOVE`` queries are recognised by their
+text.
+
+Writes are recorded in a write-ahead log, which is tailed like ArangoDB's.
+"""
+import itertools
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from urllib.parse import parse_qs, unquote, urlsplit
+
+
+PATH_RE = re.compile(r'^(?:/_db/[^/]+)?(/_api/.*)$')
+SYSTEM_ATTRIBUTES = ['_id', '_key', '_rev', '_from', '_to']
+
+# Write-ahead log markers
+TRUNCATE_COLLECTION = 2004
+WRITE_DOCUMENT = 2300
+REMOVE_DOCUMENT = 2302
+
+
+class StandInError(Exception):
+
+    def __init__(self, status, error_num, message):
+        super().__init__(message)
+        self.status = status
+        self.error_num = error_num
+
+
+class Dump:
+    """ A response body of JSON lines, with headers. """
+
+    def __init__(self, lines, headers):
+        self.lines = lines
+        self.headers = headers
+
+
+class StandIn:
+    """ The state of the stand-in: collections of documents, open cursors
+    and the write-ahead log.
+
+    :param latency: seconds added to every request.
+    :param document_latency: seconds added per document a query reads,
+                             skipped documents included.
+    :param batch_size: the largest cursor batch returned, whatever the
+                       client asks for.
+    """
+
+    def __init__(self, latency=0.0, document_latency=0.0, batch_size=None):
+        self.latency = latency
+        self.document_latency = document_latency
+        self.batch_size = batch_size
+        self.collections = {}
+        self.cursors = {}
+        self.requests = 0
+        # Log entries, after those up to ``first_tick`` were dropped
+        self.log = []
+        self.first_tick = 0
+        self._ids = itertools.count(1)
+        self._ticks = itertools.count(1)
+        self._lock = Lock()
+
+    def collection(self, name):
+        with self._lock:
+            return self.collections.setdefault(name, {})
+
+    def load(self, name, documents):
+        """ Adds documents to a collection, returning their metadata. """
+        collection = self.collection(name)
+        results = []
+        with self._lock:
+            for document in documents:
+                document = dict(document)
+                key = str(document.get('_key') or next(self._ids))
+                document['_key'] = key
+                document['_id'] = '%s/%s' % (name, key)
+                document['_rev'] = '_%x' % next(self._ids)
+                collection[key] = document
+                results.append(_meta(document))
+                self._log(WRITE_DOCUMENT, name, document)
+        return results
+
+    def _log(self, kind, name, data=None):
+        """ Records a write, with the lock held. """
+        self.log.append({
+            'tick': str(next(self._ticks)), 'type': kind, 'cname': name,
+            'tid': '0', 'data': data or {},
+        })
+
+    def forget_log(self):
+        """ Drops the log, as if it was collected before being read. """
+        with self._lock:
+            if self.log:
+                self.first_tick = int(self.log[-1]['tick'])
+            self.log = []
+
+    def _sleep(self, documents=0):
+        delay = self.latency + self.document_latency * documents
+        if delay:
+            time.sleep(delay)
+
+    def handle(self, method, path, params, body):
+        """ Answers a request, returning the status and body. """
+        with self._lock:
+            self.requests += 1
+        self._sleep()
+        parts = [unquote(part) for part in path.strip('/').split('/')][1:]
+        route = (method, parts[0] if parts else '')
+        if route == ('POST', 'cursor'):
+            return 201, self._query(body)
+        if route == ('PUT', 'cursor'):
+            return 200, self._next_batch(parts[1])
+        if route == ('DELETE', 'cursor'):
+            with self._lock:
+                if self.cursors.pop(parts[1], None) is None:
+                    raise StandInError(404, 1600, 'cursor not found')
+            return 202, {'id': parts[1]}
+        if route == ('POST', 'explain'):
+            return 200, {'plan': {
+                'nodes': [{'type': 'SingletonNode'}, {'type': 'ReturnNode'}],
+                'estimatedCost': 1
+            }}
+        if route[1] == 'document':
+            return self._document(method, parts[1:], params, body)
+        if route == ('POST', 'import'):
+            created = self.load(params['collection'], body)
+            return 201, {
+                'created': len(created), 'errors': 0, 'empty': 0,
+                'updated': 0, 'ignored': 0, 'details': []
+            }
+        if route == ('PUT', 'simple') and parts[1:] == ['lookup-by-keys']:
+            collection = self.collection(body['collection'])
+            return 200, {'documents': [
+                collection[str(key)] for key in body['keys']
+                if str(key) in collection
+            ]}
+        if route[1] == 'collection' and len(parts) == 3:
+            collection = self.collection(parts[1])
+            if parts[2] == 'count':
+                return 200, {'name': parts[1], 'count': len(collection)}
+            if parts[2] == 'truncate' and method == 'PUT':
+                with self._lock:
+                    collection.clear()
+                    self._log(TRUNCATE_COLLECTION, parts[1])
+                return 200, {'name': parts[1]}
+        if route == ('GET', 'wal') and parts[1:] == ['lastTick']:
+            with self._lock:
+                tick = self.log[-1]['tick'] if self.log else str(
+                    self.first_tick
+                )
+            return 200, {'tick': tick}
+        if route == ('GET', 'wal') and parts[1:] == ['tail']:
+            return self._tail(params)
+        raise StandInError(404, 404, 'unknown path %s' % path)
+
+    def _document(self, method, parts, params, body):
+        collection = self.collection(parts[0])
+        if method == 'POST':
+            results = self.load(parts[0], body if isinstance(
+                body, list) else [body])
+            return 202, results if isinstance(body, list) else results[0]
+        document = collection.get(parts[1]) if len(parts) > 1 else None
+        if document is None:
+            raise StandInError(404, 1202, 'document not found')
+        if method == 'GET':
+            return 200, document
+        if method == 'DELETE':
+            with self._lock:
+                collection.pop(parts[1], None)
+                self._log(REMOVE_DOCUMENT, parts[0], _meta(document))
+            return 202, _meta(document)
+        if params.get('ignoreRevs') == 'false' and \
+                body.get('_rev') not in (None, document['_rev']):
+            raise StandInError(412, 1200, 'conflict')
+        if method == 'PATCH':
+            updated = dict(document, **body)
+        else:
+            updated = dict(body)
+        updated.update((field, document[field]) for field in ('_key', '_id'))
+        updated['_rev'] = '_%x' % next(self._ids)
+        with self._lock:
+            collection[parts[1]] = updated
+            self._log(WRITE_DOCUMENT, parts[0], updated)
+        meta = _meta(updated)
+        meta['_oldRev'] = document['_rev']
+        return 202, meta
+
+    def _query(self, body):
+        query = body['query']
+        bind_vars = body.get('bindVars') or {}
+        options = body.get('options') or {}
+        if '@collection' not in bind_vars:
+            result, stats = [], {}
+        else:
+            result, stats = self._evaluate(query, bind_vars)
+        cursor = {
+            'result': result, 'stats': stats,
+            'count': len(result) if body.get('count') else None,
+            'full_count': options.get('fullCount'),
+            'batch_size': body.get('batchSize') or 1000,
+        }
+        return self._batch(cursor, None)
+
+    def _evaluate(self, query, bind_vars):
+        name = bind_vars['@collection']
+        collection = self.collection(name)
+        keys = bind_vars.get('keys')
+        lookups = []
+        for i in itertools.count():
+            if 'lookup_key_%i' % i not in bind_vars:
+                break
+            lookups.append((
+                bind_vars['lookup_key_%i' % i],
+                bind_vars['lookup_val_%i' % i]
+            ))
+        # Like the primary index, keys are looked up rather than scanned for
+        for path, value in lookups:
+            if path == '_key':
+                keys = [value] if keys is None or value in keys else []
+        if keys is not None:
+            documents = [
+                collection[str(key)] for key in keys
+                if str(key) in collection
+            ]
+        elif lookups:
+            documents = list(collection.values())
+        else:
+            documents = None
+        if lookups:
+            documents = [
+                doc for doc in documents
+                if all(_get(doc, path) == value for path, value in lookups)
+            ]
+        if 'REMOVE doc' in query:
+            documents = list(collection.values()) if documents is None \
+                else documents
+            documents = documents[:bind_vars.get('chunk_size')]
+            with self._lock:
+                for document in documents:
+                    collection.pop(document['_key'], None)
+                    self._log(REMOVE_DOCUMENT, name, _meta(document))
+            return [], {'writesExecuted': len(documents)}
+        total = len(collection) if documents is None else len(documents)
+        if 'COLLECT WITH COUNT' in query:
+            return [total], {}
+        skip = bind_vars.get('skip') or 0
+        limit = bind_vars.get('limit')
+        end = None if limit is None else skip + limit
+        if documents is None:
+            # Sliced without copying the collection, the stand-in shares the
+            # interpreter with the code measured
+            documents = list(itertools.islice(
+                collection.values(), skip, end
+            ))
+        else:
+            documents = documents[skip:end]
+        fields = bind_vars.get('fields')
+        if fields is not None and 'KEEP' in query:
+            keep = set(fields).union(SYSTEM_ATTRIBUTES)
+            documents = [
+                {field: value for field, value in doc.items()
+                 if field in keep}
+                for doc in documents
+            ]
+        read = min(total, skip + len(documents))
+        self._sleep(read)
+        return documents, {
+            'fullCount': total, 'scannedFull': read, 'filtered': 0,
+            'executionTime': 0.0
+        }
+
+    def _tail(self, params):
+        start = int(params.get('from') or 0)
+        size = int(params.get('chunkSize') or 1 << 20)
+        with self._lock:
+            present = start >= self.first_tick
+            entries = [
+                entry for entry in self.log if int(entry['tick']) > start
+            ]
+        lines, length = [], 0
+        for entry in entries:
+            if lines and length >= size:
+                break
+            lines.append(json.dumps(entry))
+            length += len(lines[-1]) + 1
+        last = entries[len(lines) - 1]['tick'] if lines else '0'
+        return 200 if lines else 204, Dump(lines, {
+            'x-arango-replication-lastincluded': last,
+            'x-arango-replication-lastscanned': last,
+            'x-arango-replication-checkmore': str(
+                len(lines) < len(entries)
+            ).lower(),
+            'x-arango-replication-frompresent': str(present).lower(),
+        })
+
+    def _next_batch(self, cursor_id):
+        with self._lock:
+            cursor = self.cursors.get(cursor_id)
+        if cursor is None:
+            raise StandInError(404, 1600, 'cursor not found')
+        return self._batch(cursor, cursor_id)
+
+    def _batch(self, cursor, cursor_id):
+        size = cursor['batch_size']
+        if self.batch_size:
+            size = min(size, self.batch_size)
+        batch = cursor['result'][:size]
+        cursor['result'] = cursor['result'][size:]
+        body = {
+            'result': batch, 'hasMore': bool(cursor['result']),
+            'cached': False, 'error': False,
+        }
+        if cursor['count'] is not None:
+            body['count'] = cursor['count']
+        if cursor_id is None:
+            stats = dict(cursor['stats'])
+            if not cursor['full_count']:
+                stats.pop('fullCount', None)
+            body['extra'] = {'stats': stats, 'warnings': []}
+        with self._lock:
+            if body['hasMore']:
+                cursor_id = cursor_id or str(next(self._ids))
+                self.cursors[cursor_id] = cursor
+            elif cursor_id is not None:
+                self.cursors.pop(cursor_id, None)
+        if cursor_id is not None:
+            body['id'] = cursor_id
+        return body
+
+
+def _meta(document):
+    return {field: document[field] for field in ('_id', '_key', '_rev')}
+
+
+def _get(document, path):
+    if isinstance(path, str):
+        path = path.split('.')
+    for name in path:
+        if not isinstance(document, dict):
+            return None
+        document = document.get(name)
+    return document
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are sent together, and without waiting for acks
+    wbufsize = 1 << 16
+    disable_nagle_algorithm = True
+
+    def _respond(self):
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        params = {
+            name: values[-1] for name, values in parse_qs(url.query).items()
+        }
+        match = PATH_RE.match(url.path)
+        try:
+            if not match:
+                raise StandInError(404, 404, 'unknown path %s' % url.path)
+            status, result = self.server.stand_in.handle(
+                self.command, match.group(1), params, body
+            )
+        except StandInError as e:
+            status, result = e.status, {
+                'error': True, 'code': e.status, 'errorNum': e.error_num,
+                'errorMessage': str(e)
+            }
+        headers = {'Content-Type': 'application/json; charset=utf-8'}
+        if isinstance(result, Dump):
+            headers = dict(result.headers)
+            headers['Content-Type'] = 'application/x-arango-dump'
+            data = ''.join(line + '\n' for line in result.lines)
+        else:
+            data = json.dumps(result)
+        data = data.encode('utf-8')
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+def serve(stand_in, host='127.0.0.1', port=0):
+    """ Serves a stand-in from a background thread. Returns the server,
+    whose ``url`` is the endpoint to connect to; ``shutdown`` stops it.
+    """
+    server = _Server((host, port), _Handler)
+    server.stand_in = stand_in
+    server.url = 'http://%s:%i' % server.server_address[:2]
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
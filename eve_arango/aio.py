@@ -0,0 +1,514 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import OrderedDict, deque
+from threading import Lock, Thread, current_thread
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+from eve_arango.arangodb import ArangoDB, keep, keep_fields, to_python
+from eve_arango.http import (
+    CURSOR_RE, IDEMPOTENT_METHODS, MAX_PINNED_CURSORS
+)
+from eve_arango.metrics import instrumented
+
+
+# The names python-arango gives to cursor statistics, which the
+# instrumentation reads
+STATISTICS = {
+    'writesExecuted': 'modified',
+    'writesIgnored': 'ignored',
+    'scannedFull': 'scanned_full',
+    'scannedIndex': 'scanned_index',
+    'executionTime': 'execution_time',
+    'httpRequests': 'http_requests',
+}
+
+
+def statistics(data):
+    """ Returns the statistics of a cursor response as python-arango's
+    cursors report them, or None if it has none.
+    """
+    stats = data.get('extra', {}).get('stats')
+    if stats is None:
+        return None
+    return {STATISTICS.get(name, name): value for name, value in stats.items()}
+
+
+class AsyncArangoError(Exception):
+    """ An error response from ArangoDB to the async client. """
+
+    def __init__(self, message, error_code=None, http_code=None):
+        super().__init__(message)
+        self.error_code = error_code
+        self.http_code = http_code
+
+
+class AsyncHTTPClient:
+    """ An asyncio client for the parts of the ArangoDB HTTP API used by
+    ``AsyncArangoDB``. Keeps a pool of keep-alive connections, spreads
+    requests over the endpoints in turn and sends follow-up requests for a
+    cursor to the coordinator that created it, like ``PooledHTTPClient``.
+
+    The session is created on first use, on the event loop the client is
+    used from.
+
+    :param endpoints: base URLs of the coordinators.
+    :param db_name: the database queried.
+    :param username: user to authenticate as.
+    :param password: password of the user.
+    :param pool_size: connections kept open per endpoint.
+    :param timeout: seconds to wait for a response. None waits forever.
+    :param keep_alive: reuse connections between requests.
+    """
+
+    def __init__(self, endpoints, db_name, username='root', password='',
+                 pool_size=10, timeout=None, keep_alive=True):
+        self.endpoints = [endpoint.rstrip('/') for endpoint in endpoints]
+        self.db_name = db_name
+        self.auth = (username, password)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._session = None
+        self._session_loop = None
+        self._next = itertools.cycle(range(len(self.endpoints)))
+        self._cursors = OrderedDict()
+
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit_per_host=self.pool_size,
+                    force_close=not self.keep_alive
+                ),
+                auth=aiohttp.BasicAuth(*self.auth),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+            self._session_loop = loop
+        return self._session
+
+    async def request(self, method, path, data=None):
+        """ Sends a request to the database API and returns the decoded
+        body, raising ``AsyncArangoError`` for error responses.
+        """
+        path = '/_db/%s%s' % (self.db_name, path)
+        cursor = CURSOR_RE.search(path)
+        pinned = self._cursors.get(cursor.group(1)) if cursor else None
+        first = pinned if pinned is not None else next(self._next)
+        attempts = [first] if pinned is not None else [
+            (first + i) % len(self.endpoints)
+            for i in range(len(self.endpoints))
+        ]
+        session = self._get_session()
+        for attempt, index in enumerate(attempts, 1):
+            try:
+                response = await session.request(
+                    method, self.endpoints[index] + path, json=data
+                )
+                body = await response.json(content_type=None)
+                break
+            except aiohttp.ClientConnectionError as e:
+                # Writes are only sent again if they never left
+                if attempt == len(attempts) or not (
+                        isinstance(e, aiohttp.ClientConnectorError) or
+                        method.upper() in IDEMPOTENT_METHODS):
+                    raise
+
+        if response.status >= 400 or body.get('error'):
+            raise AsyncArangoError(
+                body.get('errorMessage', response.reason),
+                error_code=body.get('errorNum'),
+                http_code=response.status
+            )
+        self._track_cursor(method, path, cursor, index, body)
+        return body
+
+    def _track_cursor(self, method, path, cursor, index, body):
+        if cursor:
+            if method == 'DELETE' or not body.get('hasMore'):
+                self._cursors.pop(cursor.group(1), None)
+        elif path.endswith('/_api/cursor') and body.get('hasMore'):
+            self._cursors[body['id']] = index
+            while len(self._cursors) > MAX_PINNED_CURSORS:
+                self._cursors.popitem(last=False)
+
+    async def query(self, query, bind_vars=None, full_count=False,
+                    batch_size=None, ttl=None):
+        """ Runs an AQL query and returns its first batch. """
+        data = {'query': query, 'bindVars': bind_vars or {}}
+        if batch_size is not None:
+            data['batchSize'] = batch_size
+        if ttl is not None:
+            data['ttl'] = ttl
+        if full_count:
+            data['options'] = {'fullCount': True}
+        return await self.request('POST', '/_api/cursor', data)
+
+    async def fetch(self, cursor_id):
+        """ Returns the next batch of a cursor. """
+        return await self.request('PUT', '/_api/cursor/%s' % cursor_id)
+
+    async def close_cursor(self, cursor_id):
+        try:
+            await self.request('DELETE', '/_api/cursor/%s' % cursor_id)
+        except AsyncArangoError as e:
+            # The cursor may have expired already
+            if e.http_code != 404:
+                raise
+
+    async def collection_count(self, name):
+        body = await self.request('GET', '/_api/collection/%s/count' % name)
+        return body['count']
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class EventLoopThread:
+    """ An asyncio event loop running in a daemon thread, so synchronous
+    code can wait on coroutines. The loop is started on first use, and
+    again in a process forked after that.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._pid = None
+        self._lock = Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._thread = Thread(
+                    target=self._loop.run_forever, name='eve-arango-loop',
+                    daemon=True
+                )
+                self._thread.start()
+                self._pid = os.getpid()
+            return self._loop
+
+    def run(self, awaitable, timeout=None):
+        """ Runs ``awaitable`` on the loop and returns its result. """
+        if current_thread() is self._thread:
+            raise RuntimeError('Cannot wait for the loop from the loop thread')
+        return asyncio.run_coroutine_threadsafe(
+            _wait(awaitable), self.loop
+        ).result(timeout)
+
+    def stop(self):
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._thread.join()
+            self._loop = self._thread = self._pid = None
+
+
+async def _wait(awaitable):
+    return await awaitable
+
+
+async def _gather(awaitables):
+    return await asyncio.gather(*awaitables)
+
+
+class AsyncCursor:
+    """ A cursor read by ``AsyncHTTPClient``, with the interface
+    ``ArangoResult`` uses. Further batches are fetched through ``run``.
+    """
+
+    def __init__(self, client, run, data):
+        self._client = client
+        self._run = run
+        self._batch = deque()
+        self._id = data.get('id')
+        self._statistics = statistics(data)
+        self._update(data)
+
+    def _update(self, data):
+        self._batch.extend(data.get('result', []))
+        self._has_more = data.get('hasMore', False)
+
+    def empty(self):
+        return not self._batch
+
+    def pop(self):
+        return self._batch.popleft()
+
+    def has_more(self):
+        return self._has_more
+
+    def fetch(self):
+        self._update(self._run(self._client.fetch(self._id)))
+
+    def close(self, ignore_missing=False):
+        if self._id and self._has_more:
+            self._run(self._client.close_cursor(self._id))
+            self._has_more = False
+
+    def statistics(self):
+        return self._statistics
+
+
+class AsyncArangoDB(ArangoDB):
+    """ An ``ArangoDB`` data layer sending its reads through an asyncio
+    HTTP client, on an event loop running in a background thread.
+
+    Queries are built like in ``ArangoDB``. Eve calls the usual synchronous
+    methods, which wait for the loop. The ``afind``, ``afind_one`` and
+    ``afind_list_of_ids`` variants build their query in the caller's app
+    context and return awaitables, which ``gather`` runs concurrently::
+
+        people, works = app.data.gather(
+            app.data.afind_one('people', None, _key=key),
+            app.data.afind('works', req, None),
+        )
+
+    ``find`` counts the matching documents with a separate query sent
+    alongside the page. Writes use the inherited synchronous methods.
+    """
+
+    def init_app(self, app):
+        if aiohttp is None:
+            raise ImportError(
+                'AsyncArangoDB requires aiohttp, install eve-arango[async]'
+            )
+        super().init_app(app)
+        self.client = AsyncHTTPClient(
+            self.endpoints, self.db.name,
+            pool_size=app.config.get('ARANGO_POOL_SIZE', 10),
+            timeout=app.config.get('ARANGO_TIMEOUT'),
+            keep_alive=app.config.get('ARANGO_KEEP_ALIVE', True)
+        )
+        self.loop = EventLoopThread()
+
+    def run(self, awaitable, timeout=None):
+        """ Runs an awaitable on the data layer's loop and returns its
+        result.
+        """
+        return self.loop.run(awaitable, timeout)
+
+    def gather(self, *awaitables):
+        """ Runs awaitables concurrently and returns their results. """
+        return self.run(_gather(awaitables))
+
+    @instrumented
+    def find(self, resource, req, sub_resource_lookup, perform_count=True):
+        references = self._references(req, sub_resource_lookup)
+        if references is not None:
+            # Mostly answered from the documents read along with the page
+            return self._find_references(resource, *references)
+        return self._with_count(
+            self.run(self.afind(resource, req, sub_resource_lookup,
+                                perform_count)),
+            perform_count
+        )
+
+    def afind(self, resource, req, sub_resource_lookup, perform_count=True):
+        """ Returns an awaitable of the result of ``find``. """
+        return self._afind(
+            self._find_query(resource, req, sub_resource_lookup,
+                             perform_count),
+            self.instrumentation.current()
+        )
+
+    async def _aexecute(self, context, query, bind_vars=None, **options):
+        """ Runs an AQL query like ``_execute``, returning its first batch.
+        The query is recorded for the ``(method, resource)`` of ``context``,
+        as the loop's thread runs none.
+        """
+        start = time.perf_counter()
+        data = await self.client.query(query, bind_vars, **options)
+        self.instrumentation.query(
+            query, bind_vars, time.perf_counter() - start, statistics(data),
+            lambda: self._explain(query, bind_vars), *context
+        )
+        return data
+
+    async def _afind(self, find, context):
+        # The page and the count are requested at the same time, a count
+        # query can also use indexes the page query cannot.
+        requests = [self._aexecute(
+            context, find.query, find.bind_vars,
+            batch_size=self.batch_size, ttl=self.cursor_ttl
+        )]
+        if find.full_count:
+            count_query, count_vars = self._count_query(find)
+            requests.append(
+                self._aexecute(context, count_query, count_vars)
+            )
+        elif callable(find.count):
+            requests.append(self.client.collection_count(find.collection))
+        data, *counted = await asyncio.gather(*requests)
+        count = None
+        if counted:
+            count = counted[0]
+            if isinstance(count, dict):
+                count = count['result'][0]
+        cursor = AsyncCursor(self.client, self.run, data)
+        return self._find_result(find, cursor, count)
+
+    @instrumented
+    def find_one(self, resource, req, check_auth_value=True,
+                 force_auth_field_projection=False, **lookup):
+        return self.run(self.afind_one(
+            resource, req, check_auth_value, force_auth_field_projection,
+            **lookup
+        ))
+
+    def afind_one(self, resource, req, check_auth_value=True,
+                  force_auth_field_projection=False, **lookup):
+        """ Returns an awaitable of the result of ``find_one``. """
+        client_projection = self._client_projection(req)
+        collection, _, projection, _ = self._datasource_ex(
+            resource, client_projection=client_projection,
+            check_auth_value=check_auth_value,
+            force_auth_field_projection=force_auth_field_projection
+        )
+        self._collection(collection)
+        fields = keep_fields(projection)
+        plan = self._date_plan(resource)
+        context = self.instrumentation.current()
+        cache = self._document_cache(resource, lookup)
+        if cache is not None:
+            return self._afind_one_cached(
+                context, cache, collection, lookup, fields, plan
+            )
+        query, bind_vars = self._lookup_query(collection, lookup, fields)
+        revision_fields = self._revision_fields(resource, req)
+        if revision_fields:
+            return self._afind_one_conditional(
+                context, req,
+                self._lookup_query(collection, lookup, revision_fields),
+                query, bind_vars, plan
+            )
+        return self._afind_one(context, query, bind_vars, plan)
+
+    async def _afind_one(self, context, query, bind_vars, plan):
+        data = await self._aexecute(context, query, bind_vars)
+        if not data['result']:
+            return None
+        return to_python(data['result'][0], plan)
+
+    async def _afind_one_conditional(self, context, req, revision_query,
+                                     query, bind_vars, plan):
+        data = await self._aexecute(context, *revision_query)
+        if not data['result']:
+            return None
+        document = data['result'][0]
+        if self._unchanged(req, document, plan):
+            return document
+        return await self._afind_one(context, query, bind_vars, plan)
+
+    async def _afind_one_cached(self, context, cache, collection, lookup,
+                                fields, plan):
+        key = str(lookup['_key'])
+        document = cache.get(key)
+        if document is not None and cache.validate:
+            query, bind_vars = self._lookup_query(
+                collection, {'_key': key}, ['_rev']
+            )
+            data = await self._aexecute(context, query, bind_vars)
+            if not data['result']:
+                cache.pop(key)
+                return None
+            if data['result'][0]['_rev'] != document['_rev']:
+                cache.pop(key)
+                document = None
+        if document is None:
+            generation = cache.generation
+            query, bind_vars = self._lookup_query(collection, {'_key': key})
+            data = await self._aexecute(context, query, bind_vars)
+            if not data['result']:
+                return None
+            document = data['result'][0]
+            cache.add(key, document, generation)
+        for field, value in lookup.items():
+            if document.get(field) != value:
+                return None
+        return to_python(keep(document, fields), plan)
+
+    @instrumented
+    def find_list_of_ids(self, resource, ids, client_projection=None):
+        return self.run(
+            self.afind_list_of_ids(resource, ids, client_projection)
+        )
+
+    def afind_list_of_ids(self, resource, ids, client_projection=None):
+        """ Returns an awaitable of the result of ``find_list_of_ids``. """
+        collection, _, projection, _ = self._datasource_ex(
+            resource, client_projection=client_projection
+        )
+        self._collection(collection)
+        fields = keep_fields(projection)
+        plan = self._date_plan(resource)
+        context = self.instrumentation.current()
+        cache = self._document_cache(resource)
+        if cache is not None:
+            return self._afind_list_cached(
+                context, cache, collection, ids, fields, plan
+            )
+        query, bind_vars = self._ids_query(collection, ids, fields)
+        return self._afind_list(context, query, bind_vars, plan)
+
+    async def _fetch_all(self, context, query, bind_vars):
+        data = await self._aexecute(context, query, bind_vars)
+        documents = data['result']
+        while data.get('hasMore'):
+            data = await self.client.fetch(data['id'])
+            documents.extend(data['result'])
+        return documents
+
+    async def _afind_list(self, context, query, bind_vars, plan):
+        documents = await self._fetch_all(context, query, bind_vars)
+        for document in documents:
+            to_python(document, plan)
+        return documents
+
+    async def _afind_list_cached(self, context, cache, collection, ids,
+                                 fields, plan):
+        documents = {}
+        missing = []
+        for key in ids:
+            document = cache.get(str(key))
+            if document is None:
+                missing.append(key)
+            else:
+                documents[str(key)] = document
+        if documents and cache.validate:
+            query, bind_vars = self._ids_query(
+                collection, list(documents), ['_key', '_rev']
+            )
+            current = {
+                document['_key']: document['_rev']
+                for document in await self._fetch_all(
+                    context, query, bind_vars
+                )
+            }
+            missing += self._outdated(cache, documents, current)
+        if missing:
+            generation = cache.generation
+            query, bind_vars = self._ids_query(collection, missing)
+            for document in await self._fetch_all(
+                context, query, bind_vars
+            ):
+                documents[document['_key']] = document
+                cache.add(document['_key'], document, generation)
+        return [
+            to_python(keep(documents[str(key)], fields), plan)
+            for key in ids if str(key) in documents
+        ]
+
+    def close(self):
+        """ Closes the HTTP session and stops the event loop. """
+        self.run(self.client.close())
+        self.loop.stop()
@@ -1,69 +1,1458 @@
+import base64
+import binascii
+import copy
+import itertools
 import json
 import re
+import time
+from collections import Counter, OrderedDict
 from datetime import datetime
+from threading import Lock
+from urllib.parse import urlsplit
 
 from eve.io.base import DataLayer
-from eve.utils import str_to_date
+from eve.methods.common import field_definition, resolve_embedded_fields
+from eve.utils import config, debug_error_message, str_to_date
+from flask import abort, g, has_app_context
 from arango import ArangoClient
+from arango.exceptions import (
+    AQLQueryExplainError, ArangoServerError, CollectionCreateError,
+    DocumentRevisionError, ViewCreateError
+)
+from arango.request import Request
 
+from eve_arango.bulk import BulkWriter
+from eve_arango.changes import ChangeFeed
+from eve_arango.http import PooledHTTPClient
+from eve_arango.metrics import Instrumentation, instrumented
+from eve_arango.transaction import Transaction
+from eve_arango.where import (  # noqa: F401
+    FUNCTIONS, VALID_OPS, VALID_SEPS, WhereSyntaxError, parse_where
+)
 
-VALID_OPS = [
-    '==', '!=', '<', '<=', '>', '>=',
-    'IN', 'NOT IN', 'LIKE', '=~', '!~'
-]
 
-VALID_SEPS = ['', ',', 'AND', 'OR', 'NOT']
+SYSTEM_ATTRIBUTES = ['_id', '_key', '_rev', '_from', '_to']
 
+PROVISION_MODES = ['eager', 'lazy', 'none']
 
-def date_hook(json_data):
-    for key, value in json_data.items():
-        try:
-            json_data[key] = str_to_date(value)
-        except:
-            pass
-    return json_data
+TRAVERSAL_DIRECTIONS = ['outbound', 'inbound', 'any']
+
+# ArangoDB error raised when creating a collection that already exists
+DUPLICATE_NAME = 1207
+
+# ArangoDB errors raised by writes on a stale revision, and duplicate keys
+CONFLICT = 1200
+UNIQUE_CONSTRAINT_VIOLATED = 1210
+
+INDEX_TYPES = ['persistent', 'hash', 'skiplist', 'ttl', 'fulltext', 'geo']
+
+# Always sparse, whatever they were created with
+SPARSE_INDEX_TYPES = ['fulltext', 'geo']
+
+# Index settings as named in DOMAIN, and in the ArangoDB HTTP API
+INDEX_OPTIONS = {
+    'unique': 'unique',
+    'sparse': 'sparse',
+    'deduplicate': 'deduplicate',
+    'expire_after': 'expireAfter',
+    'min_length': 'minLength',
+    'geo_json': 'geoJson',
+}
+
+# Prefixes of the bind variables holding attribute names in find queries
+ATTRIBUTE_VARS = ('key_', 'sort_', 'lookup_key_')
+
+# Distinct attributes counted per resource for the index report
+MAX_RECORDED_FIELDS = 256
+
+# Sorts the results of SEARCH conditions by relevance
+RANK_FIELD = '_rank'
+DEFAULT_ANALYZER = 'text_en'
+
+# Bind parameters in a query, collection parameters keep one @
+BIND_VAR_RE = re.compile(r'@(@?\w+)')
+
+
+def date_fields(schema):
+    """ Returns a conversion plan for the datetime fields of an Eve schema.
+    The plan maps field names to ``True`` for datetime fields, or to a nested
+    plan for dicts and lists of dicts containing datetime fields.
+    """
+    plan = {}
+    for field, rules in (schema or {}).items():
+        field_plan = _field_plan(rules)
+        if field_plan:
+            plan[field] = field_plan
+    return plan
+
+
+def _field_plan(rules):
+    if not isinstance(rules, dict):
+        return None
+    types = rules.get('type')
+    if not isinstance(types, list):
+        types = [types]
+    if 'datetime' in types:
+        return True
+    schema = rules.get('schema')
+    if not isinstance(schema, dict):
+        return None
+    if 'list' in types:
+        # The schema of a list holds the rules for each of its items
+        return _field_plan(schema)
+    return date_fields(schema) or None
+
+
+def to_python(document, plan):
+    """ Converts the fields in ``plan`` of a document read from ArangoDB, in
+    place. Everything else is left as it was decoded by the driver.
+    """
+    for field, field_plan in plan.items():
+        if field in document:
+            document[field] = _to_python_value(document[field], field_plan)
+    return document
+
+
+def _to_python_value(value, plan):
+    if isinstance(value, list):
+        return [_to_python_value(item, plan) for item in value]
+    if plan is True:
+        if isinstance(value, str):
+            try:
+                return str_to_date(value)
+            except ValueError:
+                pass
+    elif isinstance(value, dict):
+        to_python(value, plan)
+    return value
+
+
+def to_arango(value, default):
+    """ Returns a copy of ``value`` that can be sent to ArangoDB, using
+    ``default`` (usually a JSON encoder's ``default`` method) for any value
+    that is not natively supported by JSON.
+    """
+    if isinstance(value, dict):
+        return {key: to_arango(val, default) for key, val in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_arango(item, default) for item in value]
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return to_arango(default(value), default)
+
+
+def compile_where(where):
+    """ Compiles a ``where`` expression to AQL FILTER statements, one per
+    comma separated condition. Attribute paths and values are all passed as
+    bind variables. Returns the statements along with their bind variables.
+    Raises ``ValueError`` for FULLTEXT and SEARCH conditions, which only
+    ``compile_find`` supports.
+    """
+    source, search, filters, bind_vars = compile_conditions(where)
+    if source or search:
+        raise ValueError('FULLTEXT and SEARCH are not supported here')
+    return filters, bind_vars
+
+
+def compile_conditions(where):
+    """ Compiles a ``where`` expression to the parts of a find query: the
+    ``FULLTEXT()`` call to read documents from instead of ``@@collection``,
+    the SEARCH expression to run over ``@@view``, and FILTER statements for
+    the other conditions. Returns them (None if the query needs no
+    FULLTEXT or SEARCH) along with their bind variables.
+
+    FULLTEXT and SEARCH conditions choose the documents the query iterates
+    over, so they must be conditions of their own (separated by commas),
+    SEARCH conditions only being combined with each other. The analyzers of
+    SEARCH conditions are left for the caller to bind, to
+    ``@analyzer_<n>`` for the attribute in ``@key_<n>``. ``where`` may also
+    be parsed already, or a shape returned by ``where_shape``.
+    """
+    bind_vars = {}
+    counter = itertools.count()
+    source = None
+    searches = []
+    filters = []
+    if isinstance(where, str):
+        where = parse_where(where)
+    for condition in where:
+        functions = set(_functions(condition))
+        if 'FULLTEXT' in functions:
+            if condition[0] != 'CALL' or source:
+                raise ValueError(
+                    'FULLTEXT must be a single condition of its own'
+                )
+            _, _, path, value = condition
+            i = next(counter)
+            # FULLTEXT() takes the attribute as a string
+            bind_vars['key_%i' % i] = '.'.join(path)
+            bind_vars['val_%i' % i] = value
+            source = 'FULLTEXT(@@collection, @key_%i, @val_%i)' % (i, i)
+        elif 'SEARCH' in functions:
+            if functions != {'SEARCH'}:
+                raise ValueError(
+                    'SEARCH can only be combined with SEARCH conditions'
+                )
+            # Joined with AND
+            searches.append(_compile_condition(
+                condition, bind_vars, counter, _PRECEDENCE['AND']
+            ))
+        else:
+            filters.append(_compile_condition(condition, bind_vars, counter))
+    if source and searches:
+        raise ValueError('FULLTEXT and SEARCH cannot be combined')
+    return (
+        source, ' AND '.join(searches) or None,
+        'FILTER ' + '\n            FILTER '.join(filters) if filters else '',
+        bind_vars
+    )
+
+
+def where_shape(where):
+    """ Parses a ``where`` expression to its shape, the parsed conditions
+    with their values replaced by None, along with the values as bound to the
+    queries compiled from the shape. Expressions only differing by their
+    values have the same shape, and so share a compiled query. Raises
+    ``WhereSyntaxError``.
+    """
+    bind_vars = {}
+    counter = itertools.count()
+    shape = tuple(
+        _strip_values(condition, bind_vars, counter)
+        for condition in parse_where(where)
+    )
+    return shape, bind_vars
+
+
+def _strip_values(node, bind_vars, counter):
+    # Conditions are numbered in the order _compile_condition numbers them
+    kind = node[0]
+    if kind in ('CMP', 'CALL', 'DISTANCE'):
+        i = next(counter)
+        bind_vars['val_%i' % i] = _bind_value(node[-1])
+        if kind == 'DISTANCE':
+            bind_vars['point_%i' % i] = _bind_value(node[2])
+            return node[:2] + (None,) + node[3:-1] + (None,)
+        return node[:-1] + (None,)
+    return (kind,) + tuple(
+        _strip_values(child, bind_vars, counter) for child in node[1:]
+    )
+
+
+def _functions(node):
+    """ Yields the functions called by a condition, or None for every
+    comparison.
+    """
+    if node[0] == 'CALL':
+        yield node[1]
+    elif node[0] in ('CMP', 'DISTANCE'):
+        yield None
+    else:
+        for child in node[1:]:
+            yield from _functions(child)
+
+
+# Operator precedence, to only parenthesise where needed
+_PRECEDENCE = {'OR': 1, 'AND': 2}
+
+
+def _compile_condition(node, bind_vars, counter, precedence=0):
+    kind = node[0]
+    if kind in ('CMP', 'CALL', 'DISTANCE'):
+        i = next(counter)
+        path = node[2] if kind == 'CALL' else node[1]
+        # Nested attributes are bound as an array of names
+        bind_vars['key_%i' % i] = path[0] if len(path) == 1 else list(path)
+        bind_vars['val_%i' % i] = _bind_value(node[-1])
+    if kind == 'CMP':
+        return 'doc.@key_%i %s @val_%i' % (i, node[2], i)
+    if kind == 'DISTANCE':
+        # Served by a geo index on the attribute
+        bind_vars['point_%i' % i] = _bind_value(node[2])
+        return 'GEO_DISTANCE(@point_%i, doc.@key_%i) %s @val_%i' % (
+            i, i, node[3], i
+        )
+    if kind == 'CALL' and node[1] == 'GEO_CONTAINS':
+        return 'GEO_CONTAINS(GEO_POLYGON(@val_%i), doc.@key_%i)' % (i, i)
+    if kind == 'CALL':
+        bind_vars['analyzer_%i' % i] = None
+        return (
+            'ANALYZER(doc.@key_%i IN TOKENS(@val_%i, @analyzer_%i), '
+            '@analyzer_%i)' % (i, i, i, i)
+        )
+    if kind == 'NOT':
+        # NOT binds tighter than comparisons in AQL
+        return 'NOT (%s)' % _compile_condition(node[1], bind_vars, counter)
+    # The terms of a chain are compiled in a loop, only nested groups recurse
+    aql = (' %s ' % kind).join(
+        _compile_condition(child, bind_vars, counter, _PRECEDENCE[kind])
+        for child in node[1:]
+    )
+    if _PRECEDENCE[kind] < precedence:
+        return '(%s)' % aql
+    return aql
+
+
+def _bind_value(value):
+    if isinstance(value, tuple):
+        return [_bind_value(item) for item in value]
+    return value
+
+
+def parse_sort(sort):
+    """ Parses an Eve ``sort`` expression (``name,-age``) to a list of
+    ``(field, descending)`` tuples.
+    """
+    fields = []
+    for field in sort.split(','):
+        field = field.strip()
+        if not field:
+            continue
+        if field[0] == '-':
+            fields.append((field[1:].strip(), True))
+        else:
+            fields.append((field, False))
+    return fields
+
+
+def compile_sort(fields, rank=False):
+    """ Compiles a list of ``(field, descending)`` tuples to an AQL SORT
+    statement. Returns the statement along with its bind variables, dotted
+    fields being bound as attribute paths. With ``rank``, the query runs a
+    SEARCH and ``_rank`` sorts by relevance (``-_rank`` for the most
+    relevant first).
+    """
+    bind_vars = {}
+    sorts = []
+    for i, (field, descending) in enumerate(fields):
+        if field == RANK_FIELD:
+            if not rank:
+                raise ValueError('Sorting by _rank needs a SEARCH condition')
+            sort = 'BM25(doc)'
+        else:
+            bind_vars['sort_%i' % i] = (
+                field.split('.') if '.' in field else field
+            )
+            sort = 'doc.@sort_%i' % i
+        sorts.append(sort + ' DESC' if descending else sort)
+    return 'SORT ' + ', '.join(sorts), bind_vars
+
+
+def compile_keyset(fields):
+    """ Compiles the FILTER statements resuming a keyset paginated query
+    after the sort values bound to ``@after_<n>``. The first statement is a
+    plain range on the leading sort field, so it can be served by an index.
+    """
+    terms = []
+    for i, (_, descending) in enumerate(fields):
+        term = ['doc.@sort_%i == @after_%i' % (j, j) for j in range(i)]
+        term.append('doc.@sort_%i %s @after_%i' % (
+            i, '<' if descending else '>', i
+        ))
+        terms.append('(%s)' % ' AND '.join(term))
+    filters = ''
+    if len(fields) > 1:
+        filters += 'FILTER doc.@sort_0 %s @after_0\n            ' % (
+            '<=' if fields[0][1] else '>='
+        )
+    return filters + 'FILTER ' + ' OR '.join(terms)
+
+
+def keyset_fields(sort):
+    """ Returns the sort fields of a keyset paginated query, which always end
+    with ``_key`` to make the order unique.
+    """
+    fields = parse_sort(sort) if sort else []
+    if '_key' not in [field for field, _ in fields]:
+        fields.append(('_key', False))
+    return fields
+
+
+def sort_value(document, field):
+    """ Returns the value of a sort field in a document, following dotted
+    fields into nested documents like the attribute paths of
+    ``compile_sort``. Missing values are None, as in AQL.
+    """
+    value = document
+    for name in field.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(name)
+    return value
+
+
+def encode_token(values):
+    """ Encodes the sort values of the last document of a page to an opaque
+    continuation token.
+    """
+    data = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_token(token):
+    """ Decodes a continuation token created by ``encode_token``. Raises
+    ``ValueError`` if the token is invalid.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(data.decode())
+    except (TypeError, UnicodeDecodeError, binascii.Error) as e:
+        raise ValueError(str(e))
+    if not isinstance(values, list):
+        raise ValueError('continuation token must encode a list')
+    return values
+
+
+def index_data(spec):
+    """ Converts an index from the ``indexes`` setting of a resource to the
+    body sent to ArangoDB to create it.
+    """
+    if spec.get('type') not in INDEX_TYPES:
+        raise ValueError('Unknown index type: %s' % spec.get('type'))
+    data = {'type': spec['type'], 'fields': list(spec['fields'])}
+    for option, name in INDEX_OPTIONS.items():
+        if option in spec:
+            data[name] = spec[option]
+    return data
+
+
+def index_key(index):
+    """ Returns what identifies an index, given as returned by ArangoDB or
+    by ``index_data``.
+    """
+    type_ = index['type']
+    if type_.startswith('geo'):
+        # Depending on the version, geo indexes are reported as geo1/geo2
+        type_ = 'geo'
+    return (
+        type_, tuple(index['fields']), bool(index.get('unique')),
+        type_ in SPARSE_INDEX_TYPES or bool(index.get('sparse'))
+    )
+
+
+def search_view(collection, search):
+    """ Returns the name of the ArangoSearch view of a resource's ``search``
+    setting.
+    """
+    return search.get('view', collection + '_search')
+
+
+def search_fields(search):
+    """ Returns the attributes of a ``search`` setting, each with the
+    analyzer it is indexed with.
+    """
+    fields = search.get('fields', {})
+    if not isinstance(fields, dict):
+        fields = dict.fromkeys(
+            fields, search.get('analyzer', DEFAULT_ANALYZER)
+        )
+    return fields
+
+
+def search_link(search):
+    """ Returns how a view links to the collection of a ``search`` setting,
+    nested attributes being nested in the link.
+    """
+    fields = {}
+    for field, analyzer in search_fields(search).items():
+        node = fields
+        names = field.split('.')
+        for name in names[:-1]:
+            node = node.setdefault(name, {}).setdefault('fields', {})
+        node.setdefault(names[-1], {})['analyzers'] = [analyzer]
+    return {'fields': fields}
+
+
+def keep_fields(projection):
+    """ Returns the top level attributes kept by an Eve projection, or None if
+    whole documents should be returned. System attributes are always kept.
+    """
+    if not projection:
+        return None
+    fields = set(
+        field.split('.')[0] for field, value in projection.items() if value
+    )
+    if not fields:
+        return None
+    fields.update(SYSTEM_ATTRIBUTES)
+    return sorted(fields)
+
+
+def keep(document, fields):
+    """ Returns a copy of ``document`` with only ``fields``, like ``KEEP``
+    in AQL, or a full copy if ``fields`` is None.
+    """
+    if fields is None:
+        return copy.deepcopy(document)
+    return dict(
+        (field, copy.deepcopy(value)) for field, value in document.items()
+        if field in fields
+    )
+
+
+def document_key(document):
+    """ Returns the key of a document given as a dict, key or id. """
+    if isinstance(document, dict):
+        document = document.get('_key') or document.get('_id')
+    if document is None:
+        return None
+    return str(document).split('/')[-1]
+
+
+def compile_return(projection, embedded=0):
+    """ Returns the AQL RETURN statement for ``doc``, keeping only the
+    attributes bound to ``@fields`` if ``projection`` is set. With
+    ``embedded``, ``doc`` is returned along with the documents it references,
+    read by the statements of ``compile_embedded``.
+    """
+    document = 'KEEP(doc, @fields)' if projection else 'doc'
+    if embedded:
+        return 'RETURN {doc: %s, embedded: [%s]}' % (document, ', '.join(
+            'embedded_%i' % i for i in range(embedded)
+        ))
+    return 'RETURN ' + document
+
+
+def compile_embedded(embedded):
+    """ Returns the AQL LET statements reading the documents referenced by
+    ``doc``, one for each embedded field. ``embedded`` holds whether each
+    field references document keys, read with ``DOCUMENT``, or another
+    attribute, read with a subquery. Bound by ``bind_embedded``.
+    """
+    statements = []
+    for i, by_key in enumerate(embedded):
+        if by_key:
+            related = (
+                'DOCUMENT(@embed_collection_%i, '
+                'TO_ARRAY(doc.@embed_path_%i))' % (i, i)
+            )
+        else:
+            related = (
+                '(FOR rel IN @@embed_collection_%i '
+                'FILTER rel.@embed_key_%i IN TO_ARRAY(doc.@embed_path_%i) '
+                'RETURN rel)' % (i, i, i)
+            )
+        statements.append('LET embedded_%i = %s' % (i, related))
+    return '\n            '.join(statements)
 
 
-def parse_where(where):
-    arango_re = (
-        r'([\w-]+?)([\s!=<>~NOTLIKE]+)(".+?"|[\d\s\[\]nul,.]+)([ANDORT,]*)'
+def bind_embedded(relations):
+    """ Returns the bind variables of ``compile_embedded`` for a list of
+    ``(field, collection, key)`` relations, ``key`` being the attribute of
+    the related documents which ``field`` refers to.
+    """
+    bind_vars = {}
+    for i, (field, collection, key) in enumerate(relations):
+        bind_vars['embed_path_%i' % i] = (
+            field.split('.') if '.' in field else field
+        )
+        if key == '_key':
+            bind_vars['embed_collection_%i' % i] = collection
+        else:
+            bind_vars['@embed_collection_%i' % i] = collection
+            bind_vars['embed_key_%i' % i] = (
+                key.split('.') if '.' in key else key
+            )
+    return bind_vars
+
+
+def reference_lookup(lookup):
+    """ Returns the field and values of a lookup matching any of several
+    values of one field, the way Eve looks up the documents it embeds
+    (``{'$or': [{field: value}, ...]}``), or None for any other lookup.
+    """
+    if not isinstance(lookup, dict) or list(lookup) != ['$or']:
+        return None
+    field, values = None, []
+    for query in lookup['$or']:
+        if not isinstance(query, dict) or len(query) != 1:
+            return None
+        (name, value), = query.items()
+        if name.startswith('$') or isinstance(value, dict) or \
+                field not in (None, name):
+            return None
+        field = name
+        values.append(value)
+    if field is None:
+        return None
+    return field, values
+
+
+def lookup_conditions(lookup):
+    """ Flattens an Eve lookup or datasource filter, a dict of field values
+    which may combine several with ``$and``, to a sorted list of
+    ``(field, value)`` equality conditions.
+    """
+    conditions = []
+    for field, value in (lookup or {}).items():
+        if field == '$and':
+            for query in value:
+                conditions.extend(lookup_conditions(query))
+        elif field.startswith('$') or (
+                isinstance(value, dict) and
+                any(key.startswith('$') for key in value)):
+            raise ValueError('Unsupported lookup operator in %s' % field)
+        else:
+            conditions.append((field, value))
+    return sorted(conditions, key=lambda condition: condition[0])
+
+
+def bind_lookup(conditions):
+    """ Returns the bind variables of the filters of ``compile_lookup`` for
+    a list of ``(field, value)`` conditions. Dotted fields are bound as
+    attribute paths.
+    """
+    bind_vars = {}
+    for i, (field, value) in enumerate(conditions):
+        bind_vars['lookup_key_%i' % i] = (
+            field.split('.') if '.' in field else field
+        )
+        bind_vars['lookup_val_%i' % i] = value
+    return bind_vars
+
+
+def compile_lookup_filters(count):
+    """ Returns the AQL FILTER statements for ``count`` lookup conditions,
+    bound by ``bind_lookup``.
+    """
+    return '\n            '.join(
+        'FILTER doc.@lookup_key_%i == @lookup_val_%i' % (i, i)
+        for i in range(count)
+    )
+
+
+def compile_lookup(lookup):
+    """ Compiles an Eve lookup (a dict of field values) to AQL FILTER
+    statements. Returns the statements along with their bind variables.
+    """
+    conditions = lookup_conditions(lookup)
+    return compile_lookup_filters(len(conditions)), bind_lookup(conditions)
+
+
+def compile_find(where, sort, keyset=False, after=False, projection=False,
+                 lookup=0, embedded=(), limited=True, count=False):
+    """ Compiles the query used by ``ArangoDB.find``. Only the shape of the
+    request goes into the query text, values (including skip and limit) are
+    left as bind variables so ArangoDB can reuse its query plans.
+    With ``keyset``, the query is sorted by ``keyset_fields`` and, if
+    ``after`` is set, resumes after the values bound to ``@after_<n>``
+    instead of skipping. With ``projection``, only the attributes bound to
+    ``@fields`` are returned. ``lookup`` is the number of equality conditions
+    from the sub resource lookup and datasource filter, bound by
+    ``bind_lookup``. ``embedded`` describes the fields whose referenced
+    documents are returned along with each document, as compiled by
+    ``compile_embedded``. Without ``limited``, all the matching documents
+    are returned. With ``count``, the query instead returns the number of
+    matching documents, ignoring sort, limit and embedding.
+    """
+    bind_vars = {}
+    source = search = None
+    filters = compile_lookup_filters(lookup)
+    if where:
+        source, search, where_filters, filter_vars = compile_conditions(
+            where
+        )
+        if filters and where_filters:
+            filters += '\n            '
+        filters += where_filters
+        bind_vars.update(filter_vars)
+    if search:
+        source = '@@view\n            SEARCH ' + search
+    fields = keyset_fields(sort) if keyset else parse_sort(sort or '')
+    if keyset and RANK_FIELD in [field for field, _ in fields]:
+        raise ValueError('Keyset pagination cannot sort by _rank')
+    if keyset and after:
+        if filters:
+            filters += '\n            '
+        filters += compile_keyset(fields)
+    sorts = ''
+    if fields:
+        sorts, sort_vars = compile_sort(fields, rank=bool(search))
+        bind_vars.update(sort_vars)
+    if count:
+        query = '''
+        FOR doc IN %s
+            %s
+            COLLECT WITH COUNT INTO total
+            RETURN total
+        ''' % (source or '@@collection', filters)
+        return query, bind_vars
+    limit = ''
+    if limited:
+        limit = 'LIMIT @limit' if keyset else 'LIMIT @skip, @limit'
+    query = '''
+        FOR doc IN %s
+            %s
+            %s
+            %s
+            %s
+            %s
+        ''' % (
+        source or '@@collection', filters, sorts, limit,
+        compile_embedded(embedded), compile_return(projection, len(embedded))
+    )
+    return query, bind_vars
+
+
+def compile_remove(lookup=0, chunked=False):
+    """ Compiles the query used by ``ArangoDB.remove``. ``lookup`` is the
+    number of equality conditions, bound by ``bind_lookup``, the documents
+    removed must match. With ``chunked``, at most ``@chunk_size`` documents
+    are removed. The number removed is reported in the query statistics.
+    """
+    query = '''
+        FOR doc IN @@collection
+            %s
+            %s
+            REMOVE doc IN @@collection
+        ''' % (
+        compile_lookup_filters(lookup), 'LIMIT @chunk_size' if chunked else ''
+    )
+    return query, {}
+
+
+def parse_depth(depth):
+    """ Parses a traversal depth, either ``'<n>'`` or ``'<min>..<max>'`` as
+    in AQL, into the minimum and maximum depth.
+    """
+    if '..' in depth:
+        min_depth, max_depth = (int(part) for part in depth.split('..', 1))
+    else:
+        min_depth = max_depth = int(depth)
+    if min_depth < 0 or max_depth < min_depth:
+        raise ValueError('Invalid depth: %s' % depth)
+    return min_depth, max_depth
+
+
+def compile_traversal(where, sort, direction, edges=1, projection=False,
+                      unique=True, lookup=0, limited=True, count=False):
+    """ Compiles the graph traversal used by ``ArangoDB.find``. The vertices
+    found from ``@start`` over the edge collections ``@@edges_<n>``, between
+    ``@min_depth`` and ``@max_depth`` steps in ``direction``, are filtered,
+    sorted and returned like the documents of ``compile_find``. With
+    ``unique``, each vertex is returned once, at its shortest depth.
+    ``lookup`` is the number of equality conditions, bound by
+    ``bind_lookup``, every edge followed must meet.
+    """
+    bind_vars = {}
+    filters = '\n            '.join(
+        'FILTER path.edges[*].@lookup_key_%i ALL == @lookup_val_%i' % (i, i)
+        for i in range(lookup)
+    )
+    if where:
+        where_filters, filter_vars = compile_where(where)
+        filters = (filters + '\n            ' + where_filters).strip()
+        bind_vars.update(filter_vars)
+    traverse = 'FOR doc%s IN @min_depth..@max_depth %s @start %s' % (
+        ', edge, path' if lookup else '', direction.upper(),
+        ', '.join('@@edges_%i' % i for i in range(edges))
+    )
+    if unique:
+        traverse += " OPTIONS {bfs: true, uniqueVertices: 'global'}"
+    if count:
+        query = '''
+        %s
+            %s
+            COLLECT WITH COUNT INTO total
+            RETURN total
+        ''' % (traverse, filters)
+        return query, bind_vars
+    sorts = ''
+    fields = parse_sort(sort or '')
+    if fields:
+        sorts, sort_vars = compile_sort(fields)
+        bind_vars.update(sort_vars)
+    query = '''
+        %s
+            %s
+            %s
+            %s
+            %s
+        ''' % (
+        traverse, filters, sorts, 'LIMIT @skip, @limit' if limited else '',
+        compile_return(projection)
     )
-    result = re.findall(arango_re, where)
-    return result
+    return query, bind_vars
 
 
-class ArangoResult(list):
+def compile_aggregation(pipeline, request_pipeline=None):
+    """ Compiles an aggregation pipeline declared in ``DOMAIN`` to the query
+    run by ``ArangoDB.aggregate``. The pipeline holds the AQL in an ``$aql``
+    stage and its parameters in ``$bind`` stages. ``request_pipeline`` is
+    the pipeline Eve built for the request, with the client's values in
+    place of the parameters' placeholders and the ``$skip``, ``$limit`` and
+    ``$facet`` stages Eve adds for pagination. Only those are read from it,
+    the AQL always comes from the declared pipeline. Parameters the request
+    left unset are bound to null, and values other than JSON scalars and
+    lists are rejected with ``ValueError``. Returns the query, its bind
+    variables, and whether Eve asked for a ``$facet`` with the page and
+    total count.
+    """
+    query, declared = _aggregation_stages(pipeline)[:2]
+    if query is None:
+        raise ValueError('Aggregation pipeline has no $aql stage')
+    _, values, page, facet = _aggregation_stages(
+        pipeline if request_pipeline is None else request_pipeline
+    )
+
+    bind_vars = {}
+    for name, value in declared.items():
+        if isinstance(value, str) and value.startswith('$'):
+            # A parameter, unset if still the placeholder or pruned by Eve
+            value = values.get(name)
+            if value == declared[name]:
+                value = None
+            elif not _is_bind_value(value):
+                raise ValueError('Invalid value for parameter %s' % name)
+        bind_vars[name] = value
+    limit = ''
+    if '$limit' in page or page.get('$skip'):
+        limit = 'LIMIT @aggregation_skip, @aggregation_limit'
+        # The largest count AQL accepts, when only skipping
+        bind_vars['aggregation_skip'] = page.get('$skip', 0)
+        bind_vars['aggregation_limit'] = page.get('$limit', 2 ** 53 - 1)
+    query = '''
+        FOR row IN (
+            %s
+        )
+            %s
+            RETURN row
+        ''' % (query.strip(), limit)
+    return query, bind_vars, facet
+
+
+def _aggregation_stages(pipeline):
+    """ Returns the ``$aql`` text, ``$bind`` parameters, pagination and
+    ``$facet`` flag of an aggregation pipeline.
+    """
+    query = None
+    bind_vars = {}
+    page = {}
+    facet = False
+    for stage in pipeline:
+        for operator, value in stage.items():
+            if operator == '$aql':
+                query = value
+            elif operator == '$bind':
+                bind_vars.update(value)
+            elif operator in ('$skip', '$limit'):
+                page[operator] = value
+            elif operator == '$facet':
+                facet = True
+                for sub_stage in value.get('paginated_results', []):
+                    page.update(sub_stage)
+            else:
+                raise ValueError('Unsupported aggregation stage: %s' % operator)
+    return query, bind_vars, page, facet
+
+
+def _is_bind_value(value):
+    if isinstance(value, list):
+        return all(_is_bind_value(item) for item in value)
+    return value is None or isinstance(value, (str, int, float, bool))
+
+
+def used_bind_vars(query, bind_vars):
+    """ Returns the bind variables which ``query`` refers to, as ArangoDB
+    rejects queries given any others.
+    """
+    names = set(BIND_VAR_RE.findall(query))
+    return dict(
+        (name, value) for name, value in bind_vars.items() if name in names
+    )
+
+
+class QueryCache:
+    """ A bounded LRU cache of compiled queries, keyed by request shape. The
+    ``hits`` and ``misses`` counters can be used to tune its size.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, compile_query):
+        """ Returns the entry for ``key``, calling ``compile_query`` to create
+        it on a miss.
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+        value = compile_query()
+        if self.maxsize:
+            with self._lock:
+                self._entries[key] = value
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class TTLCache:
+    """ A bounded LRU cache whose entries expire ``ttl`` seconds after they
+    were set. A ``ttl`` of None keeps entries until they are evicted.
+    """
 
-    def __init__(self, cursor):
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._set(key, value)
+
+    def _set(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = time.monotonic() + self.ttl
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def prune(self, predicate):
+        """ Drops the entries whose key matches ``predicate``. """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+
+class DocumentCache(TTLCache):
+    """ A ``TTLCache`` of the documents of a collection, by ``_key``. Reads
+    take the cache's ``generation`` before going to the database, and only
+    ``add`` what they read if no write invalidated the cache meanwhile, so a
+    slow read cannot put back an outdated revision. Unless ``validate`` is
+    False, cached documents are checked against their current ``_rev``
+    before being served.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, validate=True):
+        super().__init__(maxsize, ttl)
+        self.generation = 0
+        self.validate = validate
+
+    def add(self, key, document, generation):
+        with self._lock:
+            if generation == self.generation:
+                self._set(key, document)
+
+    def invalidate(self, keys=None):
+        """ Drops the documents with ``keys``, or all documents if None. """
+        with self._lock:
+            self.generation += 1
+            if keys is None:
+                self._entries.clear()
+            for key in keys or ():
+                self._entries.pop(key, None)
+
+
+class ArangoResult:
+    """ Lazily iterates over the documents of an AQL cursor. Further batches
+    are only fetched from the server when the current one is consumed, and
+    documents are converted one at a time as they are yielded. Indexing or
+    taking the length reads all of them.
+    """
+
+    def __init__(self, cursor, plan=None, keyset=None, limit=None,
+                 count=None, timer=None, embedded=None, store=None):
         self.cursor = cursor
-        batch = list(cursor.batch())
-        processed_result = json.loads(json.dumps(batch), object_hook=date_hook)
-        super().__init__(processed_result)
+        self.plan = plan or {}
+        self.keyset = keyset
+        self.limit = limit
+        # The ``(collection, key)`` of the documents read along with each
+        # document, kept in ``store`` by collection, key and value
+        self.embedded = embedded
+        self.store = store if store is not None else {}
+        # Called with the time spent fetching and converting once iterated
+        self.timer = timer
+        self._yielded = 0
+        self._last = None
+        # The documents, once read into a list for indexing
+        self._loaded = None
+        # Statistics may be replaced by later batches, so keep the count
+        # reported with the first one, unless a count (or a function
+        # computing it) was given.
+        if count is None:
+            count = (cursor.statistics() or {}).get('fullCount')
+        self._count = count
+
+    def __iter__(self):
+        # Decided on the first document, list() asks for the length first
+        if self._loaded is None:
+            yield from self._documents()
+        else:
+            yield from self._loaded
+
+    def __len__(self):
+        return len(self._load())
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __bool__(self):
+        # Truthy like a cursor even when empty, Eve tells a versions listing
+        # from a single document this way
+        return True
+
+    def _load(self):
+        """ Reads the documents not iterated over yet into a list, which is
+        iterated over from then on. Eve indexes the results of some queries.
+        """
+        if self._loaded is None:
+            self._loaded = list(self._documents())
+        return self._loaded
+
+    def _documents(self):
+        cursor = self.cursor
+        timed = self.timer is not None
+        fetching = converting = 0.0
+        try:
+            while True:
+                # Popping from the batch drops each document as soon as it
+                # has been handed out.
+                while not cursor.empty():
+                    if timed:
+                        start = time.perf_counter()
+                        document = self._process(cursor.pop())
+                        converting += time.perf_counter() - start
+                        yield document
+                    else:
+                        yield self._process(cursor.pop())
+                if not cursor.has_more():
+                    break
+                start = time.perf_counter()
+                cursor.fetch()
+                fetching += time.perf_counter() - start
+        finally:
+            if cursor.has_more():
+                cursor.close(ignore_missing=True)
+            if timed:
+                self.timer('fetch', fetching)
+                self.timer('convert', converting)
+
+    def _process(self, document):
+        self._yielded += 1
+        if self.embedded and isinstance(document, dict):
+            self._keep_embedded(document['embedded'])
+            document = document['doc']
+        if isinstance(document, dict):
+            if self.keyset:
+                # Taken before conversion, so the values are the ones stored
+                self._last = [
+                    sort_value(document, field) for field in self.keyset
+                ]
+            return to_python(document, self.plan)
+        return document
+
+    def _keep_embedded(self, embedded):
+        for (collection, key), related in zip(self.embedded, embedded):
+            for document in related or ():
+                if not isinstance(document, dict):
+                    continue
+                try:
+                    self.store[
+                        (collection, key, document.get(key))
+                    ] = document
+                except TypeError:
+                    # Unhashable values can't be looked up by Eve either
+                    pass
+
+    @property
+    def continuation(self):
+        """ The token resuming a keyset paginated query after the last
+        document yielded, or None if there are no further pages: the query
+        wasn't limited, or the page is short.
+        """
+        if self._last is None or not self.limit or \
+                self._yielded < self.limit:
+            return None
+        return encode_token(self._last)
+
+    def extra(self, response):
+        """ Called by Eve with the response once the documents have been
+        consumed, adds the continuation token of keyset paginated queries.
+        """
+        if self.keyset:
+            meta = response.setdefault(config.META, {})
+            meta['continuation'] = self.continuation
 
     def count(self, with_limit_and_skip=False, **kwargs):
-        return self.cursor.statistics().get('fullCount')
+        if callable(self._count):
+            self._count = self._count()
+        return self._count
+
+
+class AggregationResult(ArangoResult):
+    """ The result of ``ArangoDB.aggregate``, read like the MongoDB command
+    cursor Eve expects. With ``facet``, it holds a single document with the
+    ``paginated_results`` (iterated lazily) and their ``total_count``,
+    otherwise the rows themselves.
+    """
+
+    def __init__(self, cursor, plan=None, facet=False, timer=None):
+        # fullCount is only reported for queries with a LIMIT
+        count = (cursor.statistics() or {}).get('fullCount')
+        if count is None:
+            count = cursor.count()
+        super().__init__(cursor, plan, count=count, timer=timer)
+        self.facet = facet
+        self._iterator = None
+
+    def __iter__(self):
+        if self.facet:
+            return iter([{
+                'paginated_results': self._documents(),
+                'total_count': [{'count': self.count() or 0}],
+            }])
+        return self._documents()
+
+    def next(self):
+        if self._iterator is None:
+            self._iterator = iter(self)
+        return next(self._iterator)
+
+    __next__ = next
+
+
+class FindQuery:
+    """ A query built by ``ArangoDB.find``, with what is needed to run it and
+    to build its result.
+    """
+
+    def __init__(self, resource, collection, shape, query, bind_vars, plan,
+                 compiler=compile_find):
+        self.resource = resource
+        self.collection = collection
+        # The arguments of ``compiler`` which produced the query
+        self.shape = shape
+        self.compiler = compiler
+        self.query = query
+        self.bind_vars = bind_vars
+        self.plan = plan
+        self.full_count = True
+        # A known count, or a function returning it
+        self.count = None
+        # Where the count is cached once known
+        self.count_key = None
+        self.keyset = None
+        self.limit = None
+        # The ``(collection, key)`` of each embedded field read by the query,
+        # and where the documents read are kept
+        self.embedded = None
+        self.store = None
+        # Records phases for the method that built the query
+        self.timer = None
 
 
 class ArangoDB(DataLayer):
 
+    # Parses the dates of request payloads before they are validated
+    serializers = {'datetime': str_to_date}
+
     def init_app(self, app):
         db = app.config.get('ARANGO_DB', app.name)
         host = app.config.get('ARANGO_HOST', 'localhost')
         port = app.config.get('ARANGO_PORT', 8529)
+        self.batch_size = app.config.get('ARANGO_BATCH_SIZE')
+        self.cursor_ttl = app.config.get('ARANGO_CURSOR_TTL')
+        self.keyset_param = app.config.get('ARANGO_KEYSET_PARAM', 'after')
+        self.count_param = app.config.get('ARANGO_COUNT_PARAM', 'count')
+        self.start_param = app.config.get('ARANGO_START_PARAM', 'start')
+        self.depth_param = app.config.get('ARANGO_DEPTH_PARAM', 'depth')
+        self.direction_param = app.config.get(
+            'ARANGO_DIRECTION_PARAM', 'direction'
+        )
+        self.query_cache = QueryCache(
+            app.config.get('ARANGO_QUERY_CACHE_SIZE', 256)
+        )
+        self.bulk_size = app.config.get('ARANGO_BULK_SIZE', 1000)
+        self.bulk_interval = app.config.get('ARANGO_BULK_INTERVAL')
+        self.bulk_import = app.config.get('ARANGO_BULK_IMPORT', False)
+        self.transaction_timeout = app.config.get('ARANGO_TRANSACTION_TIMEOUT')
+        self.transaction_sync = app.config.get('ARANGO_TRANSACTION_SYNC')
+        self.count_mode = app.config.get('ARANGO_COUNT_MODE', 'exact')
+        self.remove_chunk_size = app.config.get('ARANGO_REMOVE_CHUNK_SIZE')
+        self.instrumentation = Instrumentation(
+            slow_query_time=app.config.get('ARANGO_SLOW_QUERY_TIME'),
+            explain=app.config.get('ARANGO_SLOW_QUERY_EXPLAIN', True)
+        )
+        self.count_cache = TTLCache(
+            app.config.get('ARANGO_COUNT_CACHE_SIZE', 1024),
+            app.config.get('ARANGO_COUNT_CACHE_TTL', 10)
+        )
 
-        self.driver = ArangoClient(host=host, port=port)
+        endpoints = app.config.get('ARANGO_HOSTS') or [
+            '%s://%s:%s' % (
+                app.config.get('ARANGO_PROTOCOL', 'http'), host, port
+            )
+        ]
+        http_client = PooledHTTPClient(
+            endpoints,
+            strategy=app.config.get('ARANGO_HOST_STRATEGY', 'roundrobin'),
+            pool_size=app.config.get('ARANGO_POOL_SIZE', 10),
+            pool_block=app.config.get('ARANGO_POOL_BLOCK', False),
+            max_retries=app.config.get('ARANGO_MAX_RETRIES', 3),
+            timeout=app.config.get('ARANGO_TIMEOUT'),
+            keep_alive=app.config.get('ARANGO_KEEP_ALIVE', True)
+        )
+        self.endpoints = http_client.endpoints
+        base_url = urlsplit(http_client.endpoints[0])
+        self.driver = ArangoClient(
+            protocol=base_url.scheme, host=base_url.hostname,
+            port=base_url.port or port, http_client=http_client
+        )
 
-        if not self.driver.db('_system').has_database(db):
-            self.driver.db('_system').create_database(db)
+        self.provision = app.config.get('ARANGO_PROVISION', 'eager')
+        if self.provision not in PROVISION_MODES:
+            raise ValueError('Unknown ARANGO_PROVISION: %s' % self.provision)
+        if self.provision != 'none':
+            if not self.driver.db('_system').has_database(db):
+                self.driver.db('_system').create_database(db)
 
         self.db = self.driver.db(db)
 
+        meta_fields = {
+            app.config['LAST_UPDATED']: True,
+            app.config['DATE_CREATED']: True,
+        }
+        self._encode = self.json_encoder_class().default
+        self.default_plan = meta_fields
+        self.date_plans = {}
         for resource, settings in app.config['DOMAIN'].items():
-            edge = settings.get('edge_collection', False)
-            if not self.db.has_collection(resource):
-                self.db.create_collection(resource, edge=edge)
+            plan = date_fields(settings.get('schema'))
+            plan.update(meta_fields)
+            self.date_plans[resource] = plan
 
-    def find(self, resource, req, sub_resource_lookup):
+        # Document caches by collection, and the resources reading from them
+        self.document_caches = {}
+        self._cached_resources = {}
+        cache_size = app.config.get('ARANGO_DOCUMENT_CACHE_SIZE', 1024)
+        cache_ttl = app.config.get('ARANGO_DOCUMENT_CACHE_TTL', 60)
+        # The change feed drops the documents written by other processes,
+        # which makes checking the revision of every hit unnecessary
+        change_feed = app.config.get('ARANGO_CHANGE_FEED', False)
+        cache_validate = app.config.get(
+            'ARANGO_DOCUMENT_CACHE_VALIDATE', not change_feed
+        )
+        for resource, settings in app.config['DOMAIN'].items():
+            options = settings.get('document_cache')
+            if not options:
+                continue
+            if not isinstance(options, dict):
+                options = {}
+            source = settings.get('datasource', {}).get('source', resource)
+            self._cached_resources[resource] = source
+            validate = options.get('validate', cache_validate)
+            if source not in self.document_caches:
+                self.document_caches[source] = DocumentCache(
+                    options.get('size', cache_size),
+                    options.get('ttl', cache_ttl), validate
+                )
+            elif validate:
+                # Validated if any resource reading from it asks to be
+                self.document_caches[source].validate = True
+
+        # Follows the writes made by other processes, to invalidate caches
+        self.changes = None
+        if change_feed:
+            self._sources = {}
+            resources = {}
+            for resource, settings in app.config['DOMAIN'].items():
+                source = settings.get('datasource', {}).get('source', resource)
+                self._sources[resource] = source
+                resources.setdefault(source, []).append(resource)
+            self.changes = ChangeFeed(
+                self.db, resources,
+                interval=app.config.get('ARANGO_CHANGE_FEED_INTERVAL', 1.0)
+            )
+            self.changes.subscribe(self._on_change)
+            self.changes.start()
+
+        self._collections = {}
+        self._collections_lock = Lock()
+        self._field_usage = {}
+        self._field_usage_lock = Lock()
+        # Collections that may still have to be created or indexed, with the
+        # settings of every resource reading from them
+        self._unprovisioned = {}
+        if self.provision != 'none':
+            for resource, settings in app.config['DOMAIN'].items():
+                source = settings.get('datasource', {}).get('source', resource)
+                self._unprovisioned.setdefault(source, []).append(settings)
+        if self.provision == 'eager':
+            existing = set(c['name'] for c in self.db.collections())
+            for name, settings in list(self._unprovisioned.items()):
+                self._provision_collection(name, settings, name in existing)
+            self._unprovisioned.clear()
+
+    def _provision_collection(self, name, settings, exists):
+        """ Creates a collection unless it ``exists``, then the indexes and
+        views of ``settings``, the settings of the resources reading from it.
+        """
+        if not exists:
+            edge = any(
+                resource.get('edge_collection', False) for resource in settings
+            )
+            try:
+                self.db.create_collection(name, edge=edge)
+            except CollectionCreateError as e:
+                # Another worker may have created it in the meantime
+                if e.error_code != DUPLICATE_NAME:
+                    raise
+        specs = [
+            spec for resource in settings
+            for spec in resource.get('indexes') or ()
+        ]
+        if specs:
+            self._ensure_indexes(self.db.collection(name), specs)
+        for resource in settings:
+            if resource.get('search'):
+                self._ensure_view(name, resource['search'])
+
+    def _ensure_view(self, collection, search):
+        """ Creates the ArangoSearch view of a ``search`` setting, unless it
+        exists. Like indexes, existing views are left as they are.
+        """
+        name = search_view(collection, search)
+        if any(view['name'] == name for view in self.db.views()):
+            return
+        try:
+            self.db.create_view(name, 'arangosearch', {
+                'links': {collection: search_link(search)}
+            })
+        except ViewCreateError as e:
+            if e.error_code != DUPLICATE_NAME:
+                raise
+
+    @staticmethod
+    def _ensure_indexes(handle, specs):
+        """ Creates the indexes in ``specs`` which the collection doesn't
+        have yet.
+        """
+        existing = [index_key(index) for index in handle.indexes()]
+        for spec in specs:
+            data = index_data(spec)
+            if index_key(data) not in existing:
+                # Uses the driver's generic helper, as it has no method for
+                # some of the index types (like TTL)
+                handle._add_index(data)
+                existing.append(index_key(data))
+
+    def _collection(self, name):
+        """ Returns the cached handle of a collection, creating the
+        collection and its indexes first if it is provisioned lazily.
+        """
+        handle = self._collections.get(name)
+        if handle is None:
+            with self._collections_lock:
+                if name in self._unprovisioned:
+                    self._provision_collection(
+                        name, self._unprovisioned[name],
+                        self.db.has_collection(name)
+                    )
+                    del self._unprovisioned[name]
+                handle = self._collections[name] = self.db.collection(name)
+        return handle
+
+    def _record_fields(self, resource, bind_vars):
+        """ Counts the attributes a query filters and sorts on, for
+        ``index_report``. As clients choose them, only attributes of the
+        resource's schema are counted unless it allows unknown ones, and at
+        most ``MAX_RECORDED_FIELDS`` of them.
+        """
+        settings = config.DOMAIN.get(resource, {})
+        schema = settings.get('schema')
+        if settings.get('allow_unknown'):
+            schema = None
+        fields = [
+            value if isinstance(value, str) else '.'.join(value)
+            for name, value in bind_vars.items()
+            if name.startswith(ATTRIBUTE_VARS)
+            and isinstance(value, (str, list))
+        ]
+        if schema:
+            fields = [
+                field for field in fields
+                if field.split('.')[0] in schema
+                or field in SYSTEM_ATTRIBUTES
+            ]
+        with self._field_usage_lock:
+            usage = self._field_usage.setdefault(resource, Counter())
+            for field in fields:
+                if field in usage or len(usage) < MAX_RECORDED_FIELDS:
+                    usage[field] += 1
+
+    def index_report(self):
+        """ Returns, for each resource queried by ``find`` so far, the filter
+        and sort attributes which are not the leading field of any of the
+        collection's indexes, along with the number of queries using them.
+        """
+        with self._field_usage_lock:
+            usage = dict(
+                (resource, Counter(fields))
+                for resource, fields in self._field_usage.items()
+            )
+        report = {}
+        for resource, fields in usage.items():
+            collection, _, _, _ = self.datasource(resource)
+            indexed = set()
+            for index in self._collection(collection).indexes():
+                if index['type'] == 'primary':
+                    indexed.update(['_key', '_id'])
+                elif index['type'] == 'edge':
+                    indexed.update(index['fields'])
+                else:
+                    indexed.add(index['fields'][0])
+            missing = [
+                (field, count) for field, count in fields.most_common()
+                if field not in indexed
+            ]
+            if missing:
+                report[resource] = missing
+        return report
+
+    @instrumented
+    def find(self, resource, req, sub_resource_lookup, perform_count=True):
         """ Retrieves a set of documents (rows), matching the current request.
         Consumed when a request hits a collection/document endpoint
         (`/people/`).
@@ -79,57 +1468,423 @@ class ArangoDB(DataLayer):
                     to support with your driver. For example ``eve.io.Mongo``
                     supports both Python and Mongo-like query syntaxes.
         :param sub_resource_lookup: sub-resource lookup from the endpoint url.
+        :param perform_count: whether to return the number of matching
+                              documents along with the result, rather than
+                              None. Nothing is counted by the server when
+                              it isn't set.
         """
-        bind_vars = {}
-
-        filters = ''
-        if req and req.where:
-            groups = parse_where(req.where)
-            filters += 'FILTER '
-            for i, group in enumerate(groups):
-                key, op, val, sep = map(str.strip, group)
-                assert op in VALID_OPS
-                assert sep in VALID_SEPS
-                if val[0] == '"' and val[-1] == '"':
-                    val = val[1:-1]
-                bind_vars['key_%i' % i] = key
-                bind_vars['val_%i' % i] = val
-                filters += 'doc.@key_%i %s @val_%i' % (i, op, i)
-                if sep == ',':
-                    filters += '\nFILTER '
-                elif sep:
-                    filters += ' %s ' % sep
-
-        sort = ''
-        if req and req.sort:
-            sorts = []
-            fields = req.sort.split(',')
-            for i, field in enumerate(fields):
-                if field[0] == '-':
-                    bind_vars['sort_%i' % i] = field[1:].strip()
-                    sorts.append('doc.@sort_%i DESC' % i)
-                else:
-                    bind_vars['sort_%i' % i] = field.strip()
-                    sorts.append('doc.@sort_%i' % i)
-            sort += 'SORT ' + ', '.join(sorts)
+        references = self._references(req, sub_resource_lookup)
+        if references is not None:
+            return self._find_references(resource, *references)
+        query = self._find_query(resource, req, sub_resource_lookup,
+                                 perform_count)
+        # fullCount is only reported for queries with a LIMIT
+        cursor = self._execute(
+            query.query, bind_vars=query.bind_vars,
+            full_count=query.full_count,
+            count=query.full_count and not query.limit,
+            batch_size=self.batch_size, ttl=self.cursor_ttl
+        )
+        return self._with_count(self._find_result(query, cursor),
+                                perform_count)
 
-        skip = 0
-        limit = req.max_results
-        if req and req.page and req.max_results:
-            skip = (req.page - 1) * req.max_results or 0
+    @staticmethod
+    def _with_count(result, perform_count):
+        """ Returns a ``find`` result along with the number of matching
+        documents, or None if ``perform_count`` isn't set, as Eve unpacks
+        both even when it doesn't ask for the count.
+        """
+        return result, result.count() if perform_count else None
 
-        collection, _, _, _ = self.datasource(resource)
-        query = '''
+    @staticmethod
+    def _references(req, lookup):
+        """ Returns the field and values of the lookup of documents to embed,
+        which Eve makes without a request, or None for any other lookup.
+        """
+        return reference_lookup(lookup) if req is None else None
+
+    def _find_references(self, resource, field, values):
+        """ Returns the documents to embed whose ``field`` is one of
+        ``values``, along with their number as Eve expects whatever its
+        version. They are taken from the documents read along with the page
+        they are embedded into if all of them were, otherwise read with a
+        single query.
+        """
+        collection, lookup, projection, _ = self._datasource_ex(resource)
+        fields = keep_fields(projection)
+        documents = None
+        if not lookup:
+            documents = self._embedded_documents(collection, field, values)
+        if documents is not None:
+            documents = [keep(document, fields) for document in documents]
+        else:
+            try:
+                filters, bind_vars = compile_lookup(lookup)
+            except ValueError as e:
+                abort(400, description=debug_error_message(str(e)))
+            query = '''
         FOR doc IN @@collection
+            FILTER doc.@ref_key IN @ref_values
             %s
             %s
-            LIMIT %i, %i
-            RETURN doc
-        ''' % (filters, sort, skip, limit)
-        bind_vars['@collection'] = collection
-        cursor = self.db.aql.execute(query, bind_vars=bind_vars, full_count=True)
-        return ArangoResult(cursor)
+        ''' % (filters, compile_return(bool(fields)))
+            bind_vars.update({
+                '@collection': collection,
+                'ref_key': field.split('.') if '.' in field else field,
+                'ref_values': values,
+            })
+            if fields:
+                bind_vars['fields'] = fields
+            documents = list(self._execute(query, bind_vars=bind_vars))
+        plan = self._date_plan(resource)
+        with self.instrumentation.timer('convert'):
+            for document in documents:
+                to_python(document, plan)
+        return documents, len(documents)
+
+    @staticmethod
+    def _embedded_documents(collection, key, values):
+        """ Returns the documents of ``collection`` whose ``key`` is one of
+        ``values`` read along with the last page found in this request, or
+        None unless all of them were. The results are shared, callers must
+        copy them.
+        """
+        store = g.get('arango_embedded') if has_app_context() else None
+        if not store:
+            return None
+        documents, seen = [], set()
+        try:
+            for value in values:
+                if value in seen:
+                    continue
+                document = store.get((collection, key, value))
+                if document is None:
+                    return None
+                seen.add(value)
+                documents.append(document)
+        except TypeError:
+            return None
+        return documents
+
+    def _embedded_relations(self, resource, req):
+        """ Returns the ``(field, collection, key)`` of the references the
+        request embeds which ``find`` reads along with the documents, ``key``
+        being the attribute of the related documents referred to. Versioned
+        relations, references within related documents and resources with a
+        datasource filter or restricted access are left to Eve.
+        """
+        settings = config.DOMAIN.get(resource, {})
+        if not req or not (req.embedded or settings.get('embedded_fields')):
+            return []
+        relations = []
+        for field in resolve_embedded_fields(resource, req):
+            names = field.split('.')
+            parents = ['.'.join(names[:i]) for i in range(1, len(names))]
+            if any('data_relation' in (field_definition(resource, parent)
+                                       or {}) for parent in parents):
+                continue
+            relation = field_definition(resource, field)['data_relation']
+            if relation.get('version'):
+                continue
+            related = relation['resource']
+            collection, lookup, _, _ = self._datasource_ex(related)
+            if lookup:
+                continue
+            # Created by lazy provisioning, as the query reads from it
+            self._collection(collection)
+            key = relation.get('field') or config.DOMAIN[related]['id_field']
+            relations.append((field, collection, key))
+        return relations
+
+    def _find_query(self, resource, req, sub_resource_lookup,
+                    perform_count=True):
+        """ Builds the query run by ``find``, which only counts the matching
+        documents if ``perform_count`` is set. Needs the app context.
+        """
+        find = self._build_find_query(resource, req, sub_resource_lookup)
+        if not perform_count:
+            find.full_count = False
+            find.count = None
+        return find
+
+    def _build_find_query(self, resource, req, sub_resource_lookup):
+        where = req.where.strip() if req and req.where else None
+        sort = req.sort.strip() if req and req.sort else None
+        args = req.args if req and req.args else {}
+        settings = config.DOMAIN.get(resource, {})
+        keyset = settings.get('keyset_pagination', False)
+
+        after = args.get(self.keyset_param) if keyset else None
+        client_projection = self._client_projection(req)
+        # The sub resource lookup, merged with the datasource filter and the
+        # user-restricted access field
+        collection, lookup, projection, _ = self._datasource_ex(
+            resource, query=sub_resource_lookup or None,
+            client_projection=client_projection
+        )
+        handle = self._collection(collection)
+        try:
+            conditions = lookup_conditions(lookup)
+            where, where_vars = where_shape(where) if where else (None, {})
+        except ValueError as e:
+            # WhereSyntaxError included
+            abort(400, description=debug_error_message(str(e)))
+        if settings.get('traversal') and args.get(self.start_param):
+            return self._traversal_query(
+                resource, req, collection, settings, client_projection,
+                conditions, where, where_vars
+            )
+        fields = keep_fields(projection)
+        relations = self._embedded_relations(resource, req)
+        # No max_results (0 in a default ParsedRequest) means no limit
+        limit = req.max_results if req else None
+        shape = (
+            where, sort, keyset, bool(after), bool(fields), len(conditions),
+            tuple(key == '_key' for _, _, key in relations), bool(limit)
+        )
+        query, bind_vars = self._compile(compile_find, shape)
+        find = FindQuery(
+            resource, collection, shape, query, dict(bind_vars),
+            self._date_plan(resource)
+        )
+        find.timer = self.instrumentation.recorder()
+        bind_vars = find.bind_vars
+        bind_vars.update(where_vars)
+        bind_vars.update(bind_lookup(conditions))
+        # Where Eve's lookups of the documents to embed are answered from,
+        # until the next page is found
+        g.pop('arango_embedded', None)
+        if relations:
+            find.embedded = [
+                (related, key) for _, related, key in relations
+            ]
+            find.store = g.arango_embedded = {}
+            bind_vars.update(bind_embedded(relations))
+        if any(name.startswith('analyzer_') for name in bind_vars):
+            self._bind_search(collection, settings, bind_vars)
+
+        find.limit = limit
+        if keyset:
+            find.keyset = [field for field, _ in keyset_fields(sort)]
+            if fields:
+                # The continuation token is built from the sort values
+                fields = sorted(set(fields).union(
+                    field.split('.')[0] for field in find.keyset
+                ))
+            if after:
+                try:
+                    values = decode_token(after)
+                    if len(values) != len(find.keyset):
+                        raise ValueError('wrong number of sort values')
+                except ValueError:
+                    abort(400, description=debug_error_message(
+                        'Unable to parse continuation token'
+                    ))
+                for i, value in enumerate(values):
+                    bind_vars['after_%i' % i] = value
+            find.full_count = args.get(self.count_param) in ('1', 'true')
+        else:
+            skip = 0
+            if req and req.page and req.max_results:
+                skip = (req.page - 1) * req.max_results or 0
+            if settings.get('optimize_pagination_for_speed'):
+                find.full_count = False
+            elif settings.get('count_mode', self.count_mode) == 'approximate':
+                find.full_count = False
+                if not where and not conditions:
+                    find.count = handle.count
+                else:
+                    find.count_key = (collection, query, json.dumps(
+                        bind_vars, sort_keys=True, default=str
+                    ))
+                    find.count = self.count_cache.get(find.count_key)
+                    find.full_count = find.count is None
+            if limit:
+                bind_vars['skip'] = skip
+
+        self._record_fields(resource, bind_vars)
+        if '@view' not in bind_vars:
+            bind_vars['@collection'] = collection
+        if limit:
+            bind_vars['limit'] = limit
+        if fields:
+            bind_vars['fields'] = fields
+        return find
+
+    @staticmethod
+    def _bind_search(collection, settings, bind_vars):
+        """ Binds the view and analyzers of a query with SEARCH conditions.
+        """
+        search = settings.get('search')
+        if not search:
+            abort(400, description=debug_error_message(
+                'SEARCH is not supported by this resource'
+            ))
+        analyzers = search_fields(search)
+        for name in list(bind_vars):
+            if not name.startswith('analyzer_'):
+                continue
+            field = bind_vars['key_' + name[len('analyzer_'):]]
+            if not isinstance(field, str):
+                field = '.'.join(field)
+            if field not in analyzers:
+                abort(400, description=debug_error_message(
+                    'Attribute %s is not searchable' % field
+                ))
+            bind_vars[name] = analyzers[field]
+        bind_vars['@view'] = search_view(collection, search)
+
+    def _traversal_query(self, resource, req, collection, settings,
+                         client_projection, conditions, where, where_vars):
+        """ Builds the graph traversal run by ``find`` when the request names
+        a start vertex. The vertices found are filtered, sorted, paginated
+        and projected like documents. The resource's lookup ``conditions``
+        (its datasource filter, auth field and sub resource lookup) apply to
+        the edges followed, which are its documents. ``where`` is the shape
+        of the request's where expression, and ``where_vars`` its values.
+        """
+        traversal = settings['traversal']
+        if not isinstance(traversal, dict):
+            traversal = {}
+        args = req.args
+        sort = req.sort.strip() if req.sort else None
+
+        direction = args.get(
+            self.direction_param, traversal.get('direction', 'outbound')
+        ).lower()
+        if direction not in TRAVERSAL_DIRECTIONS:
+            abort(400, description=debug_error_message(
+                'Unknown traversal direction: %s' % direction
+            ))
+        try:
+            min_depth, max_depth = parse_depth(
+                args.get(self.depth_param, '1')
+            )
+            if max_depth > traversal.get('max_depth', 3):
+                raise ValueError('deeper than allowed')
+        except ValueError:
+            abort(400, description=debug_error_message(
+                'Unable to parse traversal depth'
+            ))
+        vertices = traversal.get('vertices', collection)
+        if isinstance(vertices, str):
+            vertices = [vertices]
+        start = args[self.start_param]
+        if '/' not in start:
+            start = '%s/%s' % (vertices[0], start)
+        elif start.split('/', 1)[0] not in vertices:
+            abort(400, description=debug_error_message(
+                'Traversals cannot start from %s' % start
+            ))
+        edges = traversal.get('edges') or [collection]
+        if isinstance(edges, str):
+            edges = [edges]
+        for edge_collection in edges:
+            self._collection(edge_collection)
+
+        # The resource's projection describes its own documents, not the
+        # vertices found, so only the client's projection applies.
+        fields = keep_fields(client_projection)
+        unique = traversal.get('unique_vertices', True)
+        shape = (
+            where, sort, direction, len(edges), bool(fields), unique,
+            len(conditions), bool(req.max_results)
+        )
+        query, bind_vars = self._compile(compile_traversal, shape)
+        find = FindQuery(
+            resource, collection, shape, query, dict(bind_vars),
+            self._date_plan(resource), compiler=compile_traversal
+        )
+        find.timer = self.instrumentation.recorder()
+        bind_vars = find.bind_vars
+        bind_vars.update(where_vars)
+        bind_vars.update(bind_lookup(conditions))
+        if settings.get('optimize_pagination_for_speed'):
+            find.full_count = False
+
+        find.limit = req.max_results
+        skip = 0
+        if req.page and req.max_results:
+            skip = (req.page - 1) * req.max_results or 0
+        bind_vars['start'] = start
+        bind_vars['min_depth'] = min_depth
+        bind_vars['max_depth'] = max_depth
+        for i, edge_collection in enumerate(edges):
+            bind_vars['@edges_%i' % i] = edge_collection
+        if req.max_results:
+            bind_vars['skip'] = skip
+            bind_vars['limit'] = req.max_results
+        if fields:
+            bind_vars['fields'] = fields
+        return find
+
+    def _compile(self, compiler, shape, **options):
+        """ Returns the query compiled by ``compiler`` for a request shape,
+        from the query cache.
+        """
+        key = (compiler.__name__,) + shape + tuple(sorted(options.items()))
+        try:
+            with self.instrumentation.timer('compile'):
+                return self.query_cache.get(
+                    key, lambda: compiler(*shape, **options)
+                )
+        except ValueError as e:
+            # Invalid where and sort expressions, WhereSyntaxError included
+            abort(400, description=debug_error_message(str(e)))
+
+    def _execute(self, query, bind_vars=None, **options):
+        """ Runs an AQL query, recording its time and statistics. """
+        start = time.perf_counter()
+        cursor = self.db.aql.execute(query, bind_vars=bind_vars, **options)
+        self.instrumentation.query(
+            query, bind_vars, time.perf_counter() - start,
+            cursor.statistics(), lambda: self._explain(query, bind_vars)
+        )
+        return cursor
+
+    def _explain(self, query, bind_vars=None):
+        """ Returns the execution plan of a query. The driver's
+        ``aql.explain`` can't be given bind variables.
+        """
+        request = Request(
+            method='post',
+            endpoint='/_api/explain',
+            data={'query': query, 'bindVars': bind_vars or {}}
+        )
+
+        def response_handler(response):
+            if not response.is_success:
+                raise AQLQueryExplainError(response, request)
+            return response.body['plan']
 
+        return self.db.aql._execute(request, response_handler)
+
+    def _count_query(self, find):
+        """ Returns the query and bind variables counting the documents
+        matched by a ``find`` query, ignoring its limit.
+        """
+        query, _ = self._compile(find.compiler, find.shape, count=True)
+        return query, used_bind_vars(query, find.bind_vars)
+
+    def _find_result(self, find, cursor, count=None):
+        """ Wraps the cursor of a ``find`` query, ``count`` being the number
+        of matching documents if it was counted separately.
+        """
+        if count is None and find.full_count:
+            count = (cursor.statistics() or {}).get('fullCount')
+            if count is None and not find.limit:
+                count = cursor.count()
+        if find.count_key and find.full_count:
+            self.count_cache.set(find.count_key, count)
+        if count is None:
+            count = find.count
+        return ArangoResult(
+            cursor, find.plan, keyset=find.keyset, limit=find.limit,
+            count=count, timer=find.timer, embedded=find.embedded,
+            store=find.store
+        )
+
+    @instrumented
     def find_one(self, resource, req, check_auth_value=True,
                  force_auth_field_projection=False, **lookup):
         """ Retrieves a single document/record. Consumed when a request hits an
@@ -155,11 +1910,98 @@ class ArangoDB(DataLayer):
                          id or, if alternate lookup is supported by the API,
                          the corresponding query.
         """
-        collection, _, _, _ = self.datasource(resource)
-        result = self.db.collection(collection).get(lookup)
-        processed_result = json.loads(json.dumps(result), object_hook=date_hook)
-        return processed_result
+        client_projection = self._client_projection(req)
+        collection, _, projection, _ = self._datasource_ex(
+            resource, client_projection=client_projection,
+            check_auth_value=check_auth_value,
+            force_auth_field_projection=force_auth_field_projection
+        )
+        handle = self._collection(collection)
+        fields = keep_fields(projection)
+        plan = self._date_plan(resource)
+        cache = self._document_cache(resource, lookup)
+        if cache is not None:
+            result = self._cached_get(cache, collection, lookup)
+            if result is None:
+                return None
+            with self.instrumentation.timer('convert'):
+                return to_python(keep(result, fields), plan)
+        revision_fields = self._revision_fields(resource, req)
+        if revision_fields:
+            # A conditional GET, answered without the document's body if
+            # the client's copy is current
+            query, bind_vars = self._lookup_query(
+                collection, lookup, revision_fields
+            )
+            result = next(self._execute(query, bind_vars=bind_vars), None)
+            if result is None or self._unchanged(req, result, plan):
+                return result
+        if fields:
+            query, bind_vars = self._lookup_query(collection, lookup, fields)
+            cursor = self._execute(query, bind_vars=bind_vars)
+            result = next(cursor, None)
+        else:
+            with self.instrumentation.timer('execute'):
+                result = handle.get(lookup)
+        if result is not None:
+            with self.instrumentation.timer('convert'):
+                to_python(result, plan)
+        return result
+
+    @staticmethod
+    def _revision_fields(resource, req):
+        """ Returns the attributes Eve needs to answer a conditional GET of
+        an item with 304, or None if the request isn't conditional, ETags
+        are disabled or the resource is versioned or embeds documents.
+        """
+        if not req or not (req.if_none_match or req.if_modified_since):
+            return None
+        settings = config.DOMAIN.get(resource, {})
+        if not config.IF_MATCH or settings.get('versioning') or \
+                settings.get('embedded_fields') or req.embedded:
+            return None
+        # Eve answers soft deleted documents with 404
+        return sorted(set(SYSTEM_ATTRIBUTES).union(
+            [config.ETAG, config.LAST_UPDATED, config.DELETED]
+        ))
+
+    @staticmethod
+    def _unchanged(req, document, plan):
+        """ Returns True if the client's copy of a document, as described by
+        the request's cache validators, is current. Without ETags Eve
+        compares none, and would serve the partial document.
+        """
+        to_python(document, plan)
+        if not config.IF_MATCH or config.ETAG not in document:
+            return False
+        if req.if_none_match and \
+                document.get(config.ETAG) != req.if_none_match:
+            return False
+        if req.if_modified_since:
+            updated = document.get(config.LAST_UPDATED)
+            if not isinstance(updated, datetime) or \
+                    updated > req.if_modified_since:
+                return False
+        return True
+
+    @staticmethod
+    def _lookup_query(collection, lookup, fields=None):
+        """ Returns the query and bind variables of a ``find_one`` lookup,
+        returning only ``fields`` if given.
+        """
+        filters, bind_vars = compile_lookup(lookup)
+        query = '''
+        FOR doc IN @@collection
+            %s
+            LIMIT 1
+            %s
+        ''' % (filters, compile_return(bool(fields)))
+        bind_vars['@collection'] = collection
+        if fields:
+            bind_vars['fields'] = fields
+        return query, bind_vars
 
+    @instrumented
     def find_one_raw(self, resource, **lookup):
         """ Retrieves a single, raw document. No projections or datasource
         filters are being applied here. Just looking up the document using the
@@ -168,9 +2010,80 @@ class ArangoDB(DataLayer):
         :param ** lookup: lookup query.
         """
         collection, _, _, _ = self.datasource(resource)
-        result = self.db.collection(collection).get(lookup)
+        cache = self._document_cache(resource, lookup)
+        if cache is not None:
+            result = self._cached_get(cache, collection, lookup)
+            return None if result is None else keep(result, None)
+        with self.instrumentation.timer('execute'):
+            result = self._collection(collection).get(lookup)
         return result
 
+    def _document_cache(self, resource, lookup=None):
+        """ Returns the document cache of a resource, or None if it has none
+        or ``lookup`` isn't by ``_key``.
+        """
+        source = self._cached_resources.get(resource)
+        if source is None or (lookup is not None and '_key' not in lookup):
+            return None
+        return self.document_caches[source]
+
+    def _cached_get(self, cache, collection, lookup):
+        """ Returns the cached document matching ``lookup``, fetching it on
+        a miss. If the cache is validated, a cached document is only served
+        if a revision-only lookup finds its ``_rev`` current. The result is
+        shared, callers must copy it.
+        """
+        key = str(lookup['_key'])
+        document = cache.get(key)
+        if document is not None and cache.validate:
+            query, bind_vars = self._lookup_query(
+                collection, {'_key': key}, ['_rev']
+            )
+            current = next(self._execute(query, bind_vars=bind_vars), None)
+            if current is None:
+                cache.pop(key)
+                return None
+            if current['_rev'] != document['_rev']:
+                cache.pop(key)
+                document = None
+        if document is None:
+            generation = cache.generation
+            with self.instrumentation.timer('execute'):
+                document = self._collection(collection).get(key)
+            if document is None:
+                return None
+            cache.add(key, document, generation)
+        for field, value in lookup.items():
+            if document.get(field) != value:
+                return None
+        return document
+
+    def _invalidate(self, collection, keys=None):
+        """ Drops documents written by this data layer from the cache of
+        their collection, or the whole cache if ``keys`` is None.
+        """
+        cache = self.document_caches.get(collection)
+        if cache is not None:
+            cache.invalidate(keys)
+
+    def _on_change(self, resource, keys):
+        """ Drops what the change feed reports as written from the caches.
+        Runs without an application context.
+        """
+        collection = self._sources[resource]
+        self._invalidate(collection, None if keys is None else list(keys))
+        self.count_cache.prune(lambda key: key[0] == collection)
+
+    def _invalidate_operations(self, operations):
+        keys = [
+            document_key(op.document) or document_key(op.result)
+            for op in operations
+        ]
+        self._invalidate(
+            operations[0].collection, [key for key in keys if key]
+        )
+
+    @instrumented
     def find_list_of_ids(self, resource, ids, client_projection=None):
         """ Retrieves a list of documents based on a list of primary keys
         The primary key is the field defined in `ID_FIELD`.
@@ -183,10 +2096,129 @@ class ArangoDB(DataLayer):
         :return: a list of documents matching the ids in `ids` from the
         collection specified in `resource`
         """
-        collection, _, _, _ = self.datasource(resource)
-        result = self.db.collection(collection).get_many(ids)
+        collection, _, projection, _ = self._datasource_ex(
+            resource, client_projection=client_projection
+        )
+        handle = self._collection(collection)
+        fields = keep_fields(projection)
+        cache = self._document_cache(resource)
+        if cache is not None:
+            result = self._cached_get_many(cache, collection, ids, fields)
+        elif fields:
+            query, bind_vars = self._ids_query(collection, ids, fields)
+            result = list(self._execute(query, bind_vars=bind_vars))
+        else:
+            with self.instrumentation.timer('execute'):
+                result = handle.get_many(ids)
+        plan = self._date_plan(resource)
+        with self.instrumentation.timer('convert'):
+            for document in result:
+                to_python(document, plan)
         return result
 
+    def _cached_get_many(self, cache, collection, ids, fields):
+        """ Returns copies of the documents with keys in ``ids``, reading
+        the ones not cached, or whose ``_rev`` a revision-only lookup finds
+        outdated if the cache is validated, with a single request.
+        """
+        documents = {}
+        missing = []
+        for key in ids:
+            document = cache.get(str(key))
+            if document is None:
+                missing.append(key)
+            else:
+                documents[str(key)] = document
+        if documents and cache.validate:
+            query, bind_vars = self._ids_query(
+                collection, list(documents), ['_key', '_rev']
+            )
+            current = {
+                document['_key']: document['_rev']
+                for document in self._execute(query, bind_vars=bind_vars)
+            }
+            missing += self._outdated(cache, documents, current)
+        if missing:
+            generation = cache.generation
+            with self.instrumentation.timer('execute'):
+                fetched = self._collection(collection).get_many(missing)
+            for document in fetched:
+                documents[document['_key']] = document
+                cache.add(document['_key'], document, generation)
+        return [
+            keep(documents[str(key)], fields)
+            for key in ids if str(key) in documents
+        ]
+
+    @staticmethod
+    def _outdated(cache, documents, revisions):
+        """ Drops the cached ``documents`` whose ``_rev`` differs from their
+        current one in ``revisions``, from them and from the cache. Returns
+        the keys of those still existing, to be read again.
+        """
+        outdated = []
+        for key, document in list(documents.items()):
+            revision = revisions.get(key)
+            if revision == document['_rev']:
+                continue
+            del documents[key]
+            cache.pop(key)
+            if revision is not None:
+                outdated.append(key)
+        return outdated
+
+    @staticmethod
+    def _ids_query(collection, ids, fields=None):
+        """ Returns the query and bind variables fetching the documents with
+        the keys in ``ids``, returning only ``fields`` if given.
+        """
+        query = '''
+        FOR doc IN @@collection
+            FILTER doc._key IN @keys
+            %s
+        ''' % compile_return(bool(fields))
+        bind_vars = {'@collection': collection, 'keys': ids}
+        if fields:
+            bind_vars['fields'] = fields
+        return query, bind_vars
+
+    @instrumented
+    def aggregate(self, resource, pipeline, options):
+        """ Runs the aggregation pipeline of a resource as a single AQL query,
+        with ``@@collection`` bound to the resource's collection. The rows are
+        streamed from the cursor as Eve reads them.
+        :param resource: resource being accessed.
+        :param pipeline: the pipeline from the resource's ``datasource``, with
+                         the request's parameters and Eve's pagination stages.
+                         Only those are read from it, the AQL is always the
+                         one declared in ``DOMAIN``.
+        :param options: the aggregation options, ``batch_size`` and ``ttl``
+                        override the cursor settings.
+        """
+        options = options or {}
+        collection, _, _, _ = self.datasource(resource)
+        self._collection(collection)
+        declared = config.DOMAIN[resource]['datasource']['aggregation']
+        try:
+            with self.instrumentation.timer('compile'):
+                query, bind_vars, facet = compile_aggregation(
+                    declared['pipeline'], pipeline
+                )
+        except ValueError as e:
+            abort(400, description=debug_error_message(str(e)))
+        bind_vars['@collection'] = collection
+        cursor = self._execute(
+            query, bind_vars=used_bind_vars(query, bind_vars),
+            count=True, full_count=True,
+            batch_size=options.get('batch_size', self.batch_size),
+            ttl=options.get('ttl', self.cursor_ttl)
+        )
+        return AggregationResult(
+            cursor, self._date_plan(resource), facet,
+            timer=self.instrumentation.recorder()
+        )
+
+    @instrumented
     def insert(self, resource, doc_or_docs):
         """ Inserts a document into a resource collection/table.
         :param resource: resource being accessed. You should then use
@@ -194,16 +2226,126 @@ class ArangoDB(DataLayer):
                          the actual datasource name.
         :param doc_or_docs: json document or list of json documents to be added
                             to the database.
+        :return: the ids of the documents inserted.
         """
         if isinstance(doc_or_docs, dict):
             doc_or_docs = [doc_or_docs]
 
-        data = json.loads(json.dumps(doc_or_docs, cls=self.json_encoder_class))
+        transaction = self._pending_transaction()
+        if transaction:
+            operations = [
+                transaction.insert(resource, doc) for doc in doc_or_docs
+            ]
+            try:
+                self._commit(transaction)
+            except ArangoServerError as e:
+                abort(
+                    409 if e.error_code == UNIQUE_CONSTRAINT_VIOLATED
+                    else 500,
+                    description=debug_error_message('Insert failed: %s' % e)
+                )
+            return self._inserted_ids(resource, operations)
 
-        collection, _, _, _ = self.datasource(resource)
-        result = self.db.collection(collection).insert_many(data)
-        return result
+        # Flushed when leaving the block, no need for the timer. The import
+        # API doesn't report the keys of the documents, which Eve needs.
+        with self.bulk(interval=0, use_import=False) as writer:
+            operations = [writer.insert(resource, doc) for doc in doc_or_docs]
+
+        errors = [
+            'document %i: %s' % (i, op.error)
+            for i, op in enumerate(operations) if op.error
+        ]
+        if errors:
+            conflict = any(
+                getattr(op.error, 'error_code', None) ==
+                UNIQUE_CONSTRAINT_VIOLATED for op in operations
+            )
+            abort(409 if conflict else 500, description=debug_error_message(
+                'Insert failed for %s' % '; '.join(errors)
+            ))
+        return self._inserted_ids(resource, operations)
+
+    @staticmethod
+    def _inserted_ids(resource, operations):
+        """ Returns the ids Eve gives the documents inserted by
+        ``operations``, their ``_key`` unless the resource's ``id_field`` is
+        another attribute ArangoDB reports, like ``_id``.
+        """
+        id_field = config.DOMAIN.get(resource, {}).get('id_field', '_key')
+        return [
+            op.result.get(id_field, op.result['_key']) for op in operations
+        ]
+
+    def bulk(self, size=None, interval=None, use_import=None):
+        """ Returns a ``BulkWriter`` batching writes to the collections of
+        the given resources. Documents are converted like in ``insert``.
+        Defaults are taken from the ``ARANGO_BULK_*`` settings.
+        :param size: the number of operations sent per request.
+        :param interval: seconds after which queued operations are flushed.
+        :param use_import: send inserts through the import API.
+        """
+        return BulkWriter(
+            self.db,
+            size=size or self.bulk_size,
+            interval=interval if interval is not None else self.bulk_interval,
+            use_import=(
+                use_import if use_import is not None else self.bulk_import
+            ),
+            resolve=lambda resource: self.datasource(resource)[0],
+            collection=self._collection,
+            encode=lambda document: to_arango(document, self._encode),
+            on_flush=self._invalidate_operations
+        )
 
+    def transaction(self, timeout=None, sync=None):
+        """ Returns a ``Transaction`` committing writes to the collections
+        of the given resources atomically, in a single request. Documents are
+        converted like in ``insert``. Defaults are taken from the
+        ``ARANGO_TRANSACTION_*`` settings.
+
+        Within a request, the same transaction is returned until it is
+        committed, and the request's next ``insert``, ``update`` or
+        ``replace`` commits it along with its own writes. Hooks like
+        ``on_insert_<resource>`` can thus add writes to other collections,
+        such as edges, to a bulk ``POST``.
+        :param timeout: seconds to wait for the collection locks.
+        :param sync: wait for the writes to be synchronised to disk.
+        """
+        transaction = self._pending_transaction()
+        if transaction is not None:
+            return transaction
+        transaction = Transaction(
+            self.db,
+            resolve=lambda resource: self._collection(
+                self.datasource(resource)[0]
+            ).name,
+            encode=lambda document: to_arango(document, self._encode),
+            timeout=timeout if timeout is not None
+            else self.transaction_timeout,
+            sync=sync if sync is not None else self.transaction_sync,
+            on_commit=self._invalidate_transaction
+        )
+        if has_app_context():
+            g.arango_transaction = transaction
+        return transaction
+
+    @staticmethod
+    def _pending_transaction():
+        """ Returns the transaction of the current request, if any. """
+        return g.get('arango_transaction') if has_app_context() else None
+
+    def _commit(self, transaction):
+        with self.instrumentation.timer('execute'):
+            return transaction.commit()
+
+    def _invalidate_transaction(self, operations):
+        by_collection = OrderedDict()
+        for op in operations:
+            by_collection.setdefault(op.collection, []).append(op)
+        for ops in by_collection.values():
+            self._invalidate_operations(ops)
+
+    @instrumented
     def update(self, resource, id_, updates, original):
         """ Updates a collection/table document/row.
         :param resource: resource being accessed. You should then use
@@ -220,12 +2362,35 @@ class ArangoDB(DataLayer):
         if updates and '_key' not in updates:
             updates['_key'] = id_
 
-        data = json.loads(json.dumps(updates, cls=self.json_encoder_class))
+        data = to_arango(updates, self._encode)
+        check_rev = bool(original and original.get('_rev'))
+        if check_rev:
+            data['_rev'] = original['_rev']
+
+        transaction = self._pending_transaction()
+        if transaction:
+            op = transaction.update(resource, data, check_rev=check_rev)
+            try:
+                self._commit(transaction)
+            except ArangoServerError as e:
+                if e.error_code == CONFLICT:
+                    raise self.OriginalChangedError()
+                raise
+            return op.result
 
         collection, _, _, _ = self.datasource(resource)
-        result = self.db.collection(collection).update(data)
+        try:
+            with self.instrumentation.timer('execute'):
+                result = self._collection(collection).update(
+                    data, check_rev=check_rev
+                )
+        except DocumentRevisionError:
+            raise self.OriginalChangedError()
+        finally:
+            self._invalidate(collection, [str(data['_key'])])
         return result
 
+    @instrumented
     def replace(self, resource, id_, document, original):
         """ Replaces a collection/table document/row.
         :param resource: resource being accessed. You should then use
@@ -241,13 +2406,36 @@ class ArangoDB(DataLayer):
         if document and '_key' not in document:
             document['_key'] = id_
 
-        data = json.loads(json.dumps(document, cls=self.json_encoder_class))
+        data = to_arango(document, self._encode)
+        check_rev = bool(original and original.get('_rev'))
+        if check_rev:
+            data['_rev'] = original['_rev']
+
+        transaction = self._pending_transaction()
+        if transaction:
+            op = transaction.replace(resource, data, check_rev=check_rev)
+            try:
+                self._commit(transaction)
+            except ArangoServerError as e:
+                if e.error_code == CONFLICT:
+                    raise self.OriginalChangedError()
+                raise
+            return op.result
 
         collection, _, _, _ = self.datasource(resource)
-        result = self.db.collection(collection).replace(data)
+        try:
+            with self.instrumentation.timer('execute'):
+                result = self._collection(collection).replace(
+                    data, check_rev=check_rev
+                )
+        except DocumentRevisionError:
+            raise self.OriginalChangedError()
+        finally:
+            self._invalidate(collection, [str(data['_key'])])
         return result
 
-    def remove(self, resource, lookup):
+    @instrumented
+    def remove(self, resource, lookup, progress=None):
         """ Removes a document/row or an entire set of documents/rows from a
         database collection/table.
         :param resource: resource being accessed. You should then use
@@ -257,11 +2445,65 @@ class ArangoDB(DataLayer):
                        to qualify for deletion. For single document deletes,
                        this is usually the unique id of the document to be
                        removed.
+        :param progress: called with the collection and the number of
+                         documents removed so far after each chunk.
+
+        The lookup, combined with the datasource filter, is compiled to an
+        AQL ``REMOVE`` query. If the resource sets ``remove_chunk_size`` (or
+        ``ARANGO_REMOVE_CHUNK_SIZE`` is set), documents are removed in
+        separate queries of that many documents each, which keeps large
+        deletes from timing out but is not atomic. Unfiltered deletes
+        truncate the collection. Returns the number of documents removed,
+        which for truncated collections is their count just before, so
+        writes landing in between make it approximate.
         """
-        collection, _, _, _ = self.datasource(resource)
-        result = self.db.collection(collection).delete_match(lookup)
-        return result
+        key = document_key(lookup)
+        collection, filter_, _, _ = self.datasource(resource)
+        if filter_:
+            lookup = self.combine_queries(lookup, filter_) if lookup \
+                else filter_
+        try:
+            conditions = lookup_conditions(lookup)
+        except ValueError as e:
+            abort(400, description=debug_error_message(str(e)))
+        handle = self._collection(collection)
+        try:
+            if not conditions:
+                # Counted separately, truncate doesn't report the number
+                with self.instrumentation.timer('execute'):
+                    removed = handle.count()
+                    handle.truncate()
+                if progress is not None:
+                    progress(collection, removed)
+                return removed
+
+            settings = config.DOMAIN.get(resource, {})
+            chunk_size = settings.get(
+                'remove_chunk_size', self.remove_chunk_size
+            )
+            query, _ = self._compile(
+                compile_remove, (len(conditions), bool(chunk_size))
+            )
+            bind_vars = bind_lookup(conditions)
+            bind_vars['@collection'] = collection
+            if chunk_size:
+                bind_vars['chunk_size'] = chunk_size
+            removed = 0
+            while True:
+                cursor = self._execute(query, bind_vars=bind_vars)
+                modified = cursor.statistics().get('modified', 0)
+                removed += modified
+                if progress is not None:
+                    progress(collection, removed)
+                if not chunk_size or modified < chunk_size:
+                    return removed
+        finally:
+            self._invalidate(collection, [key] if key else None)
+
+    def _date_plan(self, resource):
+        return self.date_plans.get(resource, self.default_plan)
 
+    @instrumented
     def is_empty(self, resource):
         """ Returns True if the collection is empty; False otherwise. While
         a user could rely on self.find() method to achieve the same result,
@@ -274,5 +2516,37 @@ class ArangoDB(DataLayer):
                          the ``datasource`` helper function to retrieve
                          the actual datasource name.
         """
-        collection, _, _, _ = self.datasource(resource)
-        return self.db.collection(collection).count() == 0
+        collection, lookup, _, _ = self._datasource_ex(resource)
+        self._collection(collection)
+        filters, bind_vars = compile_lookup(lookup)
+        query = '''
+        FOR doc IN @@collection
+            %s
+            LIMIT 1
+            RETURN true
+        ''' % filters
+        bind_vars['@collection'] = collection
+        cursor = self._execute(query, bind_vars=bind_vars)
+        return cursor.empty()
+
+    def combine_queries(self, query_a, query_b):
+        """ Returns the intersection of two lookups, combined with ``$and``
+        like in Eve's MongoDB layer.
+        """
+        return {'$and': [query_a, query_b]}
+
+    def get_value_from_query(self, query, field_name):
+        """ Returns the value a lookup, possibly combined with ``$and``,
+        requires for ``field_name``. Raises KeyError if it has none.
+        """
+        for field, value in lookup_conditions(query):
+            if field == field_name:
+                return value
+        raise KeyError(field_name)
+
+    def query_contains_field(self, query, field_name):
+        try:
+            self.get_value_from_query(query, field_name)
+        except KeyError:
+            return False
+        return True
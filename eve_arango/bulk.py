@@ -0,0 +1,170 @@
+import re
+from threading import RLock, Timer
+
+
+IMPORT_POSITION_RE = re.compile(r'at position (\d+)')
+
+
+class BulkImportError(Exception):
+    """ An error reported by the import API for a single document. """
+
+
+class BulkOperation:
+    """ A queued write. Once flushed, ``result`` holds the document metadata
+    returned by ArangoDB, or ``error`` the exception raised for this
+    document.
+    """
+
+    __slots__ = ('operation', 'collection', 'document', 'result', 'error')
+
+    def __init__(self, operation, collection, document):
+        self.operation = operation
+        self.collection = collection
+        self.document = document
+        self.result = None
+        self.error = None
+
+    def __repr__(self):
+        return '<BulkOperation %s %s>' % (self.operation, self.collection)
+
+    @property
+    def done(self):
+        return self.result is not None or self.error is not None
+
+
+class BulkWriter:
+    """ Queues inserts, updates, replaces and removes per collection and sends
+    each group in a single request. A collection's queue is flushed once it
+    holds ``size`` operations, when an operation of another kind is queued
+    for it (so writes are applied in order), when the oldest queued
+    operation is ``interval`` seconds old, or when ``flush`` is called.
+    Leaving a ``with`` block flushes and stops the writer.
+
+    :param db: the ``arango`` database to write to.
+    :param size: the number of operations sent per request.
+    :param interval: seconds after which queued operations are flushed by a
+                     background timer. ``None`` or 0 disables the timer.
+    :param use_import: send inserts through the import API, which is faster
+                       but only reports errors, not document metadata.
+    :param resolve: maps the names given to the writer to collection names.
+    :param encode: converts documents before they are queued.
+    :param collection: returns the handle of a collection by name, defaults
+                       to ``db.collection``.
+    :param on_flush: called with the operations of each request once sent.
+    """
+
+    def __init__(self, db, size=1000, interval=None, use_import=False,
+                 resolve=None, encode=None, collection=None, on_flush=None):
+        self.db = db
+        self.collection = collection or db.collection
+        self.size = size
+        self.interval = interval
+        self.use_import = use_import
+        self.resolve = resolve or (lambda name: name)
+        self.encode = encode or (lambda document: document)
+        self.on_flush = on_flush
+        self.errors = []
+        self._queues = {}
+        self._timer = None
+        self._lock = RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def insert(self, name, document):
+        return self._add('insert', name, self.encode(document))
+
+    def update(self, name, document):
+        return self._add('update', name, self.encode(document))
+
+    def replace(self, name, document):
+        return self._add('replace', name, self.encode(document))
+
+    def remove(self, name, document):
+        """ Queues the removal of a document, given as a key, id or a dict
+        holding either.
+        """
+        return self._add('remove', name, document)
+
+    def _add(self, operation, name, document):
+        collection = self.resolve(name)
+        op = BulkOperation(operation, collection, document)
+        with self._lock:
+            queue = self._queues.get(collection)
+            if queue and queue[0].operation != operation:
+                self._flush_collection(collection)
+                queue = None
+            if not queue:
+                queue = self._queues[collection] = []
+            queue.append(op)
+            if len(queue) >= self.size:
+                self._flush_collection(collection)
+            elif self.interval and self._timer is None:
+                self._timer = Timer(self.interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return op
+
+    def flush(self):
+        """ Sends all queued operations. Returns the flushed operations. """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            flushed = []
+            for collection in list(self._queues):
+                flushed.extend(self._flush_collection(collection))
+            return flushed
+
+    def close(self):
+        self.flush()
+
+    def _flush_collection(self, collection):
+        ops = self._queues.pop(collection, [])
+        if not ops:
+            return ops
+        documents = [op.document for op in ops]
+        operation = ops[0].operation
+        try:
+            handle = self.collection(collection)
+            if operation == 'insert' and self.use_import:
+                results = self._import(handle, documents)
+            elif operation == 'insert':
+                results = handle.insert_many(documents)
+            elif operation == 'update':
+                results = handle.update_many(documents)
+            elif operation == 'replace':
+                results = handle.replace_many(documents)
+            else:
+                results = handle.delete_many(documents)
+        except Exception as e:
+            # The whole request failed, so every operation in it did. Not
+            # raised, as the operations are already off the queue and a
+            # timer's flush has no caller to raise to.
+            results = [e] * len(ops)
+        for op, result in zip(ops, results):
+            if isinstance(result, Exception):
+                op.error = result
+                self.errors.append(op)
+            else:
+                op.result = result
+        if self.on_flush is not None:
+            self.on_flush(ops)
+        return ops
+
+    @staticmethod
+    def _import(handle, documents):
+        summary = handle.import_bulk(
+            documents, halt_on_error=False, details=True
+        )
+        results = [True] * len(documents)
+        for detail in summary.get('details', []):
+            match = IMPORT_POSITION_RE.search(detail)
+            if match:
+                position = int(match.group(1))
+                if position < len(results):
+                    results[position] = BulkImportError(detail)
+        return results
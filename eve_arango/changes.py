@@ -0,0 +1,185 @@
+import json
+from threading import Event, Lock, Thread
+
+from arango.exceptions import ArangoServerError
+from arango.request import Request
+
+from eve_arango.metrics import logger
+
+
+# Write-ahead log markers, as numbered by the replication API
+TRUNCATE_COLLECTION = 2004
+DROP_COLLECTION = 2001
+COMMIT_TRANSACTION = 2201
+ABORT_TRANSACTION = 2202
+WRITE_DOCUMENT = 2300
+REMOVE_DOCUMENT = 2302
+
+
+class ChangeFeedError(ArangoServerError):
+    """ Failed to read the write-ahead log. """
+
+
+class ChangeFeed:
+    """ Tails the write-ahead log of a database and tells listeners which
+    documents were inserted, updated, replaced or removed, whoever wrote
+    them. Writes made in a transaction are reported once it is committed.
+
+    Listeners are called with ``(resource, keys)`` for each resource reading
+    from a collection written to, ``keys`` being the set of keys written or
+    None if the whole collection may have changed (it was truncated or
+    dropped, or the log was read too late to know).
+
+    :param db: the ``arango`` database to follow.
+    :param resources: maps collection names to the resources reading from
+                      them. Writes to other collections are ignored.
+    :param interval: seconds to wait before reading the log again once all
+                     of it was read.
+    :param chunk_size: the largest response the server sends, in bytes.
+    :param tick: the tick to follow the log from, defaults to its end when
+                 the feed starts.
+    """
+
+    def __init__(self, db, resources, interval=1.0, chunk_size=None,
+                 tick=None):
+        self.db = db
+        self.resources = resources
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.tick = tick
+        self.listeners = []
+        # Writes of running transactions, by transaction id
+        self._transactions = {}
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread = None
+
+    def subscribe(self, listener):
+        """ Adds a listener, returning it so this can be used as decorator.
+        """
+        self.listeners.append(listener)
+        return listener
+
+    def start(self):
+        """ Follows the log from a background thread. """
+        if self._thread is None:
+            if self.tick is None:
+                self.tick = self.last_tick()
+            self._stopped.clear()
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                more = self.poll()
+            except Exception:
+                logger.exception('Failed to read the write-ahead log')
+                more = False
+            if not more:
+                self._stopped.wait(self.interval)
+
+    def last_tick(self):
+        """ Returns the tick of the last write in the log. """
+        request = Request(method='get', endpoint='/_api/wal/lastTick')
+
+        def response_handler(response):
+            if not response.is_success:
+                raise ChangeFeedError(response, request)
+            return response.body['tick']
+
+        return self.db._execute(request, response_handler)
+
+    def poll(self):
+        """ Reads the log once, from the last tick read, and calls the
+        listeners with what changed. Returns True if there is more to read.
+        """
+        with self._lock:
+            if self.tick is None:
+                self.tick = self.last_tick()
+            params = {'from': self.tick}
+            if self.chunk_size:
+                params['chunkSize'] = self.chunk_size
+            request = Request(
+                method='get', endpoint='/_api/wal/tail', params=params
+            )
+
+            def response_handler(response):
+                if not response.is_success:
+                    raise ChangeFeedError(response, request)
+                return response
+
+            response = self.db._execute(request, response_handler)
+            headers = response.headers
+            changes = {}
+            if headers.get('x-arango-replication-frompresent') == 'false':
+                # Writes were dropped from the log before they were read
+                self._transactions.clear()
+                changes = dict.fromkeys(self.resources)
+            for line in (response.raw_body or '').splitlines():
+                if line.strip():
+                    self._apply(json.loads(line), changes)
+            tick = headers.get('x-arango-replication-lastincluded')
+            if tick and tick != '0':
+                self.tick = tick
+            more = headers.get('x-arango-replication-checkmore') == 'true'
+        self._publish(changes)
+        return more
+
+    def _apply(self, entry, changes):
+        """ Adds the writes of a log entry to ``changes``, a set of keys (or
+        None) by collection.
+        """
+        kind = entry.get('type')
+        tid = entry.get('tid')
+        if kind == COMMIT_TRANSACTION:
+            for collection, key in self._transactions.pop(tid, ()):
+                _add(changes, collection, key)
+            return
+        if kind == ABORT_TRANSACTION:
+            self._transactions.pop(tid, None)
+            return
+        collection = entry.get('cname')
+        data = entry.get('data') or {}
+        if collection is None and '_id' in data:
+            collection = data['_id'].split('/', 1)[0]
+        if collection not in self.resources:
+            return
+        if kind in (WRITE_DOCUMENT, REMOVE_DOCUMENT):
+            key = data.get('_key')
+        elif kind in (TRUNCATE_COLLECTION, DROP_COLLECTION):
+            key = None
+        else:
+            return
+        if tid and tid != '0':
+            self._transactions.setdefault(tid, []).append((collection, key))
+        else:
+            _add(changes, collection, key)
+
+    def _publish(self, changes):
+        # The tick has moved on, so a listener that fails misses the
+        # change for good, but doesn't keep the others from hearing it
+        for collection, keys in changes.items():
+            for resource in self.resources[collection]:
+                for listener in self.listeners:
+                    try:
+                        listener(resource, None if keys is None else set(keys))
+                    except Exception:
+                        logger.exception(
+                            'Change feed listener failed for %s', resource
+                        )
+
+
+def _add(changes, collection, key):
+    if key is None:
+        changes[collection] = None
+    elif collection not in changes:
+        changes[collection] = {key}
+    elif changes[collection] is not None:
+        changes[collection].add(key)
@@ -0,0 +1,170 @@
+import itertools
+import re
+from collections import OrderedDict
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from arango.http import HTTPClient
+from arango.response import Response
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+from urllib3.util.retry import Retry
+
+
+CURSOR_RE = re.compile(r'/_api/cursor/([^/?]+)')
+
+STRATEGIES = ('roundrobin', 'leastloaded')
+
+MAX_PINNED_CURSORS = 10000
+
+# Methods sent again after the connection dropped, urllib3's default for
+# retries. Writes may have been applied before it did.
+IDEMPOTENT_METHODS = frozenset(
+    ['DELETE', 'GET', 'HEAD', 'OPTIONS', 'PUT', 'TRACE']
+)
+
+
+def connect_failed(error):
+    """ Returns True if a ``requests.ConnectionError`` was raised before
+    the request was sent, because no connection could be made.
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    if isinstance(reason, MaxRetryError):
+        reason = reason.reason
+    # NewConnectionError included
+    return isinstance(reason, ConnectTimeoutError)
+
+
+class PooledHTTPClient(HTTPClient):
+    """ A thread-safe HTTP client for ``ArangoClient`` which keeps a pool of
+    keep-alive connections per endpoint and spreads requests over several
+    coordinators.
+
+    Whatever host the driver was given, requests are sent to the endpoint
+    picked by ``strategy``, either ``'roundrobin'`` or ``'leastloaded'``
+    (fewest requests in flight). Follow-up requests for a cursor are sent to
+    the coordinator that created it. Requests that could not connect are
+    retried ``max_retries`` times, then sent to the next endpoint. Answers
+    of 503 are retried too, and requests whose connection dropped are sent
+    to the next endpoint, except for ``POST`` and ``PATCH`` requests which
+    the server may have applied.
+
+    :param endpoints: base URLs of the coordinators, like
+                      ``'http://localhost:8529'``.
+    :param strategy: how to pick an endpoint for each request.
+    :param pool_size: connections kept open per endpoint.
+    :param pool_block: wait for a free connection when all are in use,
+                       instead of opening one that is discarded afterwards.
+    :param max_retries: connection attempts retried per endpoint.
+    :param timeout: seconds to wait for the server, or a
+                    ``(connect, read)`` tuple. None waits forever.
+    :param keep_alive: reuse connections between requests.
+    """
+
+    def __init__(self, endpoints, strategy='roundrobin', pool_size=10,
+                 pool_block=False, max_retries=3, timeout=None,
+                 keep_alive=True):
+        if strategy not in STRATEGIES:
+            raise ValueError('Unknown endpoint strategy: %s' % strategy)
+        self.endpoints = [endpoint.rstrip('/') for endpoint in endpoints]
+        self.strategy = strategy
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self._session = requests.Session()
+        # urllib3 retries 503s only for its idempotent methods, a write may
+        # have been applied before the coordinator answered. Connection
+        # errors are retried for every method.
+        retries = Retry(
+            total=max_retries, connect=max_retries, read=0,
+            status=max_retries, status_forcelist=(503,),
+            backoff_factor=0.1, raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=len(self.endpoints), pool_maxsize=pool_size,
+            pool_block=pool_block, max_retries=retries
+        )
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._lock = Lock()
+        self._next = itertools.cycle(range(len(self.endpoints)))
+        self._in_flight = [0] * len(self.endpoints)
+        self._cursors = OrderedDict()
+
+    def _choose(self):
+        with self._lock:
+            start = next(self._next)
+            if self.strategy == 'leastloaded':
+                # Starting from the next endpoint in turn spreads ties
+                count = len(self.endpoints)
+                return min(
+                    ((start + i) % count for i in range(count)),
+                    key=lambda i: self._in_flight[i]
+                )
+            return start
+
+    def send_request(self, method, url, params=None, data=None, headers=None,
+                     auth=None):
+        parts = urlsplit(url)
+        path = url[len(parts.scheme) + len('://') + len(parts.netloc):]
+        cursor = CURSOR_RE.search(path)
+        with self._lock:
+            pinned = self._cursors.get(cursor.group(1)) if cursor else None
+        first = pinned if pinned is not None else self._choose()
+        attempts = [first] if pinned is not None else [
+            (first + i) % len(self.endpoints)
+            for i in range(len(self.endpoints))
+        ]
+
+        headers = dict(headers or {})
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+
+        for attempt, index in enumerate(attempts, 1):
+            with self._lock:
+                self._in_flight[index] += 1
+            try:
+                raw_resp = self._session.request(
+                    method=method,
+                    url=self.endpoints[index] + path,
+                    params=params,
+                    data=data,
+                    headers=headers,
+                    auth=auth,
+                    timeout=self.timeout
+                )
+                break
+            except requests.ConnectionError as e:
+                if attempt == len(attempts) or not (
+                        connect_failed(e) or
+                        method.upper() in IDEMPOTENT_METHODS):
+                    raise
+            finally:
+                with self._lock:
+                    self._in_flight[index] -= 1
+
+        response = Response(
+            method=raw_resp.request.method,
+            url=raw_resp.url,
+            headers=raw_resp.headers,
+            status_code=raw_resp.status_code,
+            status_text=raw_resp.reason,
+            raw_body=raw_resp.text,
+        )
+        self._track_cursor(method, path, cursor, index, response)
+        return response
+
+    def _track_cursor(self, method, path, cursor, index, response):
+        body = response.body if isinstance(response.body, dict) else {}
+        with self._lock:
+            if cursor:
+                if method == 'delete' or not body.get('hasMore'):
+                    self._cursors.pop(cursor.group(1), None)
+            elif path.endswith('/_api/cursor') and body.get('hasMore'):
+                self._cursors[body['id']] = index
+                # Cursors that are never exhausted or closed expire on the
+                # server, don't keep them around forever either.
+                while len(self._cursors) > MAX_PINNED_CURSORS:
+                    self._cursors.popitem(last=False)
@@ -0,0 +1,229 @@
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, local
+
+
+logger = logging.getLogger('eve_arango')
+
+# Cursor statistics summed per method, with their Prometheus metric names
+QUERY_STATS = (
+    ('scanned_full', 'eve_arango_documents_scanned_full_total',
+     'Documents read by full collection scans.'),
+    ('scanned_index', 'eve_arango_documents_scanned_index_total',
+     'Documents read from indexes.'),
+    ('filtered', 'eve_arango_documents_filtered_total',
+     'Documents read and then discarded by filters.'),
+    ('modified', 'eve_arango_documents_written_total',
+     'Documents written by queries.'),
+    ('execution_time', 'eve_arango_query_execution_seconds_total',
+     'Time the server spent executing queries.'),
+)
+
+
+def instrumented(method):
+    """ Times a data layer method taking the resource as first argument,
+    as the ``total`` phase. Phases recorded while it runs are attributed to
+    it.
+    """
+    @wraps(method)
+    def wrapper(self, resource, *args, **kwargs):
+        with self.instrumentation.method(method.__name__, resource):
+            return method(self, resource, *args, **kwargs)
+    return wrapper
+
+
+class Instrumentation:
+    """ Collects the time spent in each phase of the data layer methods:
+    ``compile`` (parsing and compiling queries), ``execute`` (waiting for
+    the server, including the first batch of a cursor), ``fetch`` (further
+    batches), ``convert`` (converting documents to Python) and ``total``.
+    Queries also add their cursor statistics.
+
+    Hooks are called with ``(method, resource, phase, seconds, details)``
+    for every phase recorded, ``details`` holding the ``query``,
+    ``bind_vars``, cursor ``stats`` and ``slow`` flag of executed queries.
+    Queries taking at least ``slow_query_time`` seconds are logged to the
+    ``eve_arango`` logger along with their plan, if ``explain`` is set.
+    """
+
+    def __init__(self, slow_query_time=None, explain=True):
+        self.slow_query_time = slow_query_time
+        self.explain = explain
+        self.hooks = []
+        # (method, resource, phase) -> [count, seconds]
+        self.timings = {}
+        # (stat, method) -> total
+        self.counters = Counter()
+        self._lock = Lock()
+        self._local = local()
+
+    def subscribe(self, hook):
+        """ Adds a hook, returning it so this can be used as decorator. """
+        self.hooks.append(hook)
+        return hook
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        """ The ``(method, resource)`` running in this thread. """
+        stack = self._stack()
+        return stack[-1] if stack else ('other', None)
+
+    @contextmanager
+    def method(self, method, resource):
+        stack = self._stack()
+        stack.append((method, resource))
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stack.pop()
+            self.record(
+                'total', time.perf_counter() - start, method, resource
+            )
+
+    @contextmanager
+    def timer(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - start)
+
+    def recorder(self):
+        """ Returns a function recording phases for the current method
+        later on, like when a result is iterated after it returned.
+        """
+        method, resource = self.current()
+        return lambda phase, seconds: self.record(
+            phase, seconds, method, resource
+        )
+
+    def record(self, phase, seconds, method=None, resource=None, **details):
+        if method is None:
+            method, resource = self.current()
+        key = (method, resource, phase)
+        with self._lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = [0, 0.0]
+            timing[0] += 1
+            timing[1] += seconds
+        for hook in self.hooks:
+            hook(method, resource, phase, seconds, details)
+
+    def query(self, query, bind_vars, seconds, stats, explain=None,
+              method=None, resource=None):
+        """ Records an AQL query, logging it if slow. ``explain`` returns
+        its plan. The query is recorded for the current method unless
+        ``method`` and ``resource`` are given.
+        """
+        if method is None:
+            method, resource = self.current()
+        stats = stats or {}
+        slow = (
+            self.slow_query_time is not None and
+            seconds >= self.slow_query_time
+        )
+        with self._lock:
+            self.counters['queries', method] += 1
+            if slow:
+                self.counters['slow_queries', method] += 1
+            for stat, _, _ in QUERY_STATS:
+                if stats.get(stat):
+                    self.counters[stat, method] += stats[stat]
+        if slow:
+            self._log_slow(method, resource, query, seconds, stats, explain)
+        self.record(
+            'execute', seconds, method, resource,
+            query=query, bind_vars=bind_vars, stats=stats, slow=slow
+        )
+
+    def _log_slow(self, method, resource, query, seconds, stats, explain):
+        plan = None
+        if self.explain and explain is not None:
+            try:
+                plan = explain()
+            except Exception as e:
+                plan = {'error': str(e)}
+        # Bind variables may hold user data, so they are left out
+        logger.warning(
+            'Slow query in %s of %s (%.3fs): %s\nstats: %s\nplan: %s',
+            method, resource, seconds, ' '.join(query.split()), stats,
+            summarize_plan(plan), extra={
+                'aql': query, 'stats': stats, 'plan': plan,
+                'duration': seconds
+            }
+        )
+
+    def prometheus(self):
+        """ Returns the timings and counters in the Prometheus text
+        exposition format.
+        """
+        with self._lock:
+            timings = sorted(
+                (key, list(value)) for key, value in self.timings.items()
+            )
+            counters = dict(self.counters)
+        lines = [
+            '# HELP eve_arango_phase_seconds Time spent in each phase of '
+            'the data layer methods.',
+            '# TYPE eve_arango_phase_seconds summary',
+        ]
+        for (method, resource, phase), (count, seconds) in timings:
+            labels = _labels(method=method, resource=resource, phase=phase)
+            lines.append('eve_arango_phase_seconds_count%s %i' % (
+                labels, count
+            ))
+            lines.append('eve_arango_phase_seconds_sum%s %r' % (
+                labels, seconds
+            ))
+        metrics = [
+            ('queries', 'eve_arango_queries_total', 'AQL queries executed.'),
+            ('slow_queries', 'eve_arango_slow_queries_total',
+             'AQL queries slower than the slow query time.'),
+        ] + list(QUERY_STATS)
+        for stat, name, description in metrics:
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s counter' % name)
+            for (counter, method), value in sorted(counters.items()):
+                if counter == stat:
+                    lines.append('%s%s %r' % (
+                        name, _labels(method=method), value
+                    ))
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join(
+        '%s="%s"' % (name, str(value or '').replace('\\', '\\\\')
+                     .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in sorted(labels.items())
+    )
+
+
+def summarize_plan(plan):
+    """ Returns a one line summary of an AQL execution plan: its nodes,
+    the indexes used and the estimated cost.
+    """
+    if not isinstance(plan, dict) or 'nodes' not in plan:
+        return str(plan)
+    nodes = []
+    for node in plan['nodes']:
+        indexes = [
+            '%s[%s]' % (index.get('type'), ','.join(index.get('fields', [])))
+            for index in node.get('indexes', [])
+        ]
+        nodes.append(node.get('type', '?') + (
+            ' ' + ' '.join(indexes) if indexes else ''
+        ))
+    return '%s; estimated cost %s' % (
+        ' -> '.join(nodes), plan.get('estimatedCost')
+    )
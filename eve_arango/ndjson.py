@@ -0,0 +1,228 @@
+""" Streaming NDJSON export and import of resources, one JSON document per
+line. Usable from Python with a running app's data layer, or from the
+command line::
+
+    eve-arango export settings.py people -o people.ndjson
+    eve-arango import settings.py people -i people.ndjson --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from eve import Eve
+
+from eve_arango.arangodb import (
+    ArangoDB, bind_lookup, compile_lookup_filters, lookup_conditions,
+    to_arango, to_python
+)
+from eve_arango.bulk import IMPORT_POSITION_RE
+
+
+IMPORT_COUNTS = ('created', 'errors', 'empty', 'updated', 'ignored')
+
+
+def read_ndjson(fp):
+    """ Yields ``(line_number, document)`` for the non-empty lines of an
+    NDJSON file. Raises ValueError for lines that are not JSON objects.
+    """
+    for number, line in enumerate(fp, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            document = json.loads(line)
+        except ValueError as e:
+            raise ValueError('Invalid JSON on line %i: %s' % (number, e))
+        if not isinstance(document, dict):
+            raise ValueError('Expected an object on line %i' % number)
+        yield number, document
+
+
+def write_ndjson(documents, fp, default=None):
+    """ Writes documents to an NDJSON file, returning how many. ``default``
+    encodes values JSON does not support natively, as in ``json.dumps``.
+    """
+    count = 0
+    for document in documents:
+        fp.write(json.dumps(
+            document, ensure_ascii=False, separators=(',', ':'),
+            default=default
+        ))
+        fp.write('\n')
+        count += 1
+    return count
+
+
+def chunks(iterable, size):
+    """ Yields lists of at most ``size`` items of ``iterable``. """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_resource(data_layer, resource, fp, lookup=None, batch_size=1000):
+    """ Writes the documents of a resource, filtered by ``lookup`` and the
+    datasource filter, to ``fp`` as NDJSON. Documents are read through a
+    streaming cursor ``batch_size`` at a time, so memory use does not grow
+    with the collection. They are converted like the results of ``find``
+    and written with the JSON encoder of the data layer, without ``_id`` and
+    ``_rev``, so that ``import_resource`` reads them back unchanged. Returns
+    the number of documents written. Needs the app context.
+    """
+    collection, filter_, _, _ = data_layer.datasource(resource)
+    if filter_:
+        lookup = data_layer.combine_queries(lookup, filter_) if lookup \
+            else filter_
+    conditions = lookup_conditions(lookup)
+    query = '''
+        FOR doc IN @@collection
+            %s
+            RETURN UNSET(doc, '_id', '_rev')
+        ''' % compile_lookup_filters(len(conditions))
+    bind_vars = bind_lookup(conditions)
+    bind_vars['@collection'] = collection
+    plan = data_layer._date_plan(resource)
+    with data_layer.instrumentation.method('export_resource', resource):
+        cursor = data_layer._execute(
+            query, bind_vars=bind_vars, batch_size=batch_size,
+            ttl=data_layer.cursor_ttl, stream=True
+        )
+        try:
+            documents = (to_python(document, plan) for document in cursor)
+            return write_ndjson(documents, fp, default=data_layer._encode)
+        finally:
+            cursor.close(ignore_missing=True)
+
+
+def import_resource(data_layer, resource, fp, chunk_size=1000, workers=4,
+                    on_duplicate='error'):
+    """ Imports the NDJSON documents in ``fp`` into a resource's collection
+    through the import API, ``chunk_size`` documents per request and up to
+    ``workers`` requests at a time. At most twice as many chunks as workers
+    are held in memory. Documents are converted like inserts.
+    ``on_duplicate`` is passed on to ArangoDB (``error``, ``update``,
+    ``replace`` or ``ignore``).
+
+    Returns the summed counts of the import API (``created``, ``errors``,
+    ``empty``, ``updated`` and ``ignored``) and its error ``details``,
+    prefixed with their line numbers. Chunks sent before an invalid line is
+    read stay imported. Needs the app context.
+    """
+    collection, _, _, _ = data_layer.datasource(resource)
+    handle = data_layer._collection(collection)
+
+    def send(chunk):
+        documents = [
+            to_arango(document, data_layer._encode) for _, document in chunk
+        ]
+        result = handle.import_bulk(
+            documents, halt_on_error=False, details=True,
+            on_duplicate=on_duplicate
+        )
+        return [number for number, _ in chunk], result
+
+    totals = dict.fromkeys(IMPORT_COUNTS, 0)
+    details = []
+
+    def collect(futures):
+        for future in futures:
+            numbers, result = future.result()
+            for count in IMPORT_COUNTS:
+                totals[count] += result.get(count, 0)
+            for detail in result.get('details', []):
+                number = numbers[0]
+                match = IMPORT_POSITION_RE.search(detail)
+                if match and int(match.group(1)) < len(numbers):
+                    number = numbers[int(match.group(1))]
+                details.append((number, 'line %i: %s' % (number, detail)))
+
+    try:
+        with data_layer.instrumentation.method('import_resource', resource), \
+                ThreadPoolExecutor(workers) as executor:
+            pending = set()
+            for chunk in chunks(read_ndjson(fp), chunk_size):
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(send, chunk))
+            collect(pending)
+    finally:
+        data_layer._invalidate(collection)
+    # Chunks finish in any order
+    totals['details'] = [detail for _, detail in sorted(details)]
+    return totals
+
+
+def main(argv=None):
+    """ Command line entry point, ``eve-arango export|import``. """
+    parser = argparse.ArgumentParser(
+        prog='eve-arango',
+        description='Export or import resources as NDJSON.'
+    )
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    export = commands.add_parser('export', help='write a resource to NDJSON')
+    imports = commands.add_parser('import', help='load NDJSON into a resource')
+    for command in (export, imports):
+        command.add_argument('settings', help='path to the Eve settings file')
+        command.add_argument('resource', help='name of the DOMAIN resource')
+    export.add_argument(
+        '-o', '--output', default='-', help='file to write, default stdout'
+    )
+    export.add_argument('--batch-size', type=int, default=1000)
+    imports.add_argument(
+        '-i', '--input', default='-', help='file to read, default stdin'
+    )
+    imports.add_argument('--chunk-size', type=int, default=1000)
+    imports.add_argument('--workers', type=int, default=4)
+    imports.add_argument(
+        '--on-duplicate', default='error',
+        choices=['error', 'update', 'replace', 'ignore']
+    )
+    args = parser.parse_args(argv)
+
+    app = Eve(settings=os.path.abspath(args.settings), data=ArangoDB)
+    if args.resource not in app.config['DOMAIN']:
+        parser.error('unknown resource: %s' % args.resource)
+    with app.app_context():
+        if args.command == 'export':
+            fp = sys.stdout if args.output == '-' else open(
+                args.output, 'w', encoding='utf-8'
+            )
+            try:
+                count = export_resource(
+                    app.data, args.resource, fp, batch_size=args.batch_size
+                )
+            finally:
+                if fp is not sys.stdout:
+                    fp.close()
+            print('exported %i documents' % count, file=sys.stderr)
+            return 0
+        fp = sys.stdin if args.input == '-' else open(
+            args.input, encoding='utf-8'
+        )
+        try:
+            result = import_resource(
+                app.data, args.resource, fp, chunk_size=args.chunk_size,
+                workers=args.workers, on_duplicate=args.on_duplicate
+            )
+        finally:
+            if fp is not sys.stdin:
+                fp.close()
+        for detail in result['details']:
+            print(detail, file=sys.stderr)
+        print(', '.join(
+            '%s %s' % (result[name], name) for name in IMPORT_COUNTS
+        ), file=sys.stderr)
+        return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+from threading import RLock
+
+from arango.exceptions import ArangoError
+
+from eve_arango.bulk import BulkOperation
+
+
+# Applies the queued steps in order, and aborts the whole transaction on the
+# first document that failed, as multi-document operations don't raise
+COMMAND = '''
+function (params) {
+    var arangodb = require('@arangodb');
+    return params.steps.map(function (step) {
+        var collection = arangodb.db._collection(step.collection);
+        var documents = step.documents;
+        var results = step.operation === 'insert' ||
+            step.operation === 'remove'
+            ? collection[step.operation](documents, step.options)
+            : collection[step.operation](documents, documents, step.options);
+        results.forEach(function (result, i) {
+            if (result.error) {
+                throw new arangodb.ArangoError({
+                    errorNum: result.errorNum,
+                    errorMessage: step.operation + ' in ' + step.collection +
+                        ', document ' + i + ': ' + result.errorMessage
+                });
+            }
+        });
+        return results.map(function (result) {
+            return {_id: result._id, _key: result._key, _rev: result._rev};
+        });
+    });
+}
+'''
+
+
+class Transaction:
+    """ Queues writes to any number of collections and commits them as a
+    single ArangoDB transaction, in one request: either every write is
+    applied, or none is. Consecutive operations of the same kind on the same
+    collection are sent together. Leaving a ``with`` block commits, unless
+    it raised, in which case the queued writes are discarded.
+
+    Once committed, each operation holds its document metadata in
+    ``result``. If the transaction failed, ``commit`` raises the
+    ``ArangoError`` and every operation holds it in ``error``.
+
+    :param db: the ``arango`` database to write to.
+    :param resolve: maps the names given to the transaction to collection
+                    names.
+    :param encode: converts documents before they are queued.
+    :param timeout: seconds to wait for the collection locks.
+    :param sync: wait for the writes to be synchronised to disk.
+    :param on_commit: called with the operations once committed.
+    """
+
+    def __init__(self, db, resolve=None, encode=None, timeout=None,
+                 sync=None, on_commit=None):
+        self.db = db
+        self.resolve = resolve or (lambda name: name)
+        self.encode = encode or (lambda document: document)
+        self.timeout = timeout
+        self.sync = sync
+        self.on_commit = on_commit
+        self._operations = []
+        self._lock = RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+    def __len__(self):
+        return len(self._operations)
+
+    def insert(self, name, document):
+        return self._add('insert', name, self.encode(document))
+
+    def update(self, name, document, check_rev=False):
+        """ Queues the update of a document, which fails the transaction
+        if ``check_rev`` is set and its ``_rev`` is not current.
+        """
+        return self._add('update', name, self.encode(document), check_rev)
+
+    def replace(self, name, document, check_rev=False):
+        return self._add('replace', name, self.encode(document), check_rev)
+
+    def remove(self, name, document):
+        """ Queues the removal of a document, given as a key, id or a dict
+        holding either.
+        """
+        return self._add('remove', name, document)
+
+    def _add(self, operation, name, document, check_rev=False):
+        op = BulkOperation(operation, self.resolve(name), document)
+        with self._lock:
+            self._operations.append((op, check_rev))
+        return op
+
+    def abort(self):
+        """ Discards the queued operations. """
+        with self._lock:
+            self._operations = []
+
+    def commit(self):
+        """ Sends the queued operations. Returns them. """
+        with self._lock:
+            queued, self._operations = self._operations, []
+        if not queued:
+            return []
+        # Runs of operations of the same kind on a collection, sent together
+        steps, groups, kind = [], [], None
+        for op, check_rev in queued:
+            if kind != (op.collection, op.operation, check_rev):
+                kind = (op.collection, op.operation, check_rev)
+                steps.append({
+                    'collection': op.collection,
+                    'operation': op.operation,
+                    'documents': [],
+                    'options': {
+                        'ignoreRevs': not check_rev,
+                        'waitForSync': bool(self.sync),
+                    },
+                })
+                groups.append([])
+            steps[-1]['documents'].append(op.document)
+            groups[-1].append(op)
+
+        operations = [op for op, _ in queued]
+        try:
+            results = self.db.execute_transaction(
+                COMMAND, params={'steps': steps},
+                write=sorted(set(step['collection'] for step in steps)),
+                sync=self.sync, timeout=self.timeout
+            )
+        except ArangoError as e:
+            for op in operations:
+                op.error = e
+            raise
+        for ops, step_results in zip(groups, results):
+            for op, result in zip(ops, step_results):
+                op.result = result
+        if self.on_commit is not None:
+            self.on_commit(operations)
+        return operations
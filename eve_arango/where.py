@@ -0,0 +1,257 @@
+import re
+from functools import lru_cache
+
+
+VALID_OPS = [
+    '==', '!=', '<', '<=', '>', '>=',
+    'IN', 'NOT IN', 'LIKE', 'NOT LIKE', '=~', '!~'
+]
+
+VALID_SEPS = [',', 'AND', 'OR']
+
+# Functions of an attribute and a value, GEO_DISTANCE is compared to a number
+FUNCTIONS = ['FULLTEXT', 'SEARCH', 'GEO_CONTAINS', 'GEO_DISTANCE']
+DISTANCE_OPS = ['<', '<=', '>', '>=']
+
+# Parenthesised groups and arrays nested deeper than this are rejected
+MAX_DEPTH = 32
+
+WHITESPACE_RE = re.compile(r'\s*')
+PATH_RE = re.compile(r'[\w-]+(?:\.[\w-]+)*')
+SYMBOL_OP_RE = re.compile(r'==|!=|<=|>=|=~|!~|<|>')
+WORD_OP_RE = re.compile(r'(?:(NOT)\s+)?(IN|LIKE)(?![\w-])')
+NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?')
+STRING_RE = re.compile(
+    r'"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'', re.S
+)
+ESCAPE_RE = re.compile(r'\\(.)', re.S)
+# Constants may be followed by a keyword, but not by more of a name
+CONSTANT_RE = re.compile(r'(true|false|null)(?![a-z\d_-])')
+NOT_RE = re.compile(r'NOT(?=[\s(])')
+NAME_CHAR_RE = re.compile(r'[\w-]')
+FUNCTION_RE = re.compile(r'(%s)\s*\(' % '|'.join(FUNCTIONS))
+DISTANCE_OP_RE = re.compile(r'<=|>=|<|>')
+CONSTANTS = {'true': True, 'false': False, 'null': None}
+
+
+class WhereSyntaxError(ValueError):
+    """ Raised for ``where`` expressions that cannot be parsed. """
+
+    def __init__(self, message, where, position):
+        super().__init__('%s at position %i of where clause' % (
+            message, position
+        ))
+        self.where = where
+        self.position = position
+
+
+@lru_cache(maxsize=1024)
+def parse_where(where):
+    """ Parses a ``where`` expression into a tuple of the conditions
+    separated by commas, each a tree of nodes:
+
+    - ``('OR', node, node, ...)`` and ``('AND', node, node, ...)``, holding
+      all the terms of a chain of ORs or ANDs
+    - ``('NOT', node)``
+    - ``('CMP', path, operator, value)``, ``path`` being a tuple of
+      attribute names and ``value`` a string, number, boolean, None, or a
+      tuple of values.
+    - ``('CALL', function, path, value)`` for ``FULLTEXT(path, "query")``,
+      ``SEARCH(path, "text")`` and ``GEO_CONTAINS(path, [[lng, lat], ...])``
+      (a polygon).
+    - ``('DISTANCE', path, point, operator, value)`` for
+      ``GEO_DISTANCE(path, [lng, lat]) < meters``.
+
+    NOT binds tighter than AND, which binds tighter than OR. Keywords may be
+    written without spaces around them (``numIN[1,2]``, ``yearNOT IN[1]``,
+    ``a==1ANDb==2``), so an attribute cannot end in NOT before IN or LIKE.
+    AND and OR followed by more of a name are only keywords if written
+    right after the previous value (``a==1 ANDROID==2`` is rejected).
+    Parsing takes time linear in the length of the expression, and trees
+    are memoised.
+    """
+    return _Parser(where).parse()
+
+
+class _Parser:
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def error(self, message):
+        raise WhereSyntaxError(message, self.text, self.pos)
+
+    def skip(self):
+        self.pos = WHITESPACE_RE.match(self.text, self.pos).end()
+
+    def match(self, pattern):
+        self.skip()
+        match = pattern.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+        return match
+
+    def accept(self, literal):
+        self.skip()
+        if self.text.startswith(literal, self.pos):
+            self.pos += len(literal)
+            return True
+        return False
+
+    def keyword(self, word):
+        """ Accepts AND or OR. Glued to the start of a name, they must also
+        be glued to the end of the previous value.
+        """
+        start = self.pos
+        self.skip()
+        end = self.pos + len(word)
+        if not self.text.startswith(word, self.pos) or (
+                self.pos > start and NAME_CHAR_RE.match(self.text, end)):
+            # Left where it was, to tell whether the next keyword is glued
+            self.pos = start
+            return False
+        self.pos = end
+        return True
+
+    def parse(self):
+        conditions = [self.disjunction(0)]
+        while self.accept(','):
+            conditions.append(self.disjunction(0))
+        self.skip()
+        if self.pos != len(self.text):
+            self.error('Unexpected %r' % self.text[self.pos])
+        return tuple(conditions)
+
+    def disjunction(self, depth):
+        nodes = [self.conjunction(depth)]
+        while self.keyword('OR'):
+            nodes.append(self.conjunction(depth))
+        return nodes[0] if len(nodes) == 1 else ('OR',) + tuple(nodes)
+
+    def conjunction(self, depth):
+        nodes = [self.negation(depth)]
+        while self.keyword('AND'):
+            nodes.append(self.negation(depth))
+        return nodes[0] if len(nodes) == 1 else ('AND',) + tuple(nodes)
+
+    def negation(self, depth):
+        if self.match(NOT_RE):
+            if depth >= MAX_DEPTH:
+                self.error('Too deeply nested')
+            return ('NOT', self.negation(depth + 1))
+        return self.primary(depth)
+
+    def primary(self, depth):
+        if self.accept('('):
+            if depth >= MAX_DEPTH:
+                self.error('Too deeply nested')
+            node = self.disjunction(depth + 1)
+            if not self.accept(')'):
+                self.error('Expected )')
+            return node
+        function = self.match(FUNCTION_RE)
+        if function:
+            return self.call(function.group(1))
+        return self.comparison()
+
+    def call(self, function):
+        path = self.match(PATH_RE)
+        if not path:
+            self.error('Expected an attribute')
+        path = tuple(path.group().split('.'))
+        if any(not name for name in path):
+            self.error('Invalid attribute')
+        if not self.accept(','):
+            self.error('Expected ,')
+        value = self.value(0)
+        if function in ('FULLTEXT', 'SEARCH'):
+            if not isinstance(value, str):
+                self.error('Expected a string')
+        elif function == 'GEO_DISTANCE':
+            if not _is_point(value):
+                self.error('Expected a [longitude, latitude] point')
+        elif not (isinstance(value, tuple) and len(value) >= 3 and
+                  all(_is_point(point) for point in value)):
+            self.error('Expected a polygon')
+        if not self.accept(')'):
+            self.error('Expected )')
+        if function != 'GEO_DISTANCE':
+            return ('CALL', function, path, value)
+        operator = self.match(DISTANCE_OP_RE)
+        if not operator:
+            self.error('Expected a comparison')
+        distance = self.value(0)
+        if not _is_number(distance):
+            self.error('Expected a distance')
+        return ('DISTANCE', path, value, operator.group(), distance)
+
+    def comparison(self):
+        path = self.match(PATH_RE)
+        if not path:
+            self.error('Expected an attribute')
+        path = path.group()
+        operator = self.match(SYMBOL_OP_RE)
+        if operator:
+            operator = operator.group()
+        else:
+            operator = self.match(WORD_OP_RE)
+            if operator:
+                negated, operator = operator.groups()
+            else:
+                # The operator is written without a space before it
+                negated = None
+                for suffix in ('IN', 'LIKE'):
+                    if path.endswith(suffix) and len(path) > len(suffix):
+                        path, operator = path[:-len(suffix)], suffix
+                        break
+                else:
+                    self.error('Expected an operator')
+            # NOT written without a space after the attribute
+            if not negated and path.endswith('NOT') and len(path) > 3:
+                path, negated = path[:-3], 'NOT'
+            if negated:
+                operator = 'NOT ' + operator
+        path = tuple(path.split('.'))
+        if any(not name for name in path):
+            self.error('Invalid attribute')
+        return ('CMP', path, operator, self.value(0))
+
+    def value(self, depth):
+        string = self.match(STRING_RE)
+        if string:
+            body = string.group(1)
+            if body is None:
+                body = string.group(2)
+            return ESCAPE_RE.sub(r'\1', body)
+        number = self.match(NUMBER_RE)
+        if number:
+            number = number.group()
+            if number.lstrip('-').isdigit():
+                return int(number)
+            return float(number)
+        constant = self.match(CONSTANT_RE)
+        if constant:
+            return CONSTANTS[constant.group()]
+        if self.accept('['):
+            if depth >= MAX_DEPTH:
+                self.error('Too deeply nested')
+            values = []
+            if not self.accept(']'):
+                values.append(self.value(depth + 1))
+                while self.accept(','):
+                    values.append(self.value(depth + 1))
+                if not self.accept(']'):
+                    self.error('Expected ]')
+            return tuple(values)
+        self.error('Expected a value')
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_point(value):
+    return isinstance(value, tuple) and len(value) == 2 and all(
+        _is_number(coordinate) for coordinate in value
+    )
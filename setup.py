@@ -15,6 +15,10 @@ setup(
     packages=['eve_arango'],
     include_package_data=True,
     install_requires=['Eve', 'python-arango'],
+    extras_require={'async': ['aiohttp']},
+    entry_points={
+        'console_scripts': ['eve-arango = eve_arango.ndjson:main'],
+    },
     tests_require=['pylint', 'pytest'],
     classifiers=[
         'Development Status :: 3 - Alpha',
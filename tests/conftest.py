@@ -0,0 +1,44 @@
+import os
+import json
+
+import pytest
+
+from arango import ArangoClient
+from eve import Eve
+
+from eve_arango.arangodb import ArangoDB
+
+
+@pytest.fixture(scope='module')
+def app():
+    app = Eve(settings='test_settings.py')
+
+    test_app = app.test_client()
+    context = app.app_context()
+
+    context.push()
+    yield test_app.application
+    context.pop()
+
+
+@pytest.fixture(scope='module')
+def data_layer(app):
+    # DELETES the database before tests!
+    db = 'test_database_disposable'
+    host = app.config.get('ARANGO_HOST')
+    port = app.config.get('ARANGO_PORT')
+    client = ArangoClient(host=host, port=port)
+    if client.db('_system').has_database(db):
+        client.db('_system').delete_database(db)
+
+    data_layer = ArangoDB(app)
+
+    file_path = os.path.dirname(os.path.abspath(__file__))
+    json_path = os.path.join(file_path, 'test_data.json')
+    with open(json_path, 'r') as json_file:
+        test_data = json.load(json_file)
+
+        for collection, obj in test_data.items():
+            data_layer.db.collection(collection).insert(obj)
+
+    return data_layer
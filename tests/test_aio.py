@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+from eve.utils import ParsedRequest
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from eve_arango.aio import (
+    AsyncArangoDB, AsyncArangoError, AsyncCursor, AsyncHTTPClient,
+    EventLoopThread
+)
+from eve_arango.arangodb import ArangoResult
+from eve_arango.metrics import Instrumentation
+
+
+ENDPOINTS = ['http://db1:8529', 'http://db2:8529']
+
+
+class MockResponse:
+
+    def __init__(self, status, body):
+        self.status = status
+        self.reason = 'OK' if status < 400 else 'Error'
+        self.body = body
+
+    async def json(self, content_type='application/json'):
+        return self.body
+
+
+class MockSession:
+
+    def __init__(self, down=(), dropping=()):
+        self.down = down
+        self.dropping = dropping
+        self.requests = []
+
+    async def request(self, method, url, json=None):
+        if any(url.startswith(endpoint) for endpoint in self.down):
+            raise aiohttp.ClientConnectorError(None, OSError(111, url))
+        self.requests.append((method, url, json))
+        if any(url.startswith(endpoint) for endpoint in self.dropping):
+            raise aiohttp.ServerDisconnectedError()
+        if url.endswith('/_api/cursor'):
+            return MockResponse(201, {
+                'id': '42', 'result': [1, 2], 'hasMore': True,
+                'extra': {'stats': {'fullCount': 5, 'scannedIndex': 2}}
+            })
+        if url.endswith('/missing'):
+            return MockResponse(404, {
+                'error': True, 'errorNum': 1203, 'errorMessage': 'not found'
+            })
+        return MockResponse(200, {'result': [3], 'hasMore': False})
+
+
+def client(down=(), dropping=()):
+    http_client = AsyncHTTPClient(ENDPOINTS, 'test')
+    session = MockSession(down, dropping)
+    http_client._get_session = lambda: session
+    return http_client, session
+
+
+@pytest.fixture(scope='module')
+def async_layer(app, data_layer):
+    async_layer = AsyncArangoDB(app)
+    yield async_layer
+    async_layer.close()
+
+
+@pytest.fixture
+def loop():
+    loop = EventLoopThread()
+    yield loop
+    loop.stop()
+
+
+def test_event_loop_thread(loop):
+    async def double(value):
+        await asyncio.sleep(0)
+        return value * 2
+
+    async def both():
+        return await asyncio.gather(double(1), double(3))
+
+    assert loop.run(double(2)) == 4
+    assert loop.run(both()) == [2, 6]
+
+
+def test_pin_cursor(loop):
+    http_client, session = client()
+    loop.run(http_client.query('RETURN 1'))
+    loop.run(http_client.query('RETURN 1'))
+    loop.run(http_client.fetch('42'))
+    urls = [url for _, url, _ in session.requests]
+    assert urls[0] == 'http://db1:8529/_db/test/_api/cursor'
+    assert urls[1] == 'http://db2:8529/_db/test/_api/cursor'
+    # Pinned to the coordinator which returned the cursor last
+    assert urls[2] == 'http://db2:8529/_db/test/_api/cursor/42'
+
+
+def test_failover(loop):
+    http_client, session = client(down=['http://db1:8529'])
+    loop.run(http_client.query('RETURN 1'))
+    assert session.requests[0][1].startswith('http://db2:8529')
+
+
+def test_dropped_write(loop):
+    http_client, session = client(dropping=['http://db1:8529'])
+    # Received by db1, which may have applied it
+    with pytest.raises(aiohttp.ServerDisconnectedError):
+        loop.run(http_client.query('RETURN 1'))
+    assert len(session.requests) == 1
+    http_client, session = client(dropping=['http://db2:8529'])
+    loop.run(http_client.request('GET', '/_api/version'))
+    loop.run(http_client.request('GET', '/_api/version'))
+    assert [url.split('/')[2] for _, url, _ in session.requests] == [
+        'db1:8529', 'db2:8529', 'db1:8529'
+    ]
+
+
+def test_error(loop):
+    http_client, _ = client()
+    with pytest.raises(AsyncArangoError) as e:
+        loop.run(http_client.request('GET', '/missing'))
+    assert e.value.error_code == 1203
+    assert e.value.http_code == 404
+
+
+def test_async_cursor(loop):
+    http_client, session = client()
+    data = loop.run(http_client.query('RETURN 1'))
+    result = ArangoResult(AsyncCursor(http_client, loop.run, data))
+    assert list(result) == [1, 2, 3]
+    assert result.count() == 5
+    assert session.requests[-1][0] == 'PUT'
+
+
+def test_async_instrumentation(loop):
+    layer = AsyncArangoDB.__new__(AsyncArangoDB)
+    layer.client, _ = client()
+    layer.instrumentation = Instrumentation()
+    # Recorded for the method that built the query, not the loop's thread
+    data = loop.run(layer._aexecute(('find', 'people'), 'RETURN 1'))
+    assert data['result'] == [1, 2]
+    assert layer.instrumentation.counters['queries', 'find'] == 1
+    assert layer.instrumentation.counters['scanned_index', 'find'] == 2
+    count, _ = layer.instrumentation.timings['find', 'people', 'execute']
+    assert count == 1
+    cursor = AsyncCursor(layer.client, loop.run, data)
+    assert cursor.statistics() == {'fullCount': 5, 'scanned_index': 2}
+
+
+def test_async_find(async_layer):
+    req = ParsedRequest()
+    req.max_results = 1
+    result, _ = async_layer.find('people', req, None)
+    assert len(list(result)) == 1
+    assert result.count() == async_layer.db.collection('people').count()
+
+
+def test_async_gather(async_layer):
+    req = ParsedRequest()
+    req.max_results = 10
+    people, person = async_layer.gather(
+        async_layer.afind('people', req, None),
+        async_layer.afind_one('people', None, name='Miles Davis')
+    )
+    assert person['name'] == 'Miles Davis'
+    assert person['_key'] in [doc['_key'] for doc in people]
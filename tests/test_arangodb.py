@@ -1,55 +1,123 @@
-import os
-import json
+from datetime import datetime
+from threading import Lock
 
 import pytest
 
-from arango import ArangoClient
-from eve import Eve
+from werkzeug.exceptions import BadRequest, Conflict
 from eve.utils import ParsedRequest
-from eve_arango.arangodb import ArangoDB, ArangoResult, parse_where
+from eve.io.base import BaseJSONEncoder
+from eve_arango.arangodb import (
+    MAX_RECORDED_FIELDS, AggregationResult, ArangoDB, ArangoResult,
+    DocumentCache, QueryCache, TTLCache, compile_aggregation, compile_find,
+    compile_lookup, compile_remove, compile_traversal, compile_where,
+    date_fields, decode_token, document_key, encode_token, index_data,
+    index_key, keep, keep_fields, lookup_conditions, parse_depth,
+    parse_where, reference_lookup, search_link, sort_value, to_arango,
+    to_python, used_bind_vars, where_shape
+)
+from eve_arango.metrics import Instrumentation
 
 
-@pytest.fixture(scope='module')
-def app():
-    app = Eve(settings='test_settings.py')
+def test_init_app(app, data_layer):
+    # init_app() called by ArangoDB.__init__()
+    assert data_layer.driver is not None
+    assert data_layer.db.name == 'test_database_disposable'
+    assert data_layer.driver.host == app.config.get('ARANGO_HOST')
+    assert data_layer.driver.port == app.config.get('ARANGO_PORT')
 
-    test_app = app.test_client()
-    context = app.app_context()
 
-    context.push()
-    yield test_app.application
-    context.pop()
+def test_provision_lazy(app, data_layer):
+    app.config['ARANGO_PROVISION'] = 'lazy'
+    app.config['DOMAIN']['sessions'] = {}
+    try:
+        lazy_data_layer = ArangoDB(app)
+        assert not lazy_data_layer.db.has_collection('sessions')
+        handle = lazy_data_layer._collection('sessions')
+        assert lazy_data_layer.db.has_collection('sessions')
+        assert lazy_data_layer._collection('sessions') is handle
+    finally:
+        del app.config['ARANGO_PROVISION']
+        del app.config['DOMAIN']['sessions']
+        data_layer.db.delete_collection('sessions', ignore_missing=True)
 
 
-@pytest.fixture(scope='module')
-def data_layer(app):
-    # DELETES the database before tests!
-    db = 'test_database_disposable'
-    host = app.config.get('ARANGO_HOST')
-    port = app.config.get('ARANGO_PORT')
-    client = ArangoClient(host=host, port=port)
-    if client.db('_system').has_database(db):
-        client.db('_system').delete_database(db)
+def test_provision_shared_source(app, data_layer):
+    app.config['ARANGO_PROVISION'] = 'lazy'
+    app.config['DOMAIN']['sessions'] = {
+        'indexes': [{'type': 'persistent', 'fields': ['user']}],
+    }
+    app.config['DOMAIN']['expired_sessions'] = {
+        'datasource': {'source': 'sessions'},
+        'indexes': [{'type': 'persistent', 'fields': ['expired']}],
+    }
+    try:
+        lazy_data_layer = ArangoDB(app)
+        handle = lazy_data_layer._collection('sessions')
+        fields = sorted(
+            index['fields'] for index in handle.indexes()
+            if index['type'] != 'primary'
+        )
+        assert fields == [['expired'], ['user']]
+    finally:
+        del app.config['ARANGO_PROVISION']
+        del app.config['DOMAIN']['sessions']
+        del app.config['DOMAIN']['expired_sessions']
+        data_layer.db.delete_collection('sessions', ignore_missing=True)
 
-    data_layer = ArangoDB(app)
 
-    file_path = os.path.dirname(os.path.abspath(__file__))
-    json_path = os.path.join(file_path, 'test_data.json')
-    with open(json_path, 'r') as json_file:
-        test_data = json.load(json_file)
+def test_indexes(app, data_layer):
+    resource = 'instruments'
+    settings = app.config['DOMAIN'][resource]
+    settings['indexes'] = [
+        {'type': 'persistent', 'fields': ['name'], 'unique': True},
+    ]
+    try:
+        handle = data_layer._collection(resource)
+        data_layer._provision_collection(resource, [settings], True)
+        data_layer._provision_collection(resource, [settings], True)
+        indexes = [
+            index for index in handle.indexes() if index['type'] != 'primary'
+        ]
+        assert len(indexes) == 1
+        assert indexes[0]['fields'] == ['name']
+        assert indexes[0]['unique']
+    finally:
+        del settings['indexes']
+        for index in handle.indexes():
+            if index['type'] != 'primary':
+                handle.delete_index(index['id'])
 
-        for collection, obj in test_data.items():
-            data_layer.db.collection(collection).insert(obj)
 
-    return data_layer
+def test_index_report(data_layer):
+    req = ParsedRequest()
+    req.where = 'name == "Miles Davis"'
+    req.sort = '-born'
+    req.max_results = 1
+    list(data_layer.find('musicians', req, None)[0])
+    report = data_layer.index_report()
+    assert dict(report['musicians'])['name'] >= 1
+    assert dict(report['musicians'])['born'] >= 1
 
 
-def test_init_app(app, data_layer):
-    # init_app() called by ArangoDB.__init__()
-    assert data_layer.driver is not None
-    assert data_layer.db.name == 'test_database_disposable'
-    assert data_layer.driver.host == app.config.get('ARANGO_HOST')
-    assert data_layer.driver.port == app.config.get('ARANGO_PORT')
+def test_record_fields(app):
+    layer = ArangoDB.__new__(ArangoDB)
+    layer._field_usage, layer._field_usage_lock = {}, Lock()
+    layer._record_fields('musicians', {
+        'key_0': 'name', 'sort_0': ['name', 'first'], 'key_1': 'random',
+        'lookup_key_0': '_key',
+    })
+    assert layer._field_usage['musicians'] == {
+        'name': 1, 'name.first': 1, '_key': 1
+    }
+    settings = app.config['DOMAIN']['venues']
+    allow_unknown = settings.get('allow_unknown')
+    settings['allow_unknown'] = True
+    try:
+        for i in range(MAX_RECORDED_FIELDS + 10):
+            layer._record_fields('venues', {'key_0': 'field_%i' % i})
+    finally:
+        settings['allow_unknown'] = allow_unknown
+    assert len(layer._field_usage['venues']) == MAX_RECORDED_FIELDS
 
 
 def test_find(data_layer):
@@ -59,7 +127,7 @@ def test_find(data_layer):
     # filter defaults to None
     req = ParsedRequest()
     req.max_results = 100
-    results = data_layer.find(resource, req, sub_resource_lookup)
+    results = list(data_layer.find(resource, req, sub_resource_lookup)[0])
     assert len(results) == 3
     assert results[0]['name'] == 'Miles Davis'
     assert results[1]['name'] == 'John Coltrane'
@@ -72,7 +140,7 @@ def test_find_where(data_layer):
     req = ParsedRequest()
     req.where = 'name == "Bill Evans"'
     req.max_results = 1
-    results = data_layer.find(resource, req, sub_resource_lookup)
+    results = list(data_layer.find(resource, req, sub_resource_lookup)[0])
     assert len(results) == 1
     assert results[0]['name'] == 'Bill Evans'
 
@@ -83,8 +151,297 @@ def test_pagination(data_layer):
     req = ParsedRequest()
     req.max_results = 1
     req.page = 2
-    results = data_layer.find(resource, req, sub_resource_lookup)
-    assert len(results) == 1
+    results, _ = data_layer.find(resource, req, sub_resource_lookup)
+    assert len(list(results)) == 1
+    assert results.count() == 5
+
+
+def test_find_batches(app, data_layer):
+    resource = 'instruments'
+    sub_resource_lookup = None
+    req = ParsedRequest()
+    req.max_results = 5
+    data_layer.batch_size = 2
+    try:
+        results = list(data_layer.find(resource, req, sub_resource_lookup)[0])
+    finally:
+        data_layer.batch_size = app.config.get('ARANGO_BATCH_SIZE')
+    assert len(results) == 5
+
+
+def test_find_query_cache(data_layer):
+    resource = 'musicians'
+    sub_resource_lookup = None
+    data_layer.query_cache.clear()
+    for page in (1, 2):
+        req = ParsedRequest()
+        req.where = 'name != "Bill Evans"'
+        req.max_results = 1
+        req.page = page
+        results = list(data_layer.find(resource, req, sub_resource_lookup)[0])
+        assert len(results) == 1
+    assert data_layer.query_cache.misses == 1
+    assert data_layer.query_cache.hits == 1
+
+
+def test_find_query_cache_values(data_layer):
+    data_layer.query_cache.clear()
+    for name in ('Bill Evans', 'Miles Davis'):
+        req = ParsedRequest()
+        req.where = 'name == "%s"' % name
+        req.max_results = 10
+        results = list(data_layer.find('musicians', req, None)[0])
+        assert [doc['name'] for doc in results] == [name]
+    assert data_layer.query_cache.misses == 1
+    assert data_layer.query_cache.hits == 1
+
+
+def test_find_sub_resource_lookup(data_layer):
+    req = ParsedRequest()
+    req.max_results = 10
+    results, _ = data_layer.find('played', req, {'_from': 'musicians/1'})
+    assert [doc['_to'] for doc in results] == ['instruments/1']
+    assert results.count() == 1
+
+
+def test_find_datasource_filter(app, data_layer):
+    source = app.config['SOURCES']['instruments']
+    source['filter'] = {'name': 'Piano'}
+    try:
+        req = ParsedRequest()
+        req.max_results = 10
+        results = list(data_layer.find('instruments', req, None)[0])
+        assert [doc['_key'] for doc in results] == ['3']
+        assert not data_layer.is_empty('instruments')
+
+        source['filter'] = {'name': 'Theremin'}
+        assert data_layer.is_empty('instruments')
+    finally:
+        source['filter'] = None
+
+
+def test_find_geo(data_layer):
+    data_layer.db.collection('venues').insert_many([
+        {'_key': 'vanguard', 'location': [-74.0022, 40.7359]},
+        {'_key': 'birdland', 'location': [-73.9887, 40.7593]},
+        {'_key': 'ronnies', 'location': [-0.1318, 51.5134]},
+    ])
+    req = ParsedRequest()
+    req.max_results = 10
+    req.where = 'GEO_DISTANCE(location, [-74.0, 40.74]) < 5000'
+    results, _ = data_layer.find('venues', req, None)
+    assert sorted(doc['_key'] for doc in results) == ['birdland', 'vanguard']
+
+    req.where = (
+        'GEO_CONTAINS(location, [[-74.01, 40.73], [-73.995, 40.73], '
+        '[-73.995, 40.74], [-74.01, 40.74]])'
+    )
+    results, _ = data_layer.find('venues', req, None)
+    assert [doc['_key'] for doc in results] == ['vanguard']
+    assert 'venues_search' in [view['name'] for view in data_layer.db.views()]
+
+
+def test_find_embedded(data_layer):
+    albums = data_layer.db.collection('albums')
+    keys = [album['_key'] for album in albums.insert_many([
+        {'title': 'Kind of Blue', 'artist': '1'},
+        {'title': 'Giant Steps', 'artist': '2'},
+    ])]
+    try:
+        req = ParsedRequest()
+        req.max_results = 10
+        req.embedded = '{"artist": 1}'
+        req.where = 'title == "Kind of Blue"'
+        results, _ = data_layer.find('albums', req, None, perform_count=True)
+        assert [doc['artist'] for doc in results] == ['1']
+        # Eve's lookup of the musicians to embed, read along with the page
+        lookup = {'$or': [{'_key': '1'}, {'_key': '1'}]}
+        counters = data_layer.instrumentation.counters
+        queries = counters['queries', 'find']
+        musicians, count = data_layer.find('musicians', None, lookup)
+        assert [doc['name'] for doc in musicians] == ['Miles Davis']
+        assert count == 1
+        assert counters['queries', 'find'] == queries
+        # Not read with the page
+        lookup = {'$or': [{'_key': '2'}, {'_key': '3'}]}
+        musicians, count = data_layer.find('musicians', None, lookup)
+        assert sorted(doc['name'] for doc in musicians) == [
+            'Bill Evans', 'John Coltrane'
+        ]
+    finally:
+        albums.delete_many(keys)
+
+
+def test_find_traversal(app, data_layer):
+    resource = 'played'
+    settings = app.config['DOMAIN'][resource]
+    settings['traversal'] = {'vertices': ['musicians', 'instruments']}
+    try:
+        req = ParsedRequest()
+        req.args = {'start': '1'}
+        req.max_results = 10
+        results, _ = data_layer.find(resource, req, None)
+        assert [doc['_id'] for doc in results] == ['instruments/1']
+        assert results.count() == 1
+
+        req.args = {'start': 'instruments/1', 'direction': 'inbound'}
+        results, _ = data_layer.find(resource, req, None)
+        assert [doc['_id'] for doc in results] == ['musicians/1']
+
+        # Only over the edges the lookup lets through
+        req.args = {'start': 'instruments/1', 'direction': 'any'}
+        results, _ = data_layer.find(
+            resource, req, {'_from': 'musicians/2'}
+        )
+        assert list(results) == []
+
+        req.args = {'start': 'albums/1'}
+        with pytest.raises(BadRequest):
+            data_layer.find(resource, req, None)
+    finally:
+        del settings['traversal']
+
+
+def test_document_cache(app, data_layer):
+    resource = 'musicians'
+    settings = app.config['DOMAIN'][resource]
+    settings['document_cache'] = {'size': 10, 'ttl': 60}
+    try:
+        cached_data_layer = ArangoDB(app)
+        handle = cached_data_layer.db.collection(resource)
+        key = handle.insert({'name': 'Chet Baker'})['_key']
+        cached = cached_data_layer.find_one(resource, None, _key=key)
+        assert cached['name'] == 'Chet Baker'
+
+        # Writes from elsewhere change the revision, so are seen at once
+        handle.update({'_key': key, 'name': 'Chesney Baker'})
+        cached = cached_data_layer.find_one_raw(resource, _key=key)
+        assert cached['name'] == 'Chesney Baker'
+
+        cached_data_layer.update(resource, key, {'name': 'Chet'}, cached)
+        cached = cached_data_layer.find_one(resource, None, _key=key)
+        assert cached['name'] == 'Chet'
+
+        documents = cached_data_layer.find_list_of_ids(
+            resource, [key, 'missing']
+        )
+        assert [doc['name'] for doc in documents] == ['Chet']
+        handle.update({'_key': key, 'name': 'Chet Baker'})
+        documents = cached_data_layer.find_list_of_ids(resource, [key])
+        assert [doc['name'] for doc in documents] == ['Chet Baker']
+
+        cached_data_layer.remove(resource, {'_key': key})
+        assert cached_data_layer.find_one(resource, None, _key=key) is None
+    finally:
+        del settings['document_cache']
+
+
+def test_find_keyset(app, data_layer):
+    resource = 'instruments'
+    sub_resource_lookup = None
+    settings = app.config['DOMAIN'][resource]
+    settings['keyset_pagination'] = True
+    try:
+        names = []
+        after = None
+        while True:
+            req = ParsedRequest()
+            req.sort = '-name'
+            req.max_results = 2
+            req.args = {'after': after} if after else {}
+            results, _ = data_layer.find(resource, req, sub_resource_lookup)
+            names.extend(doc['name'] for doc in results)
+            assert results.count() is None
+            after = results.continuation
+            if after is None:
+                break
+    finally:
+        del settings['keyset_pagination']
+    assert names == sorted(names, reverse=True)
+    assert len(names) == 5
+
+
+def test_find_keyset_nested(app, data_layer):
+    resource = 'albums'
+    settings = app.config['DOMAIN'][resource]
+    handle = data_layer.db.collection(resource)
+    cities = ['Oslo', 'Bergen', 'Paris', 'Chicago', 'Amsterdam']
+    handle.insert_many([{'label': {'city': city}} for city in cities])
+    settings['keyset_pagination'] = True
+    try:
+        found = []
+        after = None
+        while True:
+            req = ParsedRequest()
+            req.sort = 'label.city'
+            req.max_results = 2
+            req.args = {'after': after} if after else {}
+            results, _ = data_layer.find(resource, req, None)
+            found.extend(doc['label']['city'] for doc in results)
+            after = results.continuation
+            if after is None:
+                break
+    finally:
+        del settings['keyset_pagination']
+        handle.truncate()
+    assert found == sorted(cities)
+
+
+def test_find_count_modes(app, data_layer):
+    resource = 'instruments'
+    sub_resource_lookup = None
+    settings = app.config['DOMAIN'][resource]
+    req = ParsedRequest()
+    req.max_results = 1
+
+    _, count = data_layer.find(
+        resource, req, sub_resource_lookup, perform_count=True
+    )
+    assert count == 5
+    _, count = data_layer.find(
+        resource, req, sub_resource_lookup, perform_count=False
+    )
+    assert count is None
+
+    settings['optimize_pagination_for_speed'] = True
+    try:
+        results, _ = data_layer.find(resource, req, sub_resource_lookup)
+        assert results.count() is None
+    finally:
+        settings['optimize_pagination_for_speed'] = False
+
+    settings['count_mode'] = 'approximate'
+    try:
+        results, _ = data_layer.find(resource, req, sub_resource_lookup)
+        assert results.count() == 5
+        req.where = 'name != "Drums"'
+        results, _ = data_layer.find(resource, req, sub_resource_lookup)
+        assert results.count() == 4
+        assert len(data_layer.count_cache) == 1
+        results, _ = data_layer.find(resource, req, sub_resource_lookup)
+        assert results.count() == 4
+        assert results.cursor.statistics().get('fullCount') is None
+    finally:
+        del settings['count_mode']
+
+
+def test_find_projection(data_layer):
+    resource = 'musicians'
+    sub_resource_lookup = None
+    req = ParsedRequest()
+    req.projection = '{"born": 1}'
+    req.max_results = 1
+    results = list(data_layer.find(resource, req, sub_resource_lookup)[0])
+    assert 'name' not in results[0]
+    assert results[0]['_key'] == '1'
+
+    result = data_layer.find_one(resource, req, _key='1')
+    assert 'name' not in result
+    assert result['_key'] == '1'
+
+    results = data_layer.find_list_of_ids(resource, ['1'], {'born': 1})
+    assert 'name' not in results[0]
+    assert results[0]['_key'] == '1'
 
 
 def test_find_one(data_layer):
@@ -118,7 +475,7 @@ def test_insert(data_layer):
     doc_or_docs = {'name': 'Thelonious Monk'}
     result = data_layer.insert(resource, doc_or_docs)
     assert len(result) == 1
-    assert result[0].get('_id') is not None
+    assert data_layer.db.collection(resource).has(result[0])
 
 
 def test_insert_many(data_layer):
@@ -129,8 +486,7 @@ def test_insert_many(data_layer):
     ]
     result = data_layer.insert(resource, doc_or_docs)
     assert len(result) == 2
-    assert result[0].get('_id') is not None
-    assert result[1].get('_id') is not None
+    assert all(data_layer.db.collection(resource).has(key) for key in result)
 
 
 def test_update(data_layer):
@@ -158,11 +514,105 @@ def test_replace(data_layer):
     assert result.get('_rev') != result.get('_old_rev')
 
 
+def test_update_original_changed(data_layer):
+    resource = 'instruments'
+    id_ = '3'
+    original = data_layer.find_one_raw(resource, _key=id_)
+    data_layer.update(resource, id_, {'type': 'Keyboard'}, original)
+    with pytest.raises(data_layer.OriginalChangedError):
+        data_layer.update(resource, id_, {'type': 'Piano'}, original)
+    with pytest.raises(data_layer.OriginalChangedError):
+        data_layer.replace(resource, id_, {'name': 'Piano'}, original)
+    assert data_layer.find_one_raw(resource, _key=id_)['type'] == 'Keyboard'
+
+
+def test_find_one_conditional(app, data_layer):
+    resource = 'instruments'
+    etag = app.config['ETAG']
+    data_layer.db.collection(resource).update({'_key': '3', etag: 'abc'})
+    req = ParsedRequest()
+    req.if_none_match = 'abc'
+    result = data_layer.find_one(resource, req, _key='3')
+    # Only what Eve needs to answer 304
+    assert result[etag] == 'abc'
+    assert 'name' not in result
+    req.if_none_match = 'def'
+    result = data_layer.find_one(resource, req, _key='3')
+    assert 'name' in result
+
+    deleted = app.config['DELETED']
+    data_layer.db.collection(resource).update({'_key': '3', deleted: True})
+    req.if_none_match = 'abc'
+    result = data_layer.find_one(resource, req, _key='3')
+    assert result[deleted] is True
+    data_layer.db.collection(resource).update(
+        {'_key': '3', deleted: None}, keep_none=False
+    )
+
+
+def test_revision_fields(app):
+    resource = 'instruments'
+    etag = app.config['ETAG']
+    req = ParsedRequest()
+    assert ArangoDB._revision_fields(resource, req) is None
+    req.if_none_match = 'abc'
+    fields = ArangoDB._revision_fields(resource, req)
+    assert etag in fields
+    assert app.config['DELETED'] in fields
+    assert ArangoDB._unchanged(req, {etag: 'abc'}, {})
+    assert not ArangoDB._unchanged(req, {etag: 'def'}, {})
+
+    # Eve doesn't compare ETags then, and would serve the partial document
+    app.config['IF_MATCH'] = False
+    try:
+        assert ArangoDB._revision_fields(resource, req) is None
+        assert not ArangoDB._unchanged(req, {etag: 'abc'}, {})
+    finally:
+        app.config['IF_MATCH'] = True
+
+
+def test_aggregate(app, data_layer):
+    resource = 'instruments'
+    declared = [
+        {'$aql': '''
+            FOR doc IN @@collection
+                FILTER @type == null OR doc.type == @type
+                COLLECT type = doc.type WITH COUNT INTO n
+                SORT type
+                RETURN {type, n}
+        '''},
+        {'$bind': {'type': '$type'}},
+    ]
+    pipeline = declared[:1] + [
+        {'$facet': {
+            'paginated_results': [{'$skip': 0}, {'$limit': 1}],
+            'total_count': [{'$count': 'count'}],
+        }},
+    ]
+    datasource = app.config['DOMAIN'][resource]['datasource']
+    datasource['aggregation'] = {'pipeline': declared}
+    try:
+        result = data_layer.aggregate(resource, pipeline, {}).next()
+        rows = list(result['paginated_results'])
+        assert len(rows) == 1
+        assert result['total_count'][0]['count'] > 1
+
+        with pytest.raises(BadRequest):
+            data_layer.aggregate(
+                resource, [declared[0], {'$bind': {'type': {'a': 1}}}], {}
+            )
+    finally:
+        datasource['aggregation'] = None
+
+
 def test_remove(data_layer):
     resource = 'instruments'
     lookup = {'_key': '3'}
     result = data_layer.remove(resource, lookup)
     assert result == 1
+    with pytest.raises(BadRequest):
+        data_layer.remove(resource, {'_key': {'$in': ['1', '2']}})
+    assert data_layer.db.collection(resource).has('1')
 
 
 def test_is_empty(data_layer):
@@ -175,38 +625,720 @@ def test_is_empty(data_layer):
     assert result == True
 
 
+def test_remove_chunked(app, data_layer):
+    resource = 'albums'
+    settings = app.config['DOMAIN'][resource]
+    source = app.config['SOURCES'][resource]
+    data_layer.db.collection(resource).insert_many(
+        [{'artist': 'Miles Davis'}] * 5 + [{'artist': 'Bill Evans'}] * 2
+    )
+    settings['remove_chunk_size'] = 2
+    source['filter'] = {'artist': 'Miles Davis'}
+    progress = []
+    try:
+        removed = data_layer.remove(
+            resource, {}, lambda collection, removed: progress.append(removed)
+        )
+    finally:
+        del settings['remove_chunk_size']
+        source['filter'] = None
+    assert removed == 5
+    assert progress == [2, 4, 5]
+    assert data_layer.db.collection(resource).count() == 2
+
+    # Without a filter the collection is truncated
+    assert data_layer.remove(resource, {}) == 2
+    assert data_layer.is_empty(resource)
+
+
+def test_transaction(data_layer):
+    with data_layer.transaction() as transaction:
+        transaction.insert('musicians', {'_key': 'wayne', 'name': 'Wayne'})
+        transaction.insert('instruments', {'_key': 'soprano'})
+        edge = transaction.insert('played', {
+            '_from': 'musicians/wayne', '_to': 'instruments/soprano'
+        })
+    assert edge.result['_id'].startswith('played/')
+    assert data_layer.db.collection('played').has(edge.result['_key'])
+
+    # Queued writes are committed by the next insert, and rolled back with it
+    transaction = data_layer.transaction()
+    transaction.insert('instruments', {'_key': 'tenor'})
+    with pytest.raises(Conflict):
+        data_layer.insert('musicians', {'_key': 'wayne'})
+    assert not data_layer.db.collection('instruments').has('tenor')
+    transaction.insert('instruments', {'_key': 'tenor'})
+    result = data_layer.insert('musicians', {'_key': 'shorter'})
+    assert result == ['shorter']
+    assert data_layer.db.collection('instruments').has('tenor')
+
+
 def test_parse_where():
     where = 'name=="Bill Evans",yearNOT IN[1981,1982] AND foo LIKE "[a-z]+bar$"'
-    groups = parse_where(where)
-    assert len(groups) == 3
-    assert len(groups[0]) == 4
-    key, op, value, sep = groups[0]
-    assert key == 'name'
-    assert op == '=='
-    assert value == '"Bill Evans"'
-    assert sep == ','
-    key, op, value, sep = groups[1]
-    assert key == 'year'
-    assert op == 'NOT IN'
-    assert value == '[1981,1982] '
-    assert sep == 'AND'
-    key, op, value, sep = groups[2]
-    assert key == 'foo'
-    assert op == ' LIKE '
-    assert value == '"[a-z]+bar$"'
-    assert sep == ''
+    conditions = parse_where(where)
+    assert len(conditions) == 2
+    assert conditions[0] == ('CMP', ('name',), '==', 'Bill Evans')
+    operator, left, right = conditions[1]
+    assert operator == 'AND'
+    assert left == ('CMP', ('year',), 'NOT IN', (1981, 1982))
+    assert right == ('CMP', ('foo',), 'LIKE', '[a-z]+bar$')
+
+
+def test_compile_long_chain():
+    # Flat chains compile without a stack frame per term
+    where = ' AND '.join('a%i == %i' % (i, i) for i in range(5000))
+    filters, bind_vars = compile_where(where)
+    assert filters.count(' AND ') == 4999
+    assert bind_vars['val_4999'] == 4999
+
+
+def test_compile_where():
+    filters, bind_vars = compile_where(
+        'numIN[1,2,3],NOT (a=="a"ORb.c>=2.5)ANDd==null'
+    )
+    assert filters == (
+        'FILTER doc.@key_0 IN @val_0\n'
+        '            FILTER NOT (doc.@key_1 == @val_1 OR doc.@key_2 >= @val_2)'
+        ' AND doc.@key_3 == @val_3'
+    )
+    assert bind_vars == {
+        'key_0': 'num', 'val_0': [1, 2, 3],
+        'key_1': 'a', 'val_1': 'a',
+        'key_2': ['b', 'c'], 'val_2': 2.5,
+        'key_3': 'd', 'val_3': None,
+    }
+
+
+def test_where_shape():
+    where = 'numIN[1,2],NOT a=="a"ORGEO_DISTANCE(loc, [1, 2]) < 10'
+    shape, bind_vars = where_shape(where)
+    assert shape == (
+        ('CMP', ('num',), 'IN', None),
+        ('OR', ('NOT', ('CMP', ('a',), '==', None)),
+         ('DISTANCE', ('loc',), None, '<', None)),
+    )
+    assert bind_vars == {
+        'val_0': [1, 2], 'val_1': 'a', 'point_2': [1, 2], 'val_2': 10
+    }
+    # Only differing by their values, expressions share a shape
+    other = 'numIN[3],NOT a=="b"ORGEO_DISTANCE(loc, [3, 4]) < 5'
+    assert where_shape(other)[0] == shape
+    filters, shape_vars = compile_where(shape)
+    shape_vars.update(bind_vars)
+    assert (filters, shape_vars) == compile_where(where)
+
+    shape, bind_vars = where_shape('FULLTEXT(name, "bill")')
+    assert shape == (('CALL', 'FULLTEXT', ('name',), None),)
+    assert bind_vars == {'val_0': 'bill'}
+    with pytest.raises(ValueError):
+        where_shape('a ==')
+
+
+class MockCursor:
+
+    def __init__(self, batches):
+        self.batches = [list(batch) for batch in batches]
+        self.data = self.batches.pop(0)
+        self.full_count = sum(map(len, batches))
+        self.fetches = 0
+
+    def empty(self):
+        return not self.data
+
+    def pop(self):
+        return self.data.pop(0)
+
+    def has_more(self):
+        return bool(self.batches)
+
+    def fetch(self):
+        self.fetches += 1
+        self.data.extend(self.batches.pop(0))
+
+    def close(self, ignore_missing=False):
+        self.batches = []
+
+    def statistics(self):
+        return {'fullCount': self.full_count}
 
 
 def test_arango_result():
+    cursor = MockCursor([[1, 2, 3]])
+    result = ArangoResult(cursor)
+    assert list(result) == [1, 2, 3]
+    assert result.count() == 3
 
-    class MockCursor:
-        def batch(self):
-            return self.data
-        def statistics(self):
-            return {'fullCount': len(self.data)}
 
-    cursor = MockCursor()
-    cursor.data = [1, 2, 3]
+def test_arango_result_index():
+    cursor = MockCursor([[1, 2], [3]])
     result = ArangoResult(cursor)
+    assert result[0] == 1
     assert len(result) == 3
+    assert cursor.fetches == 1
+    # Iterated over from the documents read for indexing
+    assert list(result) == [1, 2, 3]
+    assert result[-1] == 3
+    assert ArangoResult(MockCursor([[]]))
+
+
+def test_with_count():
+    result = ArangoResult(MockCursor([[1, 2, 3]]))
+    assert ArangoDB._with_count(result, True) == (result, 3)
+    # Eve unpacks a count even when it doesn't ask for one
+    assert ArangoDB._with_count(result, False) == (result, None)
+
+
+def test_arango_result_timer():
+    timings = {}
+    cursor = MockCursor([[{'a': 1}], [{'a': 2}]])
+    result = ArangoResult(cursor, timer=timings.__setitem__)
+    assert len(list(result)) == 2
+    assert sorted(timings) == ['convert', 'fetch']
+
+
+def test_arango_result_embedded():
+    cursor = MockCursor([[
+        {'doc': {'_key': 'a', 'artist': '1'},
+         'embedded': [[{'_key': '1', 'name': 'Miles Davis'}], []]},
+        {'doc': {'_key': 'b', 'artist': '9', 'label': ['x']},
+         'embedded': [[], [{'_key': 'x', 'name': ['unhashable']}]]},
+    ]])
+    result = ArangoResult(
+        cursor, keyset=['_key'], limit=2,
+        embedded=[('musicians', '_key'), ('labels', 'name')]
+    )
+    assert [doc['_key'] for doc in result] == ['a', 'b']
+    assert result.store == {
+        ('musicians', '_key', '1'): {'_key': '1', 'name': 'Miles Davis'}
+    }
+    assert decode_token(result.continuation) == ['b']
+
+
+def test_aggregation_result():
+    cursor = MockCursor([[{'type': 'brass', 'n': 2}], [{'type': 'reed'}]])
+    result = AggregationResult(cursor, facet=True)
+    page = result.next()
+    assert page['total_count'] == [{'count': 2}]
+    assert [row['type'] for row in page['paginated_results']] == [
+        'brass', 'reed'
+    ]
+    with pytest.raises(StopIteration):
+        result.next()
+
+
+def test_compile_traversal():
+    query, bind_vars = compile_traversal(
+        'name == "Trumpet"', '-name', 'outbound', edges=2
+    )
+    assert 'FOR doc IN @min_depth..@max_depth OUTBOUND @start ' \
+        '@@edges_0, @@edges_1' in query
+    assert "uniqueVertices: 'global'" in query
+    assert 'FILTER doc.@key_0 == @val_0' in query
+    assert 'SORT doc.@sort_0 DESC' in query
+    assert 'LIMIT @skip, @limit' in query
+    query, _ = compile_traversal(None, None, 'any', count=True)
+    assert 'COLLECT WITH COUNT INTO total' in query
+    query, _ = compile_traversal('name == "Trumpet"', None, 'any', lookup=1)
+    assert 'FOR doc, edge, path IN' in query
+    assert query.index(
+        'FILTER path.edges[*].@lookup_key_0 ALL == @lookup_val_0'
+    ) < query.index('FILTER doc.@key_0 == @val_0')
+
+
+def test_parse_depth():
+    assert parse_depth('2') == (2, 2)
+    assert parse_depth('1..3') == (1, 3)
+    for depth in ('3..1', '-1', 'a', '1..'):
+        with pytest.raises(ValueError):
+            parse_depth(depth)
+
+
+def test_compile_aggregation():
+    pipeline = [
+        {'$aql': '''
+            FOR doc IN @@collection
+                FILTER @type == null OR doc.type == @type
+                COLLECT type = doc.type WITH COUNT INTO n
+                RETURN {type, n}
+        '''},
+        {'$bind': {'type': '$type', 'min': 2}},
+        {'$facet': {
+            'paginated_results': [{'$skip': 25}, {'$limit': 25}],
+            'total_count': [{'$count': 'count'}],
+        }},
+    ]
+    query, bind_vars, facet = compile_aggregation(pipeline)
+    assert facet
+    assert 'COLLECT type = doc.type WITH COUNT INTO n' in query
+    assert 'LIMIT @aggregation_skip, @aggregation_limit' in query
+    assert bind_vars == {
+        'type': None, 'min': 2, 'aggregation_skip': 25, 'aggregation_limit': 25
+    }
+    with pytest.raises(ValueError):
+        compile_aggregation([{'$group': {}}])
+
+
+def test_compile_aggregation_request():
+    declared = [
+        {'$aql': 'FOR doc IN @@collection FILTER doc.type IN @types '
+                 'RETURN doc'},
+        {'$bind': {'types': '$types', 'min': 2}},
+    ]
+    # The AQL is never taken from the request, nor constants overridden
+    request = [
+        {'$aql': 'FOR d IN users REMOVE d IN users'},
+        {'$bind': {'types': ['brass'], 'min': 3}},
+    ]
+    query, bind_vars, _ = compile_aggregation(declared, request)
+    assert declared[0]['$aql'] in query
+    assert 'REMOVE' not in query
+    assert bind_vars == {'types': ['brass'], 'min': 2}
+    # Pruned by Eve as the client sent {}
+    _, bind_vars, _ = compile_aggregation(declared, request[:1])
+    assert bind_vars == {'types': None, 'min': 2}
+    for value in ({'a': 1}, [{'a': 1}]):
+        with pytest.raises(ValueError):
+            compile_aggregation(declared, [{'$bind': {'types': value}}])
+
+
+def test_arango_result_lazy():
+    cursor = MockCursor([[{'a': 1}, {'a': 2}], [{'a': 3}]])
+    result = ArangoResult(cursor)
+    assert cursor.fetches == 0
+    documents = iter(result)
+    assert next(documents) == {'a': 1}
+    assert next(documents) == {'a': 2}
+    assert cursor.fetches == 0
+    assert next(documents) == {'a': 3}
+    assert cursor.fetches == 1
     assert result.count() == 3
+
+
+def test_date_fields():
+    schema = {
+        'name': {'type': 'string'},
+        'born': {'type': 'datetime'},
+        'career': {
+            'type': 'dict',
+            'schema': {
+                'start': {'type': 'datetime'},
+                'label': {'type': 'string'},
+            }
+        },
+        'sessions': {
+            'type': 'list',
+            'schema': {
+                'type': 'dict',
+                'schema': {'recorded': {'type': 'datetime'}}
+            }
+        },
+        'tags': {'type': 'list', 'schema': {'type': 'string'}},
+    }
+    plan = date_fields(schema)
+    assert plan == {
+        'born': True,
+        'career': {'start': True},
+        'sessions': {'recorded': True},
+    }
+
+
+def test_to_python(app):
+    plan = {'born': True, 'sessions': {'recorded': True}}
+    document = {
+        'name': 'Tue, 01 Jan 2019 00:00:00 GMT',
+        'born': 'Sun, 26 May 1926 00:00:00 GMT',
+        'sessions': [{'recorded': 'Mon, 02 Mar 1959 00:00:00 GMT'}],
+    }
+    result = to_python(document, plan)
+    assert result is document
+    assert result['name'] == 'Tue, 01 Jan 2019 00:00:00 GMT'
+    assert result['born'] == datetime(1926, 5, 26)
+    assert result['sessions'][0]['recorded'] == datetime(1959, 3, 2)
+
+
+def test_serializers():
+    serialize = ArangoDB.serializers['datetime']
+    assert serialize('Wed, 26 May 1926 00:00:00 GMT') == datetime(1926, 5, 26)
+
+
+def test_to_arango(app):
+    born = datetime(1926, 5, 26)
+    document = {'born': born, 'instruments': {'trumpet'}, 'tags': ('jazz',)}
+    result = to_arango(document, BaseJSONEncoder().default)
+    assert result == {
+        'born': 'Wed, 26 May 1926 00:00:00 GMT',
+        'instruments': ['trumpet'],
+        'tags': ['jazz'],
+    }
+    assert document['born'] is born
+
+
+def test_compile_find():
+    query, bind_vars = compile_find('name == "Bill Evans"', 'name,-born')
+    assert 'FILTER doc.@key_0 == @val_0' in query
+    assert 'SORT doc.@sort_0, doc.@sort_1 DESC' in query
+    assert 'LIMIT @skip, @limit' in query
+    assert bind_vars == {
+        'key_0': 'name',
+        'val_0': 'Bill Evans',
+        'sort_0': 'name',
+        'sort_1': 'born',
+    }
+
+
+def test_compile_find_unlimited():
+    query, _ = compile_find(None, 'name', limited=False)
+    assert 'LIMIT' not in query
+    query, _ = compile_traversal(None, None, 'outbound', limited=False)
+    assert 'LIMIT' not in query
+
+
+def test_compile_find_count():
+    query, bind_vars = compile_find(
+        'name == "Bill Evans"', 'name', count=True
+    )
+    assert 'COLLECT WITH COUNT INTO total' in query
+    assert 'SORT' not in query and 'LIMIT' not in query
+    bind_vars.update({'@collection': 'people', 'skip': 0, 'limit': 10})
+    assert used_bind_vars(query, bind_vars) == {
+        '@collection': 'people', 'key_0': 'name', 'val_0': 'Bill Evans'
+    }
+
+
+def test_compile_find_lookup():
+    query, bind_vars = compile_find('name == "Bill Evans"', '', lookup=2)
+    assert query.index('@lookup_val_1') < query.index('@val_0')
+    assert bind_vars == {'key_0': 'name', 'val_0': 'Bill Evans'}
+
+
+def test_compile_find_search():
+    query, bind_vars = compile_find(
+        'SEARCH(name, "miles") OR SEARCH(bio.text, "modal"), year > 1950',
+        '-_rank', lookup=1
+    )
+    assert 'FOR doc IN @@view\n' in query
+    assert (
+        'SEARCH (ANALYZER(doc.@key_0 IN TOKENS(@val_0, @analyzer_0), '
+        '@analyzer_0) OR ANALYZER(doc.@key_1 IN TOKENS(@val_1, @analyzer_1), '
+        '@analyzer_1))'
+    ) in query
+    assert 'FILTER doc.@key_2 > @val_2' in query
+    assert 'SORT BM25(doc) DESC' in query
+    assert '@@collection' not in query
+    assert bind_vars['key_1'] == ['bio', 'text']
+    assert bind_vars['analyzer_0'] is None
+
+    with pytest.raises(ValueError):
+        compile_find('name == "Miles"', '-_rank')
+    with pytest.raises(ValueError):
+        compile_find('SEARCH(name, "miles")', '-_rank', keyset=True)
+    with pytest.raises(ValueError):
+        compile_find('SEARCH(name, "miles") OR year > 1950', None)
+
+
+def test_compile_find_fulltext_and_geo():
+    query, bind_vars = compile_find(
+        'FULLTEXT(bio.text, "prefix:mod"), '
+        'GEO_DISTANCE(location, [2.35, 48.85]) <= 1000 OR '
+        'GEO_CONTAINS(location, [[0, 0], [1, 0], [1, 1]])', None
+    )
+    assert 'FOR doc IN FULLTEXT(@@collection, @key_0, @val_0)' in query
+    assert (
+        'FILTER GEO_DISTANCE(@point_1, doc.@key_1) <= @val_1 OR '
+        'GEO_CONTAINS(GEO_POLYGON(@val_2), doc.@key_2)'
+    ) in query
+    assert bind_vars['key_0'] == 'bio.text'
+    assert bind_vars['point_1'] == [2.35, 48.85]
+    assert bind_vars['val_2'] == [[0, 0], [1, 0], [1, 1]]
+
+    for where in ('FULLTEXT(a, "x") OR b == 1', 'FULLTEXT(a, "x"), '
+                  'FULLTEXT(b, "y")', 'FULLTEXT(a, "x"), SEARCH(b, "y")'):
+        with pytest.raises(ValueError):
+            compile_find(where, None)
+    with pytest.raises(ValueError):
+        compile_where('SEARCH(name, "miles")')
+
+
+def test_compile_find_embedded():
+    query, bind_vars = compile_find(
+        None, 'title', projection=True, embedded=(True, False)
+    )
+    assert (
+        'LET embedded_0 = DOCUMENT(@embed_collection_0, '
+        'TO_ARRAY(doc.@embed_path_0))'
+    ) in query
+    assert (
+        'LET embedded_1 = (FOR rel IN @@embed_collection_1 '
+        'FILTER rel.@embed_key_1 IN TO_ARRAY(doc.@embed_path_1) RETURN rel)'
+    ) in query
+    assert query.index('LIMIT') < query.index('LET embedded_0')
+    assert 'RETURN {doc: KEEP(doc, @fields), embedded: ' \
+        '[embedded_0, embedded_1]}' in query
+    query, _ = compile_find(None, None, embedded=(True,), count=True)
+    assert 'embedded' not in query
+
+
+def test_reference_lookup():
+    assert reference_lookup({'$or': [{'_key': '1'}, {'_key': '2'}]}) == (
+        '_key', ['1', '2']
+    )
+    assert reference_lookup({'_key': '1'}) is None
+    assert reference_lookup({'$or': []}) is None
+    assert reference_lookup({'$or': [{'_key': '1'}, {'name': 'x'}]}) is None
+    assert reference_lookup({'$or': [{'age': {'$gt': 1}}]}) is None
+
+
+def test_search_link():
+    assert search_link({'fields': ['name', 'bio.text']}) == {'fields': {
+        'name': {'analyzers': ['text_en']},
+        'bio': {'fields': {'text': {'analyzers': ['text_en']}}},
+    }}
+    assert search_link({'fields': {'name': 'identity'}}) == {'fields': {
+        'name': {'analyzers': ['identity']},
+    }}
+
+
+def test_compile_lookup():
+    lookup = {'$and': [{'_from': 'musicians/1'}, {'meta.year': 1959}]}
+    assert lookup_conditions(lookup) == [
+        ('_from', 'musicians/1'), ('meta.year', 1959)
+    ]
+    filters, bind_vars = compile_lookup(lookup)
+    assert 'FILTER doc.@lookup_key_1 == @lookup_val_1' in filters
+    assert bind_vars == {
+        'lookup_key_0': '_from', 'lookup_val_0': 'musicians/1',
+        'lookup_key_1': ['meta', 'year'], 'lookup_val_1': 1959,
+    }
+    with pytest.raises(ValueError):
+        lookup_conditions({'born': {'$gt': 1920}})
+
+
+def test_compile_remove():
+    query, _ = compile_remove(1, chunked=True)
+    assert 'FILTER doc.@lookup_key_0 == @lookup_val_0' in query
+    assert 'LIMIT @chunk_size' in query
+    assert 'REMOVE doc IN @@collection' in query
+    query, _ = compile_remove(1)
+    assert 'LIMIT' not in query
+
+
+def test_query_cache():
+    cache = QueryCache(maxsize=2)
+    assert cache.get('a', lambda: 1) == 1
+    assert cache.get('a', lambda: 2) == 1
+    cache.get('b', lambda: 3)
+    cache.get('c', lambda: 4)
+    assert len(cache) == 2
+    assert cache.get('a', lambda: 5) == 5
+    assert cache.hits == 1
+    assert cache.misses == 4
+
+
+def test_compile_find_keyset():
+    query, bind_vars = compile_find(None, '-name', keyset=True, after=True)
+    assert 'FILTER doc.@sort_0 <= @after_0' in query
+    assert (
+        'FILTER (doc.@sort_0 < @after_0) OR '
+        '(doc.@sort_0 == @after_0 AND doc.@sort_1 > @after_1)'
+    ) in query
+    assert 'SORT doc.@sort_0 DESC, doc.@sort_1' in query
+    assert 'LIMIT @limit' in query
+    assert bind_vars == {'sort_0': 'name', 'sort_1': '_key'}
+
+    _, bind_vars = compile_find(None, 'label.city', keyset=True)
+    assert bind_vars == {'sort_0': ['label', 'city'], 'sort_1': '_key'}
+
+
+def test_continuation_token():
+    values = ['Miles Davis', '1']
+    assert decode_token(encode_token(values)) == values
+    with pytest.raises(ValueError):
+        decode_token('not a token')
+
+
+def test_arango_result_continuation(app):
+    cursor = MockCursor([[{'_key': '1'}, {'_key': '2'}]])
+    result = ArangoResult(cursor, keyset=['_key'], limit=2)
+    assert len(list(result)) == 2
+    assert decode_token(result.continuation) == ['2']
+    response = {}
+    result.extra(response)
+    assert response['_meta']['continuation'] == result.continuation
+
+    cursor = MockCursor([[{'_key': '1'}]])
+    result = ArangoResult(cursor, keyset=['_key'], limit=2)
+    assert len(list(result)) == 1
+    assert result.continuation is None
+
+    # Without a limit, all the documents are on the page
+    cursor = MockCursor([[{'_key': '1'}, {'_key': '2'}]])
+    result = ArangoResult(cursor, keyset=['_key'])
+    assert len(list(result)) == 2
+    assert result.continuation is None
+
+    cursor = MockCursor([[{'_key': '1', 'label': {'city': 'Paris'}}]])
+    result = ArangoResult(cursor, keyset=['label.city', '_key'], limit=1)
+    list(result)
+    assert decode_token(result.continuation) == ['Paris', '1']
+
+
+def test_sort_value():
+    document = {'name': 'Miles', 'label': {'city': 'Paris'}, 'tags': []}
+    assert sort_value(document, 'name') == 'Miles'
+    assert sort_value(document, 'label.city') == 'Paris'
+    assert sort_value(document, 'label.country') is None
+    assert sort_value(document, 'tags.first') is None
+
+
+def test_ttl_cache(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('time.monotonic', lambda: now[0])
+    cache = TTLCache(maxsize=2, ttl=10)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    now[0] += 10
+    assert cache.get('a') is None
+    assert cache.get('c', 'missing') == 'missing'
+
+
+def test_document_cache_generation():
+    cache = DocumentCache(maxsize=2)
+    generation = cache.generation
+    cache.invalidate(['1'])
+    # Read before the write, so not cached
+    cache.add('1', {'_key': '1'}, generation)
+    assert cache.get('1') is None
+    cache.add('1', {'_key': '1'}, cache.generation)
+    assert cache.get('1') == {'_key': '1'}
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+class MockCollection:
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.reads = 0
+
+    def get(self, key):
+        self.reads += 1
+        return self.documents.get(key)
+
+    def get_many(self, keys):
+        self.reads += 1
+        return [self.documents[key] for key in keys if key in self.documents]
+
+
+def test_cached_get_revision():
+    handle = MockCollection({
+        '1': {'_key': '1', '_rev': 'a', 'name': 'Chet'},
+        '2': {'_key': '2', '_rev': 'a', 'name': 'Miles'},
+    })
+
+    def revisions(query, bind_vars):
+        # Answers the revision-only lookups of one key or a list of keys
+        keys = bind_vars.get('keys') or [bind_vars['lookup_val_0']]
+        return iter([
+            keep(handle.documents[key], bind_vars['fields'])
+            for key in keys if key in handle.documents
+        ])
+
+    layer = ArangoDB.__new__(ArangoDB)
+    layer.instrumentation = Instrumentation()
+    layer._collection = lambda collection: handle
+    layer._execute = revisions
+    cache = DocumentCache()
+
+    def name(key):
+        document = layer._cached_get(cache, 'musicians', {'_key': key})
+        return document and document['name']
+
+    assert name('1') == 'Chet'
+    assert name('1') == 'Chet'
+    assert handle.reads == 1
+    handle.documents['1'] = {'_key': '1', '_rev': 'b', 'name': 'Chesney'}
+    assert name('1') == 'Chesney'
+    assert handle.reads == 2
+
+    documents = layer._cached_get_many(cache, 'musicians', ['1', '2'], None)
+    assert [doc['name'] for doc in documents] == ['Chesney', 'Miles']
+    assert handle.reads == 3
+    handle.documents['2'] = {'_key': '2', '_rev': 'b', 'name': 'Davis'}
+    del handle.documents['1']
+    documents = layer._cached_get_many(cache, 'musicians', ['1', '2'], None)
+    assert [doc['name'] for doc in documents] == ['Davis']
+    assert cache.get('1') is None
+    assert name('1') is None
+
+
+def test_cached_get_unvalidated():
+    handle = MockCollection({
+        '1': {'_key': '1', '_rev': 'a', 'name': 'Chet'},
+        '2': {'_key': '2', '_rev': 'a', 'name': 'Miles'},
+    })
+    queries = []
+    layer = ArangoDB.__new__(ArangoDB)
+    layer.instrumentation = Instrumentation()
+    layer._collection = lambda collection: handle
+    layer._execute = lambda query, bind_vars: queries.append(query)
+    cache = DocumentCache(validate=False)
+
+    # Hits are served without any request
+    assert layer._cached_get(cache, 'musicians', {'_key': '1'})['name'] \
+        == 'Chet'
+    handle.documents['1'] = {'_key': '1', '_rev': 'b', 'name': 'Chesney'}
+    assert layer._cached_get(cache, 'musicians', {'_key': '1'})['name'] \
+        == 'Chet'
+    assert handle.reads == 1
+    documents = layer._cached_get_many(cache, 'musicians', ['1', '2'], None)
+    assert [doc['name'] for doc in documents] == ['Chet', 'Miles']
+    assert handle.reads == 2
+    documents = layer._cached_get_many(cache, 'musicians', ['1', '2'], None)
+    assert handle.reads == 2
+    assert not queries
+
+
+def test_keep():
+    document = {'_key': '1', 'name': 'Miles Davis', 'tags': ['jazz']}
+    kept = keep(document, ['_key', 'tags'])
+    assert kept == {'_key': '1', 'tags': ['jazz']}
+    kept['tags'].append('bebop')
+    assert document['tags'] == ['jazz']
+    assert keep(document, None) == document
+
+
+def test_document_key():
+    assert document_key('1') == '1'
+    assert document_key('musicians/1') == '1'
+    assert document_key({'_id': 'musicians/1'}) == '1'
+    assert document_key({'_key': '1'}) == '1'
+    assert document_key({}) is None
+
+
+def test_keep_fields():
+    assert keep_fields(None) is None
+    assert keep_fields({'name': 0}) is None
+    assert keep_fields({'name': 1, 'career.start': 1}) == [
+        '_from', '_id', '_key', '_rev', '_to', 'career', 'name'
+    ]
+
+
+def test_index_data():
+    spec = {'type': 'ttl', 'fields': ['expires'], 'expire_after': 3600}
+    assert index_data(spec) == {
+        'type': 'ttl', 'fields': ['expires'], 'expireAfter': 3600
+    }
+    with pytest.raises(ValueError):
+        index_data({'type': 'btree', 'fields': ['name']})
+
+
+def test_index_key():
+    created = index_data({'type': 'geo', 'fields': ['location']})
+    reported = {
+        'id': '123', 'type': 'geo1', 'fields': ['location'],
+        'unique': False, 'sparse': True,
+    }
+    assert index_key(created) == index_key(reported)
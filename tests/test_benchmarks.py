@@ -0,0 +1,180 @@
+import pytest
+
+from eve import Eve
+from eve.utils import ParsedRequest
+
+from benchmarks.run import (
+    RESOURCE, SCENARIOS, Bench, compare, person, run_scenario, settings
+)
+from benchmarks.stand_in import StandIn, serve
+from eve_arango.arangodb import ArangoDB
+
+
+@pytest.fixture(scope='module')
+def bench():
+    bench = Bench(documents=100, batch_size=10)
+    yield bench
+    bench.close()
+
+
+@pytest.mark.parametrize('scenario', SCENARIOS)
+def test_scenario(bench, scenario):
+    metrics = run_scenario(bench, scenario, 3, warmup=1, allocations=1)
+    assert metrics['throughput'] > 0
+    assert metrics['p50_ms'] <= metrics['p99_ms']
+    assert metrics['alloc_kib'] > 0
+    assert metrics['queries'] >= 1
+
+
+def test_stand_in_cursor(bench):
+    # Pages are read through several cursor batches
+    response = bench.request('GET', '/people?max_results=25&page=2')
+    assert len(response.get_json()['_items']) == 25
+    assert response.get_json()['_meta']['total'] == len(
+        bench.stand_in.collection('people')
+    )
+    assert not bench.stand_in.cursors
+
+
+def test_stand_in_delete_resource():
+    # Eve finds the documents to delete with a default ParsedRequest
+    stand_in = StandIn()
+    stand_in.load('people', [person(i) for i in range(3)])
+    server = serve(stand_in)
+    config = settings(server.url)
+    config['RESOURCE_METHODS'] = ['GET', 'POST', 'DELETE']
+    try:
+        client = Eve(settings=config, data=ArangoDB).test_client()
+        assert client.delete('/people').status_code == 204
+        assert not stand_in.collection('people')
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stand_in_post_keys():
+    stand_in = StandIn()
+    server = serve(stand_in)
+    config = settings(server.url)
+    config['ARANGO_BULK_IMPORT'] = True
+    try:
+        client = Eve(settings=config, data=ArangoDB).test_client()
+        response = client.post('/people', json=[person(0), person(1)])
+        keys = [item['_key'] for item in response.get_json()['_items']]
+        assert sorted(keys) == sorted(stand_in.collection('people'))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stand_in_post_dates():
+    # Datetime fields are parsed by the data layer's serializers before Eve
+    # validates them, then stored in the JSON encoding
+    stand_in = StandIn()
+    server = serve(stand_in)
+    config = settings(server.url)
+    try:
+        client = Eve(settings=config, data=ArangoDB).test_client()
+        response = client.post('/people', json=person(0))
+        assert response.status_code == 201
+        key = response.get_json()['_key']
+        assert stand_in.collection('people')[key]['born'] == person(0)['born']
+        response = client.post('/people', json={'born': 'yesterday'})
+        assert response.status_code == 422
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stand_in_versions():
+    # Eve indexes the versions found for ?version=diffs past the first page
+    stand_in = StandIn()
+    server = serve(stand_in)
+    config = settings(server.url)
+    config['DOMAIN'][RESOURCE]['versioning'] = True
+    try:
+        client = Eve(settings=config, data=ArangoDB).test_client()
+        response = client.post('/people', json={'name': 'Miles Davis'})
+        url = '/people/' + response.get_json()['_key']
+        client.patch(url, json={'name': 'Miles Dewey Davis'})
+        response = client.get(url + '?version=all')
+        assert response.status_code == 200
+        assert [item['_version'] for item in response.get_json()['_items']] \
+            == [1, 2]
+        response = client.get(url + '?version=diffs&max_results=1&page=2')
+        assert response.status_code == 200
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stand_in_versions_unversioned():
+    # Eve counts the versions without asking to, a document stored without
+    # its shadow copies has none and is its own latest version
+    stand_in = StandIn()
+    key = stand_in.load('people', [dict(person(0), _version=1)])[0]['_key']
+    server = serve(stand_in)
+    config = settings(server.url)
+    config['DOMAIN'][RESOURCE]['versioning'] = True
+    try:
+        client = Eve(settings=config, data=ArangoDB).test_client()
+        response = client.get('/people/%s?version=all' % key)
+        assert response.status_code == 200
+        assert [item['name'] for item in response.get_json()['_items']] \
+            == [person(0)['name']]
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stand_in_find_without_count():
+    stand_in = StandIn()
+    stand_in.load('people', [person(i) for i in range(3)])
+    server = serve(stand_in)
+    try:
+        app = Eve(settings=settings(server.url), data=ArangoDB)
+        execute = app.data._execute
+        options = []
+
+        def recorded(query, **kwargs):
+            options.append(kwargs)
+            return execute(query, **kwargs)
+
+        app.data._execute = recorded
+        req = ParsedRequest()
+        req.max_results = 2
+        with app.test_request_context():
+            results, count = app.data.find('people', req, None)
+            assert count == 3
+            results, count = app.data.find(
+                'people', req, None, perform_count=False
+            )
+            assert count is None
+            assert len(list(results)) == 2
+        assert options[0]['full_count']
+        assert not options[1]['full_count'] and not options[1]['count']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_compare():
+    baseline = {'list_page': {
+        'throughput': 100.0, 'p99_ms': 10.0, 'alloc_kib': 50.0
+    }}
+    assert compare({'list_page': {
+        'throughput': 90.0, 'p99_ms': 11.0, 'alloc_kib': 40.0
+    }}, baseline, 0.25) == []
+    baseline['list_page']['queries'] = 1.0
+    regressions = compare({'list_page': {
+        'throughput': 70.0, 'p99_ms': 20.0, 'alloc_kib': 50.0, 'queries': 2.0
+    }, 'patch': {'throughput': 1.0}}, baseline, 0.25)
+    assert [regression.split(':')[0] for regression in regressions] == [
+        'list_page throughput', 'list_page p99_ms', 'list_page queries'
+    ]
+    regressions = compare({'list_page': {
+        'throughput': 70.0, 'p99_ms': 20.0, 'alloc_kib': 50.0, 'queries': 2.0
+    }}, baseline, 0.25, metrics=['alloc_kib', 'queries'])
+    assert [regression.split(':')[0] for regression in regressions] == [
+        'list_page queries'
+    ]
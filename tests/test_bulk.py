@@ -0,0 +1,137 @@
+import pytest
+import requests
+
+from arango.exceptions import DocumentInsertError
+from eve_arango.bulk import BulkImportError, BulkWriter
+
+
+class MockCollection:
+
+    def __init__(self, name, requests):
+        self.name = name
+        self.requests = requests
+
+    def _record(self, operation, documents):
+        self.requests.append((self.name, operation, list(documents)))
+        return [{'_key': str(i)} for i, _ in enumerate(documents)]
+
+    def insert_many(self, documents):
+        results = self._record('insert', documents)
+        for i, document in enumerate(documents):
+            if document.get('fail'):
+                results[i] = DocumentInsertError.__new__(DocumentInsertError)
+        return results
+
+    def update_many(self, documents):
+        return self._record('update', documents)
+
+    def replace_many(self, documents):
+        if any(document.get('fail') for document in documents):
+            raise requests.ConnectionError('Connection refused')
+        return self._record('replace', documents)
+
+    def delete_many(self, documents):
+        return self._record('remove', documents)
+
+    def import_bulk(self, documents, halt_on_error=True, details=True):
+        self._record('import', documents)
+        return {
+            'created': len(documents) - 1,
+            'errors': 1,
+            'details': ['at position 1: unique constraint violated'],
+        }
+
+
+class MockDatabase:
+
+    def __init__(self):
+        self.requests = []
+
+    def collection(self, name):
+        return MockCollection(name, self.requests)
+
+
+@pytest.fixture
+def db():
+    return MockDatabase()
+
+
+def test_flush_by_size(db):
+    writer = BulkWriter(db, size=2)
+    writer.insert('musicians', {'name': 'Miles Davis'})
+    assert db.requests == []
+    writer.insert('musicians', {'name': 'John Coltrane'})
+    assert len(db.requests) == 1
+    assert db.requests[0][1] == 'insert'
+    assert len(db.requests[0][2]) == 2
+
+
+def test_group_by_collection(db):
+    with BulkWriter(db) as writer:
+        writer.insert('musicians', {'name': 'Miles Davis'})
+        writer.insert('instruments', {'name': 'Trumpet'})
+        writer.insert('musicians', {'name': 'Bill Evans'})
+    assert sorted((r[0], len(r[2])) for r in db.requests) == [
+        ('instruments', 1), ('musicians', 2)
+    ]
+
+
+def test_keep_operation_order(db):
+    with BulkWriter(db) as writer:
+        writer.insert('musicians', {'_key': '1'})
+        writer.update('musicians', {'_key': '1', 'name': 'Miles Davis'})
+        writer.remove('musicians', '1')
+    assert [r[1] for r in db.requests] == ['insert', 'update', 'remove']
+
+
+def test_flush_by_interval(db):
+    writer = BulkWriter(db, interval=0.01)
+    writer.insert('musicians', {'name': 'Miles Davis'})
+    timer = writer._timer
+    timer.join(1)
+    assert len(db.requests) == 1
+
+
+def test_per_document_errors(db):
+    with BulkWriter(db) as writer:
+        ok = writer.insert('musicians', {'name': 'Miles Davis'})
+        failed = writer.insert('musicians', {'fail': True})
+    assert ok.result == {'_key': '0'}
+    assert ok.error is None
+    assert isinstance(failed.error, DocumentInsertError)
+    assert writer.errors == [failed]
+
+
+def test_request_errors(db):
+    flushed = []
+    writer = BulkWriter(db, interval=0.05, on_flush=flushed.extend)
+    ops = [
+        writer.replace('musicians', {'_key': str(i), 'fail': True})
+        for i in range(2)
+    ]
+    writer._timer.join(1)
+    assert all(isinstance(op.error, requests.ConnectionError) for op in ops)
+    assert all(op.done for op in ops)
+    assert writer.errors == ops
+    assert flushed == ops
+
+
+def test_import(db):
+    with BulkWriter(db, use_import=True) as writer:
+        ok = writer.insert('musicians', {'name': 'Miles Davis'})
+        failed = writer.insert('musicians', {'name': 'Miles Davis'})
+    assert db.requests[0][1] == 'import'
+    assert ok.result is True
+    assert isinstance(failed.error, BulkImportError)
+
+
+def test_resolve_and_encode(db):
+    writer = BulkWriter(
+        db,
+        resolve=lambda name: 'people',
+        encode=lambda document: dict(document, encoded=True)
+    )
+    op = writer.insert('musicians', {'name': 'Miles Davis'})
+    writer.flush()
+    assert op.collection == 'people'
+    assert db.requests[0][2] == [{'name': 'Miles Davis', 'encoded': True}]
@@ -0,0 +1,138 @@
+from urllib.parse import urlsplit
+
+import pytest
+
+from arango import ArangoClient
+from eve import Eve
+
+from benchmarks.run import settings
+from benchmarks.stand_in import StandIn, serve
+from eve_arango.arangodb import ArangoDB
+from eve_arango.changes import ChangeFeed
+
+
+@pytest.fixture
+def stand_in():
+    stand_in = StandIn()
+    server = serve(stand_in)
+    stand_in.url = server.url
+    yield stand_in
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def feed(stand_in):
+    url = urlsplit(stand_in.url)
+    db = ArangoClient(host=url.hostname, port=url.port).db('test')
+    feed = ChangeFeed(db, {'people': ['people', 'adults']})
+    feed.events = []
+    feed.subscribe(lambda resource, keys: feed.events.append(
+        (resource, keys)
+    ))
+    return feed
+
+
+def test_writes(stand_in, feed):
+    stand_in.load('people', [{'_key': 'miles'}])
+    feed.tick = feed.last_tick()
+    assert feed.poll() is False
+    assert feed.events == []
+
+    stand_in.load('people', [{'_key': 'bill'}, {'_key': 'wayne'}])
+    stand_in.load('pets', [{'_key': 'rex'}])
+    feed.poll()
+    assert sorted(feed.events) == [
+        ('adults', {'bill', 'wayne'}), ('people', {'bill', 'wayne'})
+    ]
+
+
+def test_chunks(stand_in, feed):
+    feed.tick = feed.last_tick()
+    feed.chunk_size = 1
+    stand_in.load('people', [{'_key': 'bill'}, {'_key': 'wayne'}])
+    assert feed.poll() is True
+    assert feed.poll() is False
+    assert [keys for resource, keys in feed.events if resource == 'people'] \
+        == [{'bill'}, {'wayne'}]
+
+
+def test_collection_changes(stand_in, feed):
+    feed.tick = feed.last_tick()
+    stand_in.load('people', [{'_key': 'bill'}])
+    with stand_in._lock:
+        stand_in._log(2004, 'people')
+    feed.poll()
+    assert ('people', None) in feed.events
+
+    # Writes dropped from the log before they were read
+    feed.events = []
+    stand_in.load('people', [{'_key': 'wayne'}])
+    stand_in.forget_log()
+    feed.poll()
+    assert sorted(feed.events) == [('adults', None), ('people', None)]
+
+
+def test_failing_listener(stand_in, feed):
+    @feed.subscribe
+    def fail(resource, keys):
+        raise RuntimeError('listener failed')
+
+    # Called first, so it fails before the others are called
+    feed.listeners.insert(0, feed.listeners.pop())
+    feed.tick = feed.last_tick()
+    stand_in.load('people', [{'_key': 'bill'}])
+    feed.poll()
+    assert sorted(feed.events) == [('adults', {'bill'}), ('people', {'bill'})]
+
+
+def test_transactions(feed):
+    changes = {}
+    for entry in [
+        {'type': 2300, 'cname': 'people', 'tid': '7',
+         'data': {'_key': 'bill'}},
+        {'type': 2300, 'cname': 'people', 'tid': '8',
+         'data': {'_key': 'wayne'}},
+        {'type': 2202, 'tid': '8'},
+    ]:
+        feed._apply(entry, changes)
+    assert changes == {}
+    feed._apply({'type': 2201, 'tid': '7'}, changes)
+    assert changes == {'people': {'bill'}}
+
+
+def test_invalidate_caches(stand_in):
+    stand_in.load('people', [{'_key': 'miles', 'name': 'Miles'}])
+    config = settings(stand_in.url)
+    config['DOMAIN']['people']['document_cache'] = True
+    config['ARANGO_CHANGE_FEED'] = True
+    # Polled by the test rather than by the background thread
+    config['ARANGO_CHANGE_FEED_INTERVAL'] = 60
+    app = Eve(settings=config, data=ArangoDB)
+    client = app.test_client()
+    handle = stand_in.handle
+    requests = []
+
+    def recorded(method, path, params, body):
+        if '/_api/wal/' not in path:
+            requests.append((method, path))
+        return handle(method, path, params, body)
+
+    stand_in.handle = recorded
+    try:
+        assert client.get('/people/miles').get_json()['name'] == 'Miles'
+        assert requests
+        # While the feed runs, hits are served without checking the revision
+        del requests[:]
+        assert client.get('/people/miles').get_json()['name'] == 'Miles'
+        assert requests == []
+        # Written by another process, the cached document is only dropped
+        # once the feed reads the write
+        stand_in.load('people', [{'_key': 'miles', 'name': 'Miles Davis'}])
+        assert client.get('/people/miles').get_json()['name'] == 'Miles'
+        app.data.changes.poll()
+        assert app.data.document_caches['people'].get('miles') is None
+        assert client.get('/people/miles').get_json()['name'] == \
+            'Miles Davis'
+    finally:
+        app.data.changes.stop()
@@ -0,0 +1,181 @@
+import json
+import socket
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+
+import pytest
+import requests
+
+from urllib3.exceptions import ConnectTimeoutError
+
+from eve_arango.http import PooledHTTPClient
+
+
+ENDPOINTS = ['http://db1:8529', 'http://db2:8529', 'http://db3:8529']
+
+
+class MockRawResponse:
+
+    def __init__(self, method, url, body):
+        self.request = type('Request', (), {'method': method.upper()})
+        self.url = url
+        self.headers = {}
+        self.status_code = 200
+        self.reason = 'OK'
+        self.text = json.dumps(body)
+
+
+class MockSession:
+
+    def __init__(self, down=()):
+        self.down = down
+        self.urls = []
+
+    def request(self, method, url, **kwargs):
+        if any(url.startswith(endpoint) for endpoint in self.down):
+            raise requests.ConnectionError(url)
+        self.urls.append(url)
+        body = {'result': [], 'hasMore': False}
+        if url.endswith('/_api/cursor'):
+            body = {'id': '42', 'result': [1], 'hasMore': True}
+        return MockRawResponse(method, url, body)
+
+
+def client(strategy='roundrobin', down=()):
+    http_client = PooledHTTPClient(ENDPOINTS, strategy=strategy)
+    http_client._session = MockSession(down)
+    return http_client
+
+
+def hosts(http_client):
+    return [url.split('/')[2] for url in http_client._session.urls]
+
+
+def test_round_robin():
+    http_client = client()
+    for _ in range(4):
+        http_client.send_request('get', 'http://localhost:8529/_api/version')
+    assert hosts(http_client) == [
+        'db1:8529', 'db2:8529', 'db3:8529', 'db1:8529'
+    ]
+    assert http_client._session.urls[0] == 'http://db1:8529/_api/version'
+
+
+def test_least_loaded():
+    http_client = client('leastloaded')
+    http_client._in_flight = [2, 0, 1]
+    http_client.send_request('get', 'http://localhost:8529/_api/version')
+    assert hosts(http_client) == ['db2:8529']
+
+
+def test_cursor_pinning():
+    http_client = client()
+    http_client.send_request('get', 'http://localhost:8529/_api/version')
+    http_client.send_request('post', 'http://localhost:8529/_db/a/_api/cursor')
+    http_client.send_request(
+        'put', 'http://localhost:8529/_db/a/_api/cursor/42'
+    )
+    assert hosts(http_client)[1:] == ['db2:8529', 'db2:8529']
+    # The last batch was fetched, so the cursor is no longer pinned
+    assert http_client._cursors == {}
+
+
+def test_failover():
+    http_client = client(down=['http://db1'])
+    response = http_client.send_request(
+        'get', 'http://localhost:8529/_api/version'
+    )
+    assert response.is_success
+    assert hosts(http_client) == ['db2:8529']
+    assert http_client._in_flight == [0, 0, 0]
+
+
+class DroppingHandler(BaseHTTPRequestHandler):
+    """ Reads a request and closes the connection without answering, unless
+    its server answers.
+    """
+
+    def _handle(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.received.append(self.command)
+        if not self.server.answers:
+            self.close_connection = True
+            return
+        body = json.dumps({'result': True}).encode()
+        self.send_response(201 if self.command == 'POST' else 200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servers():
+    servers = []
+    for answers in (False, True):
+        server = HTTPServer(('127.0.0.1', 0), DroppingHandler)
+        server.answers = answers
+        server.received = []
+        server.url = 'http://127.0.0.1:%i' % server.server_port
+        Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_dropped_write(servers):
+    dropping, answering = servers
+    http_client = PooledHTTPClient([dropping.url, answering.url])
+    # The first coordinator may have applied the write before dropping it
+    with pytest.raises(requests.ConnectionError):
+        http_client.send_request('post', 'http://localhost:8529/_api/x')
+    assert dropping.received == ['POST']
+    assert answering.received == []
+    # Reads are sent to the next one
+    http_client._next = iter([0])
+    response = http_client.send_request(
+        'get', 'http://localhost:8529/_api/version'
+    )
+    assert response.status_code == 200
+    assert answering.received == ['GET']
+
+
+def test_refused_write(servers):
+    _, answering = servers
+    # A port nothing listens on
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        refused = 'http://127.0.0.1:%i' % sock.getsockname()[1]
+    http_client = PooledHTTPClient([refused, answering.url], max_retries=0)
+    response = http_client.send_request(
+        'post', 'http://localhost:8529/_api/x'
+    )
+    assert response.status_code == 201
+    assert answering.received == ['POST']
+
+
+def test_retries():
+    http_client = PooledHTTPClient(ENDPOINTS)
+    retries = http_client._session.get_adapter(ENDPOINTS[0]).max_retries
+    assert retries.is_retry('GET', 503)
+    assert retries.is_retry('PUT', 503)
+    # Writes may have been applied before the 503
+    assert not retries.is_retry('POST', 503)
+    assert not retries.is_retry('PATCH', 503)
+    # but never were if the connection failed
+    retries = retries.increment(
+        'POST', ENDPOINTS[0], error=ConnectTimeoutError()
+    )
+    assert retries.connect == 2
+
+
+def test_unknown_strategy():
+    with pytest.raises(ValueError):
+        PooledHTTPClient(ENDPOINTS, strategy='random')
@@ -0,0 +1,91 @@
+import logging
+
+from eve_arango.metrics import Instrumentation, instrumented, summarize_plan
+
+
+class Layer:
+
+    def __init__(self):
+        self.instrumentation = Instrumentation(slow_query_time=0.5)
+
+    @instrumented
+    def find(self, resource):
+        with self.instrumentation.timer('compile'):
+            pass
+        return self.instrumentation.current()
+
+
+def test_method_phases():
+    layer = Layer()
+    events = []
+    layer.instrumentation.subscribe(
+        lambda method, resource, phase, seconds, details: events.append(
+            (method, resource, phase)
+        )
+    )
+    assert layer.find('people') == ('find', 'people')
+    assert layer.instrumentation.current() == ('other', None)
+    assert events == [
+        ('find', 'people', 'compile'), ('find', 'people', 'total')
+    ]
+    count, seconds = layer.instrumentation.timings['find', 'people', 'total']
+    assert count == 1 and seconds >= 0
+
+
+def test_recorder():
+    instrumentation = Instrumentation()
+    with instrumentation.method('find', 'people'):
+        timer = instrumentation.recorder()
+    timer('fetch', 0.25)
+    assert instrumentation.timings['find', 'people', 'fetch'] == [1, 0.25]
+
+
+def test_slow_query(caplog):
+    instrumentation = Instrumentation(slow_query_time=0.5)
+    plan = {'nodes': [
+        {'type': 'SingletonNode'},
+        {'type': 'IndexNode', 'indexes': [{'type': 'persistent',
+                                            'fields': ['name']}]},
+        {'type': 'ReturnNode'},
+    ], 'estimatedCost': 4.5}
+    stats = {'scanned_index': 10, 'filtered': 4, 'execution_time': 0.6}
+    with caplog.at_level(logging.WARNING, logger='eve_arango'):
+        with instrumentation.method('find', 'people'):
+            instrumentation.query('FOR doc IN @@collection RETURN doc',
+                                  {'secret': 1}, 0.1, stats, lambda: plan)
+            instrumentation.query('FOR doc IN @@collection RETURN doc',
+                                  {'secret': 1}, 0.7, stats, lambda: plan)
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert 'IndexNode persistent[name]' in message
+    assert 'secret' not in message
+    assert caplog.records[0].plan is plan
+    assert instrumentation.counters['queries', 'find'] == 2
+    assert instrumentation.counters['slow_queries', 'find'] == 1
+    assert instrumentation.counters['scanned_index', 'find'] == 20
+
+
+def test_prometheus():
+    instrumentation = Instrumentation()
+    with instrumentation.method('find', 'people'):
+        instrumentation.query('RETURN 1', None, 0.5, {'filtered': 3})
+    text = instrumentation.prometheus()
+    assert '# TYPE eve_arango_phase_seconds summary' in text
+    assert (
+        'eve_arango_phase_seconds_count'
+        '{method="find",phase="execute",resource="people"} 1'
+    ) in text
+    assert (
+        'eve_arango_phase_seconds_sum'
+        '{method="find",phase="execute",resource="people"} 0.5'
+    ) in text
+    assert 'eve_arango_queries_total{method="find"} 1' in text
+    assert 'eve_arango_documents_filtered_total{method="find"} 3' in text
+    assert text.endswith('\n')
+
+
+def test_summarize_plan():
+    assert summarize_plan(None) == 'None'
+    assert summarize_plan({'nodes': [{'type': 'ReturnNode'}]}) == (
+        'ReturnNode; estimated cost None'
+    )
@@ -0,0 +1,74 @@
+import io
+import json
+from datetime import datetime
+
+import pytest
+
+from eve_arango.ndjson import (
+    chunks, export_resource, import_resource, read_ndjson, write_ndjson
+)
+
+
+def test_read_ndjson():
+    fp = io.StringIO('{"name": "Miles Davis"}\n\n{"name": "Bill Evans"}\n')
+    assert list(read_ndjson(fp)) == [
+        (1, {'name': 'Miles Davis'}), (3, {'name': 'Bill Evans'})
+    ]
+    with pytest.raises(ValueError, match='line 2'):
+        list(read_ndjson(io.StringIO('{}\n{"name": \n')))
+    with pytest.raises(ValueError, match='line 1'):
+        list(read_ndjson(io.StringIO('[1, 2]\n')))
+
+
+def test_write_ndjson():
+    fp = io.StringIO()
+    assert write_ndjson([{'name': 'Bill Evans'}, {'born': 1929}], fp) == 2
+    assert fp.getvalue() == '{"name":"Bill Evans"}\n{"born":1929}\n'
+
+
+def test_chunks():
+    assert list(chunks(range(5), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunks([], 2)) == []
+
+
+def test_export_import(app, data_layer):
+    fp = io.StringIO()
+    assert export_resource(data_layer, 'musicians', fp, batch_size=1) == 3
+    assert '"_rev"' not in fp.getvalue()
+
+    fp.seek(0)
+    result = import_resource(data_layer, 'musicians', fp, chunk_size=2)
+    # The documents keep their keys, so they all exist already
+    assert result['created'] == 0
+    assert result['errors'] == 3
+    assert result['details'][0].startswith('line 1: ')
+
+    fp.seek(0)
+    result = import_resource(
+        data_layer, 'musicians', fp, chunk_size=2, on_duplicate='replace'
+    )
+    assert result['updated'] == 3
+    assert data_layer.db.collection('musicians').count() == 3
+
+
+def test_export_import_dates(app, data_layer):
+    updated = datetime(2019, 1, 1, 12, 30)
+    data_layer.insert('musicians', [
+        {'_key': 'ndjson', 'name': 'Chet Baker', '_updated': updated}
+    ])
+    lookup = {'_key': 'ndjson'}
+    try:
+        fp = io.StringIO()
+        assert export_resource(data_layer, 'musicians', fp, lookup) == 1
+        exported = json.loads(fp.getvalue())
+        assert exported['_updated'] == 'Tue, 01 Jan 2019 12:30:00 GMT'
+
+        fp.seek(0)
+        result = import_resource(
+            data_layer, 'musicians', fp, on_duplicate='replace'
+        )
+        assert result['updated'] == 1
+        document = data_layer.find_one('musicians', None, **lookup)
+        assert document['_updated'] == updated
+    finally:
+        data_layer.remove('musicians', lookup)
@@ -40,5 +40,24 @@ DOMAIN = {
     'played': {
         'edge_collection': True,
     },
-    'albums': {}
+    'venues': {
+        'indexes': [
+            {'type': 'geo', 'fields': ['location'], 'geo_json': True},
+        ],
+        'search': {'fields': ['name']},
+    },
+    'albums': {
+        'schema': {
+            'title': {
+                'type': 'string',
+            },
+            'artist': {
+                'type': 'string',
+                'data_relation': {
+                    'resource': 'musicians',
+                    'embeddable': True,
+                },
+            },
+        }
+    }
 }
@@ -0,0 +1,107 @@
+import pytest
+
+from arango.exceptions import TransactionExecuteError
+from eve_arango.transaction import Transaction
+
+
+class MockDatabase:
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.requests = []
+
+    def execute_transaction(self, command, params=None, write=None,
+                            sync=None, timeout=None):
+        self.requests.append((params['steps'], write, sync, timeout))
+        if self.fail:
+            raise TransactionExecuteError.__new__(TransactionExecuteError)
+        return [
+            [{'_key': '%i.%i' % (i, j)} for j, _ in enumerate(
+                step['documents']
+            )]
+            for i, step in enumerate(params['steps'])
+        ]
+
+
+def test_single_request():
+    db = MockDatabase()
+    with Transaction(db, timeout=5) as transaction:
+        musician = transaction.insert('musicians', {'_key': 'miles'})
+        instrument = transaction.insert('instruments', {'_key': 'trumpet'})
+        played = transaction.insert('played', {
+            '_from': 'musicians/miles', '_to': 'instruments/trumpet'
+        })
+        assert db.requests == []
+    assert len(db.requests) == 1
+    steps, write, _, timeout = db.requests[0]
+    assert [step['collection'] for step in steps] == [
+        'musicians', 'instruments', 'played'
+    ]
+    assert write == ['instruments', 'musicians', 'played']
+    assert timeout == 5
+    assert musician.result == {'_key': '0.0'}
+    assert instrument.result == {'_key': '1.0'}
+    assert played.result == {'_key': '2.0'}
+    assert len(transaction) == 0
+
+
+def test_group_runs():
+    db = MockDatabase()
+    with Transaction(db) as transaction:
+        transaction.insert('musicians', {'_key': '1'})
+        transaction.insert('musicians', {'_key': '2'})
+        transaction.update('musicians', {'_key': '1', 'name': 'Miles'})
+        transaction.update('musicians', {'_key': '2', '_rev': 'x'},
+                           check_rev=True)
+        transaction.remove('musicians', '1')
+    steps = db.requests[0][0]
+    assert [(step['operation'], len(step['documents'])) for step in steps] \
+        == [('insert', 2), ('update', 1), ('update', 1), ('remove', 1)]
+    assert steps[1]['options']['ignoreRevs'] is True
+    assert steps[2]['options']['ignoreRevs'] is False
+
+
+def test_failure():
+    db = MockDatabase(fail=True)
+    committed = []
+    transaction = Transaction(db, on_commit=committed.append)
+    ops = [
+        transaction.insert('musicians', {'name': 'Miles Davis'}),
+        transaction.insert('played', {'_from': 'musicians/1'}),
+    ]
+    with pytest.raises(TransactionExecuteError):
+        transaction.commit()
+    assert all(isinstance(op.error, TransactionExecuteError) for op in ops)
+    assert all(op.result is None for op in ops)
+    assert committed == []
+
+
+def test_abort_on_exception():
+    db = MockDatabase()
+    with pytest.raises(ValueError):
+        with Transaction(db) as transaction:
+            transaction.insert('musicians', {'name': 'Miles Davis'})
+            raise ValueError()
+    assert db.requests == []
+    assert len(transaction) == 0
+
+
+def test_resolve_and_encode():
+    db = MockDatabase()
+    committed = []
+    transaction = Transaction(
+        db,
+        resolve=lambda name: 'people',
+        encode=lambda document: dict(document, encoded=True),
+        on_commit=committed.append
+    )
+    op = transaction.insert('musicians', {'name': 'Miles Davis'})
+    transaction.commit()
+    assert op.collection == 'people'
+    assert db.requests[0][0][0]['documents'] == [
+        {'name': 'Miles Davis', 'encoded': True}
+    ]
+    assert committed == [[op]]
+    # Nothing queued, nothing sent
+    assert transaction.commit() == []
+    assert len(db.requests) == 1
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from eve_arango.where import MAX_DEPTH, WhereSyntaxError, parse_where
+
+
+def test_glued_keywords():
+    assert parse_where('numIN[1,2,3]') == (
+        ('CMP', ('num',), 'IN', (1, 2, 3)),
+    )
+    assert parse_where('yearNOTIN [1981]') == (
+        ('CMP', ('year',), 'NOT IN', (1981,)),
+    )
+    assert parse_where('yearNOT IN [1981]') == (
+        ('CMP', ('year',), 'NOT IN', (1981,)),
+    )
+    assert parse_where('name NOT LIKE "a%"') == (
+        ('CMP', ('name',), 'NOT LIKE', 'a%'),
+    )
+    assert parse_where('a == 1 OR ORDER == 2') == ((
+        'OR', ('CMP', ('a',), '==', 1), ('CMP', ('ORDER',), '==', 2)
+    ),)
+    assert parse_where('a=="a"ANDb==1ORc==null') == ((
+        'OR',
+        ('AND', ('CMP', ('a',), '==', 'a'), ('CMP', ('b',), '==', 1)),
+        ('CMP', ('c',), '==', None),
+    ),)
+
+
+def test_chains():
+    assert parse_where('a==1 AND b==2 AND c==3 OR d==4') == ((
+        'OR',
+        ('AND', ('CMP', ('a',), '==', 1), ('CMP', ('b',), '==', 2),
+         ('CMP', ('c',), '==', 3)),
+        ('CMP', ('d',), '==', 4),
+    ),)
+
+
+def test_precedence_and_parentheses():
+    assert parse_where('a==1 OR b==2 AND c==3') == ((
+        'OR',
+        ('CMP', ('a',), '==', 1),
+        ('AND', ('CMP', ('b',), '==', 2), ('CMP', ('c',), '==', 3)),
+    ),)
+    assert parse_where('(a==1 OR b==2) AND NOT c==3') == ((
+        'AND',
+        ('OR', ('CMP', ('a',), '==', 1), ('CMP', ('b',), '==', 2)),
+        ('NOT', ('CMP', ('c',), '==', 3)),
+    ),)
+
+
+def test_values():
+    where = (
+        'a == "say \\"hi\\"", b == \'x\', c == -1.5e3, d == true, '
+        'e IN [[1, 2], "three", false], f.g.h != null'
+    )
+    assert [condition[3] for condition in parse_where(where)] == [
+        'say "hi"', 'x', -1500.0, True, ((1, 2), 'three', False), None
+    ]
+    assert parse_where(where)[-1][1] == ('f', 'g', 'h')
+
+
+def test_functions():
+    assert parse_where(
+        'FULLTEXT(bio.text, "prefix:mod"), NOT SEARCH(name, \'miles\') AND '
+        'GEO_DISTANCE(location, [2.35, 48.85]) <= 1000'
+    ) == (
+        ('CALL', 'FULLTEXT', ('bio', 'text'), 'prefix:mod'),
+        ('AND',
+         ('NOT', ('CALL', 'SEARCH', ('name',), 'miles')),
+         ('DISTANCE', ('location',), (2.35, 48.85), '<=', 1000)),
+    )
+    assert parse_where('GEO_CONTAINS(area, [[0, 0], [1, 0], [1, 1]])') == (
+        ('CALL', 'GEO_CONTAINS', ('area',), ((0, 0), (1, 0), (1, 1))),
+    )
+    # Only a call when followed by a parenthesis
+    assert parse_where('SEARCH == 1') == (('CMP', ('SEARCH',), '==', 1),)
+
+
+@pytest.mark.parametrize('where', [
+    'name', 'name ==', 'name == Bill', 'name == "Bill', '== 1',
+    'a == 1 AND', 'a IN [1, 2', '(a == 1', 'a == 1)', 'a == 1,,b == 2',
+    'a.. == 1', 'SEARCH(name)', 'SEARCH(name, 1)', 'FULLTEXT("a", "b")',
+    'GEO_DISTANCE(a, [1, 2])', 'GEO_DISTANCE(a, [1, 2]) == 5',
+    'GEO_DISTANCE(a, [1]) < 5', 'GEO_DISTANCE(a, [1, 2]) < "5"',
+    'GEO_CONTAINS(a, [[0, 0], [1, 0]])', 'SEARCH(name, "a"',
+    'x == 1 ANDROID == 2', 'x == 1 ORACLE == 2', 'a==1 ANDROID==2',
+])
+def test_errors(where):
+    with pytest.raises(WhereSyntaxError):
+        parse_where(where)
+
+
+def test_nesting_limit():
+    parse_where('(' * MAX_DEPTH + 'a == 1' + ')' * MAX_DEPTH)
+    with pytest.raises(WhereSyntaxError):
+        parse_where('(' * (MAX_DEPTH + 1) + 'a == 1' + ')' * (MAX_DEPTH + 1))
+    with pytest.raises(WhereSyntaxError):
+        parse_where('a IN ' + '[' * 1000)
+
+
+def test_hostile_input():
+    # Unterminated strings and long attribute names fail without backtracking
+    start = time.monotonic()
+    for where in ('a == "' + 'x' * 100000, 'a' * 100000 + '=', '"' * 100000):
+        with pytest.raises(WhereSyntaxError):
+            parse_where(where)
+    assert time.monotonic() - start < 1
+
+
+def test_memoised():
+    assert parse_where('a == 1') is parse_where('a == 1')